@@ -0,0 +1,82 @@
+"""
+Benchmark de arranque en frío.
+
+Mide en procesos nuevos de Python el tiempo de importar function_app y el de la
+primera respuesta (pending_tasks de un vdom) contra Azurite o la cuenta de
+AZURE_STORAGE_CONNECTION_STRING. Con --ref mide además otra revisión del
+repositorio (en un git worktree temporal) para comparar antes y después.
+
+Uso: python benchmarks/arranque_en_frio.py [--ref REVISION] [--runs N] [--vdom VDOM]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Se ejecuta en un proceso nuevo con el árbol a medir como directorio de trabajo
+CHILD = r"""
+import asyncio, inspect, json, sys, time
+import azure.functions as func  # el worker ya lo tiene cargado: no se mide
+start = time.perf_counter()
+import function_app
+imported = time.perf_counter()
+handler = function_app.pending_tasks
+if hasattr(handler, "_function"):
+    handler = handler._function.get_user_function()
+response = handler(func.HttpRequest("GET", "/api/pending_tasks", params={"vdom": sys.argv[1]}, body=b""))
+if inspect.iscoroutine(response):
+    response = asyncio.run(response)
+done = time.perf_counter()
+print(json.dumps({"import": imported - start, "first_response": done - imported, "status": response.status_code}))
+"""
+
+
+def measure(tree, runs, vdom):
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [tree, os.environ.get("PYTHONPATH")]))}
+    env.setdefault("AZURE_STORAGE_CONNECTION_STRING", "UseDevelopmentStorage=true")
+    samples = []
+    # La primera corrida compila los .pyc y se descarta
+    for _ in range(runs + 1):
+        output = subprocess.run(
+            [sys.executable, "-c", CHILD, vdom], cwd=tree, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return samples[1:]
+
+def report(label, samples):
+    imports = [sample["import"] * 1000 for sample in samples]
+    responses = [sample["first_response"] * 1000 for sample in samples]
+    totals = [a + b for a, b in zip(imports, responses)]
+    print(
+        f"{label:12} import {statistics.median(imports):8.1f} ms  "
+        f"primera respuesta {statistics.median(responses):8.1f} ms  "
+        f"total {statistics.median(totals):8.1f} ms  (mediana de {len(samples)})"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ref", help="revisión con la que comparar (p. ej. un commit anterior)")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--vdom", default="arranque")
+    args = parser.parse_args()
+
+    if args.ref:
+        with tempfile.TemporaryDirectory() as tmp:
+            tree = os.path.join(tmp, "arbol")
+            subprocess.run(["git", "-C", REPO_DIR, "worktree", "add", "--detach", tree, args.ref], check=True,
+                           capture_output=True)
+            try:
+                report(args.ref[:12], measure(tree, args.runs, args.vdom))
+            finally:
+                subprocess.run(["git", "-C", REPO_DIR, "worktree", "remove", "--force", tree], check=False)
+    report("actual", measure(REPO_DIR, args.runs, args.vdom))
+
+
+if __name__ == "__main__":
+    main()
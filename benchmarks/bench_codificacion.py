@@ -0,0 +1,103 @@
+"""
+Benchmark de codificación de listas de tareas.
+
+Compara tamaño, tiempo de codificación y de decodificación del JSON con
+indent=4 que se usaba originalmente, JSON compacto y el formato columnar de
+task_codec (sin comprimir, gzip y zstd si está instalado) con 1k, 10k y 100k tareas.
+Antes verifica que el formato columnar conserve el tipo de cada valor.
+
+Uso: python benchmarks/bench_codificacion.py [cantidad ...]
+"""
+import os
+import sys
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import task_codec  # noqa: E402
+
+ULID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+
+def generate_tasks(count, vdom="vdom_bench", seed=1):
+    """
+    Genera tareas con la misma forma que task_generator + los campos del orquestador.
+    """
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    tasks = []
+    for i in range(count):
+        created_at = start + timedelta(seconds=i * 7)
+        status = rng.choices(["executed", "failed", "pending"], weights=[85, 5, 10])[0]
+        tasks.append({
+            "app": "tsmx-bloqueo-forti",
+            "tid": "".join(rng.choice(ULID_ALPHABET) for _ in range(26)) + f"-{vdom}",
+            "status": status,
+            "created_at": created_at.isoformat(),
+            "updated_at": "" if status == "pending" else (created_at + timedelta(seconds=30)).isoformat(),
+            "vdom": vdom,
+            "service": rng.choice(["ip", "url", "domain", "hash"]),
+            "obj": f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+            "gdr": rng.choice(["GDR-SOC", "GDR-NOC", "GDR-CERT"]),
+            "ticket": f"INC{rng.randint(100000, 999999)}",
+            "action": rng.choice(["block", "unblock"])
+        })
+    return tasks
+
+
+def _timed(function, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def formats():
+    yield "json indent=4", lambda tasks: json.dumps(tasks, ensure_ascii=False, indent=4).encode("utf-8"), task_codec.decode
+    yield "json compacto", lambda tasks: task_codec.encode(tasks, encoding="json", compression="none"), task_codec.decode
+    yield "columnar", lambda tasks: task_codec.encode(tasks, encoding="columnar", compression="none"), task_codec.decode
+    yield "columnar+gzip", lambda tasks: task_codec.encode(tasks, encoding="columnar", compression="gzip"), task_codec.decode
+    if task_codec.zstandard is not None:
+        yield "columnar+zstd", lambda tasks: task_codec.encode(tasks, encoding="columnar", compression="zstd"), task_codec.decode
+
+
+def check_round_trip():
+    """
+    Columnas con bool, int y float mezclados deben volver con el mismo tipo
+    (True == 1 == 1.0 en Python, así que se compara el JSON resultante).
+    """
+    values = [True, 1, 1.0, False, 0, 0.0, None, "1"]
+    tasks = [
+        {"tid": f"t{i}", "gdr": values[i % len(values)], "obj": values[(i * 3) % len(values)], "ticket": 1 if i % 2 else True}
+        for i in range(64)
+    ]
+    for tasks_value in (tasks, {task["tid"]: task for task in tasks}):
+        decoded = task_codec.decode(task_codec.encode(tasks_value, encoding="columnar", compression="none"))
+        assert json.dumps(decoded) == json.dumps(tasks_value), "columnar: cambió el tipo de algún valor"
+    print("OK: el formato columnar conserva bool, int y float")
+
+
+def main(sizes):
+    check_round_trip()
+    print(f"{'tareas':>8} {'formato':<15} {'bytes':>12} {'ratio':>7} {'encode ms':>10} {'decode ms':>10}")
+    for count in sizes:
+        tasks = generate_tasks(count)
+        repeat = 5 if count <= 10000 else 2
+        baseline = None
+        for name, encode, decode in formats():
+            data, encode_seconds = _timed(lambda: encode(tasks), repeat)
+            decoded, decode_seconds = _timed(lambda: decode(data), repeat)
+            assert decoded == tasks, f"{name}: la decodificación no reproduce las tareas"
+            baseline = baseline or len(data)
+            print(f"{count:>8} {name:<15} {len(data):>12} {len(data) / baseline:>7.2f} "
+                  f"{encode_seconds * 1000:>10.1f} {decode_seconds * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
@@ -0,0 +1,176 @@
+"""
+Benchmark y prueba de carga del pipeline de tareas, sin red.
+
+Genera una carga con varios vdoms (de tamaños desiguales) y la hace pasar por
+los handlers de function_app: orquestador crea las tareas, luego get_status,
+update_status y pending_tasks las consultan y actualizan. Corre sobre el
+backend en memoria (o el local con --backend local) y repite todo para cada
+cantidad de tareas, para detectar operaciones que crecen con el tamaño del
+vdom antes de desplegar.
+
+Por operación reporta latencia p50/p95/p99, throughput, y peticiones y bytes
+transferidos contra el almacenamiento.
+
+Uso: python benchmarks/bench_pipeline.py [--tareas 500 2000 8000] [--vdoms 8]
+     [--consultas 1000] [--concurrencia 1] [--backend memoria|local] [--json salida.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TASK_BACKEND", "memoria")
+
+import azure.functions as func  # noqa: E402
+
+import blob_storage  # noqa: E402
+import function_app  # noqa: E402
+from blob_backends import create_container_client  # noqa: E402
+
+SERVICES = ["fortigate", "paloalto", "checkpoint"]
+ACTIONS = ["block", "unblock"]
+
+
+def handler(name):
+    """
+    Retorna la función de usuario de un endpoint, esté o no envuelta por el decorador de la app.
+    """
+    endpoint = getattr(function_app, name)
+    if hasattr(endpoint, "_function"):
+        return endpoint._function.get_user_function()
+    return endpoint
+
+def vdom_weights(vdoms, rng):
+    """
+    Pesos tipo Zipf: pocos vdoms concentran la mayoría de los bloqueos.
+    """
+    weights = [1 / (rank + 1) for rank in range(vdoms)]
+    rng.shuffle(weights)
+    return weights
+
+def generate_blocks(count, vdoms, rng):
+    names = [f"vdom{i:02d}" for i in range(vdoms)]
+    weights = vdom_weights(vdoms, rng)
+    return [
+        {
+            "service": rng.choice(SERVICES),
+            "vdom": rng.choices(names, weights=weights)[0],
+            "obj": f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+            "gdr": f"GDR-{rng.randrange(10000):04d}",
+            "ticket": f"INC{rng.randrange(10 ** 7):07d}",
+            "action": rng.choice(ACTIONS),
+        }
+        for _ in range(count)
+    ]
+
+def percentile(latencies, fraction):
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run_phase(name, requests, concurrency):
+    """
+    Ejecuta `requests` contra el handler `name` con la concurrencia indicada.
+    Retorna las métricas de la fase y las respuestas en el mismo orden.
+    """
+    endpoint = handler(name)
+    container = blob_storage.get_container_client()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = [0.0] * len(requests)
+    responses = [None] * len(requests)
+
+    async def one(position, request):
+        async with semaphore:
+            start = time.perf_counter()
+            responses[position] = await endpoint(request)
+            latencies[position] = time.perf_counter() - start
+
+    container.reset_counters()
+    start = time.perf_counter()
+    await asyncio.gather(*(one(position, request) for position, request in enumerate(requests)))
+    elapsed = time.perf_counter() - start
+    errors = sum(1 for response in responses if response.status_code != 200)
+    return {
+        "operacion": name,
+        "n": len(requests),
+        "errores": errors,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "ops_s": len(requests) / elapsed,
+        "peticiones_op": container.requests / len(requests),
+        "kb_bajados_op": container.bytes_downloaded / len(requests) / 1024,
+        "kb_subidos_op": container.bytes_uploaded / len(requests) / 1024,
+    }, responses
+
+async def run_scale(total_tasks, args):
+    rng = random.Random(total_tasks)
+    blob_storage.container_client = create_container_client(
+        args.backend, tempfile.mkdtemp(prefix="bench-pipeline-") if args.backend == "local" else None
+    )
+    blob_storage.clear_cache()
+    blob_storage._migrated_task_lists.clear()
+
+    blocks = generate_blocks(total_tasks, args.vdoms, rng)
+    created, responses = await run_phase("orquestador", [
+        func.HttpRequest("POST", "/api/orquestador", body=json.dumps(block).encode("utf-8")) for block in blocks
+    ], args.concurrencia)
+    tids = [json.loads(response.get_body())["tid"] for response in responses if response.status_code == 200]
+    queries = min(args.consultas, len(tids))
+
+    status, _ = await run_phase("get_status", [
+        func.HttpRequest("GET", f"/api/get_status/{tid}", route_params={"tid": tid}, body=b"")
+        for tid in rng.sample(tids, queries)
+    ], args.concurrencia)
+    updated, _ = await run_phase("update_status", [
+        func.HttpRequest("GET", "/api/update_status", params={"tid": tid, "status": rng.choice(["executed", "failed"])}, body=b"")
+        for tid in rng.sample(tids, queries)
+    ], args.concurrencia)
+    pending, _ = await run_phase("pending_tasks", [
+        func.HttpRequest("GET", "/api/pending_tasks", params={"vdom": f"vdom{rng.randrange(args.vdoms):02d}"}, body=b"")
+        for _ in range(max(1, queries // 10))
+    ], args.concurrencia)
+    return [dict(result, tareas=total_tasks) for result in (created, status, updated, pending)]
+
+def print_results(results):
+    print(
+        f"{'tareas':>7} {'operacion':14} {'n':>6} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'ops/s':>9} {'pet/op':>7} {'KB baj/op':>10} {'KB sub/op':>10}"
+    )
+    for result in results:
+        print(
+            f"{result['tareas']:>7} {result['operacion']:14} {result['n']:>6} {result['errores']:>4} "
+            f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['ops_s']:>9.1f} "
+            f"{result['peticiones_op']:>7.2f} {result['kb_bajados_op']:>10.2f} {result['kb_subidos_op']:>10.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline de tareas sin red")
+    parser.add_argument("--tareas", type=int, nargs="+", default=[500, 2000, 8000])
+    parser.add_argument("--vdoms", type=int, default=8)
+    parser.add_argument("--consultas", type=int, default=1000)
+    parser.add_argument("--concurrencia", type=int, default=1)
+    parser.add_argument("--backend", choices=["memoria", "local"], default="memoria")
+    parser.add_argument("--json", help="archivo donde guardar los resultados")
+    args = parser.parse_args()
+
+    results = []
+    for total_tasks in args.tareas:
+        # display_item_by_id imprime cada resultado; no se mezcla con el reporte
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results.extend(asyncio.run(run_scale(total_tasks, args)))
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
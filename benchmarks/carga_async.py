@@ -0,0 +1,98 @@
+"""
+Prueba de carga de lecturas: API síncrona vs. blob_storage_async.
+
+Siembra un vdom en Azurite (o en la cuenta de AZURE_STORAGE_CONNECTION_STRING)
+y mide solicitudes por segundo de get_task + load_pending_tasks (una de cada
+diez) con la misma concurrencia de dos formas: la API síncrona en un pool de
+hilos, como ejecuta el worker los handlers síncronos, y blob_storage_async
+sobre un único event loop con el pool de conexiones compartido.
+
+Requiere Azurite en ejecución, por ejemplo: azurite-blob --silent --location /tmp/azurite
+
+Uso: python benchmarks/carga_async.py [solicitudes] [concurrencia] [tareas]
+"""
+import os
+import sys
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("AZURE_STORAGE_CONNECTION_STRING", "UseDevelopmentStorage=true")
+
+import blob_storage  # noqa: E402
+import blob_storage_async  # noqa: E402
+from bench_codificacion import generate_tasks  # noqa: E402
+
+VDOM = "carga"
+TASK_BLOB_NAME = f"bloqueos_{VDOM}.json"
+
+
+def build_requests(tids, total_requests):
+    """
+    Secuencia de lecturas: tids repartidos en orden, con None para listar pendientes.
+    """
+    return [None if i % 10 == 9 else tids[i % len(tids)] for i in range(total_requests)]
+
+def percentile(latencies, fraction):
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def report(label, elapsed, latencies):
+    print(
+        f"{label:6} {len(latencies) / elapsed:9.1f} req/s  "
+        f"p50 {percentile(latencies, 0.50) * 1000:7.2f} ms  "
+        f"p95 {percentile(latencies, 0.95) * 1000:7.2f} ms  "
+        f"p99 {percentile(latencies, 0.99) * 1000:7.2f} ms"
+    )
+
+def run_sync(requests, concurrency):
+    def one(tid):
+        start = time.perf_counter()
+        if tid is None:
+            blob_storage.load_pending_tasks(TASK_BLOB_NAME)
+        else:
+            blob_storage.get_task(tid, TASK_BLOB_NAME)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(one, requests))
+    return time.perf_counter() - start, latencies
+
+async def run_async(requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(tid):
+        async with semaphore:
+            start = time.perf_counter()
+            if tid is None:
+                await blob_storage_async.load_pending_tasks(TASK_BLOB_NAME)
+            else:
+                await blob_storage_async.get_task(tid, TASK_BLOB_NAME)
+            return time.perf_counter() - start
+
+    try:
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(one(tid) for tid in requests))
+        return time.perf_counter() - start, latencies
+    finally:
+        await blob_storage_async.close()
+
+
+def main(total_requests=2000, concurrency=64, total_tasks=500):
+    tasks = generate_tasks(total_tasks, vdom=VDOM)
+    if not blob_storage.get_task(tasks[0]["tid"], TASK_BLOB_NAME):
+        blob_storage.add_tasks(tasks, TASK_BLOB_NAME)
+    requests = build_requests([task["tid"] for task in tasks], total_requests)
+    print(f"{total_requests} lecturas sobre {total_tasks} tareas con concurrencia {concurrency}")
+
+    # Cada modo arranca con la caché vacía: misses iniciales y luego GETs condicionales
+    blob_storage.clear_cache()
+    report("sync", *run_sync(requests, concurrency))
+    blob_storage.clear_cache()
+    report("async", *asyncio.run(run_async(requests, concurrency)))
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:4]))
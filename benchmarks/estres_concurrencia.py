@@ -0,0 +1,207 @@
+"""
+Prueba de estrés de escrituras concurrentes sobre blob_storage.
+
+Lanza muchas llamadas a add_task en paralelo (y luego update_task, compactando
+el registro de eventos en medio) y verifica que ninguna tarea ni cambio de
+estado se pierde, con un límite de bloques por append blob bajo para que los
+segmentos de eventos se llenen y continúen en el siguiente. Luego varios ejecutores reclaman las mismas tareas a la vez
+(claim_tasks) y se verifica que cada tarea tiene un solo ganador, y llegan a la
+vez bloqueos idénticos con distintos tickets (add_task_deduplicated) y se
+verifica que crean una sola tarea con todos los tickets. Por último se
+reclaman y finalizan tareas mientras llegan duplicados que les agregan tickets,
+y se verifica que ninguna se reclama dos veces ni vuelve a pendientes. Usa el backend en memoria salvo que TASK_BACKEND indique otro
+(con TASK_BACKEND=local, por defecto en un directorio temporal).
+
+Uso: python benchmarks/estres_concurrencia.py [tareas] [hilos]
+"""
+import os
+import sys
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TASK_BACKEND", "memoria")
+os.environ.setdefault("TASK_LOCAL_DIR", tempfile.mkdtemp(prefix="estres-"))
+os.environ.setdefault("CONFLICT_BACKOFF_SECONDS", "0.001")
+os.environ.setdefault("CONFLICT_MAX_RETRIES", "50")
+os.environ.setdefault("APPEND_BLOB_MAX_BLOCKS", "64")
+
+import blob_storage  # noqa: E402
+
+TASK_BLOB_NAME = "bloqueos_estres.json"
+CLAIM_BLOB_NAME = "bloqueos_estres-reclamos.json"
+DEDUP_BLOB_NAME = "bloqueos_estres-duplicados.json"
+CLAIM_DEDUP_BLOB_NAME = "bloqueos_estres-reclamos-duplicados.json"
+
+
+def main(total_tasks=200, workers=32):
+    print(f"Backend: {blob_storage.TASK_BACKEND}")
+    tasks = [
+        {"tid": f"{i:026d}-estres", "status": "pending", "created_at": str(i), "vdom": "estres"}
+        for i in range(total_tasks)
+    ]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda task: blob_storage.add_task(task, TASK_BLOB_NAME), tasks))
+    add_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        updates = executor.map(
+            lambda task: blob_storage.update_task({**task, "status": "executed"}, TASK_BLOB_NAME), tasks
+        )
+        # Compactar mientras hay escrituras en curso no debe perder eventos
+        blob_storage.compact_task_log(TASK_BLOB_NAME)
+        list(updates)
+    update_elapsed = time.perf_counter() - start
+
+    stored = blob_storage.load_all_tasks(TASK_BLOB_NAME)
+    stored_tids = {task["tid"] for task in stored}
+    missing = [task["tid"] for task in tasks if task["tid"] not in stored_tids]
+    not_updated = [task["tid"] for task in stored if task["status"] != "executed"]
+    index = blob_storage._load_index(TASK_BLOB_NAME)
+    stale_index = [tid for tid, entry in index.items() if entry["status"] != "executed"]
+    still_pending = blob_storage.load_pending_tasks(TASK_BLOB_NAME)
+    segments = [
+        blob.name for blob in blob_storage.get_container_client().list_blobs(
+            name_starts_with=blob_storage._events_prefix(TASK_BLOB_NAME)
+        )
+    ]
+
+    print(f"add_task:    {total_tasks} tareas con {workers} hilos en {add_elapsed:.2f}s")
+    print(f"update_task: {total_tasks} tareas con {workers} hilos en {update_elapsed:.2f}s")
+    assert not missing, f"Se perdieron {len(missing)} tareas: {missing[:5]}"
+    assert not not_updated, f"{len(not_updated)} tareas sin actualizar: {not_updated[:5]}"
+    assert len(index) == total_tasks and not stale_index, f"Índice inconsistente: {stale_index[:5]}"
+    assert not still_pending, f"{len(still_pending)} tareas siguen en el índice de pendientes"
+    assert len(segments) > 1, f"Los eventos no continuaron en otro segmento: {segments}"
+    print(f"OK: no se perdieron tareas ni actualizaciones ({len(segments)} segmentos de eventos)")
+    check_claims(total_tasks, workers)
+    check_deduplication(total_tasks, workers)
+    check_claims_with_merges(total_tasks, workers)
+
+
+def check_claims(total_tasks, workers):
+    """
+    Cada tarea se crea sola y `workers` ejecutores la reclaman a la vez: debe
+    haber exactamente un ganador por tarea.
+    """
+    start = time.perf_counter()
+    rounds = max(total_tasks // 10, 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for i in range(rounds):
+            tid = f"{i:026d}-estres-reclamos"
+            blob_storage.add_task(
+                {"tid": tid, "status": "pending", "created_at": str(i), "vdom": "estres-reclamos"}, CLAIM_BLOB_NAME
+            )
+            barrier = threading.Barrier(workers)
+
+            def claim(owner):
+                barrier.wait()
+                return blob_storage.claim_tasks(CLAIM_BLOB_NAME, f"ejecutor-{owner}")
+
+            winners = [claimed for claimed in executor.map(claim, range(workers)) if claimed]
+            assert len(winners) == 1, f"{tid}: {len(winners)} ejecutores reclamaron la tarea"
+            assert winners[0][0]["tid"] == tid, f"Se reclamó {winners[0][0]['tid']} en lugar de {tid}"
+            record = blob_storage.get_task(tid, CLAIM_BLOB_NAME)
+            assert record["claimed_by"] == winners[0][0]["claimed_by"], f"{tid}: el registro no coincide con el ganador"
+    print(f"claim_tasks: {rounds} tareas reclamadas por {workers} ejecutores a la vez en {time.perf_counter() - start:.2f}s")
+    print("OK: cada tarea tuvo un solo ganador")
+
+
+def check_deduplication(total_tasks, workers):
+    """
+    `workers` bloqueos idénticos (distinto ticket) llegan a la vez: debe crearse
+    una sola tarea, y su registro y su entrada de pendientes deben tener todos los tickets.
+    """
+    start = time.perf_counter()
+    rounds = max(total_tasks // 10, 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for i in range(rounds):
+            barrier = threading.Barrier(workers)
+
+            def block(worker):
+                task = {
+                    "tid": f"{i:020d}{worker:06d}-estres-duplicados", "status": "pending", "created_at": str(i),
+                    "vdom": "estres-duplicados", "service": "svc", "obj": f"10.0.0.{i}", "action": "block",
+                    "ticket": f"T{i}-{worker}"
+                }
+                barrier.wait()
+                return blob_storage.add_task_deduplicated(task, DEDUP_BLOB_NAME)
+
+            results = list(executor.map(block, range(workers)))
+            created = [task["tid"] for task, is_new in results if is_new]
+            assert len(created) == 1, f"Ronda {i}: {len(created)} tareas creadas para el mismo bloqueo"
+            expected = {f"T{i}-{worker}" for worker in range(workers)}
+            record = blob_storage.get_task(created[0], DEDUP_BLOB_NAME)
+            assert set(record["tickets"]) == expected, f"Ronda {i}: faltan tickets en el registro"
+            pending = {task["tid"]: task for task in blob_storage.load_pending_tasks(DEDUP_BLOB_NAME)}
+            assert set(pending[created[0]]["tickets"]) == expected, f"Ronda {i}: faltan tickets en pendientes"
+    print(f"add_task_deduplicated: {rounds} bloqueos repetidos por {workers} hilos a la vez en {time.perf_counter() - start:.2f}s")
+    print("OK: cada bloqueo creó una sola tarea con todos sus tickets")
+
+
+def check_claims_with_merges(total_tasks, workers):
+    """
+    La mitad de los hilos envía bloqueos repetidos (add_task_deduplicated, que
+    agrega tickets a la tarea abierta y sincroniza pendientes) y la otra mitad
+    reclama y finaliza tareas a la vez: ninguna tarea debe reclamarse dos veces,
+    ninguna finalizada debe volver a pendientes y ningún ticket debe perderse.
+    """
+    start = time.perf_counter()
+    keys = max(total_tasks // 10, 1)
+    senders = max(workers // 2, 1)
+    claims = {}
+    claims_lock = threading.Lock()
+    sending = threading.Event()
+    sending.set()
+
+    def send(worker):
+        for i in range(keys):
+            blob_storage.add_task_deduplicated({
+                "tid": f"{i:020d}{worker:06d}-estres-reclamos-duplicados", "status": "pending", "created_at": str(i),
+                "vdom": "estres-reclamos-duplicados", "service": "svc", "obj": f"10.1.0.{i}", "action": "block",
+                "ticket": f"R{i}-{worker}"
+            }, CLAIM_DEDUP_BLOB_NAME)
+
+    def work(owner):
+        while True:
+            claimed = blob_storage.claim_tasks(CLAIM_DEDUP_BLOB_NAME, f"ejecutor-{owner}")
+            if not claimed:
+                if not sending.is_set():
+                    return
+                time.sleep(0.001)
+                continue
+            for task in claimed:
+                with claims_lock:
+                    claims.setdefault(task["tid"], []).append(task["claimed_by"])
+                finished = blob_storage.complete_claim(task["tid"], task["claimed_by"], "executed", CLAIM_DEDUP_BLOB_NAME)
+                assert finished is not None, f"{task['tid']}: {task['claimed_by']} perdió su reclamo"
+
+    with ThreadPoolExecutor(max_workers=senders + workers) as executor:
+        executors = [executor.submit(work, owner) for owner in range(workers)]
+        list(executor.map(send, range(senders)))
+        sending.clear()
+        for future in executors:
+            future.result()
+
+    twice = {tid: owners for tid, owners in claims.items() if len(owners) > 1}
+    assert not twice, f"{len(twice)} tareas reclamadas más de una vez: {list(twice.items())[:3]}"
+    records = blob_storage.load_all_tasks(CLAIM_DEDUP_BLOB_NAME)
+    unfinished = [task["tid"] for task in records if task["status"] != "executed"]
+    assert not unfinished, f"{len(unfinished)} tareas sin finalizar: {unfinished[:5]}"
+    reoffered = blob_storage.load_pending_tasks(CLAIM_DEDUP_BLOB_NAME)
+    assert not reoffered, f"{len(reoffered)} tareas finalizadas siguen en pendientes: {reoffered[:3]}"
+    tickets = {ticket for task in records for ticket in task.get("tickets") or [task.get("ticket")]}
+    expected = {f"R{i}-{worker}" for i in range(keys) for worker in range(senders)}
+    assert tickets == expected, f"Se perdieron {len(expected - tickets)} tickets"
+    print(f"claim_tasks + add_task_deduplicated: {len(claims)} tareas reclamadas por {workers} ejecutores mientras "
+          f"{senders} hilos enviaban duplicados en {time.perf_counter() - start:.2f}s")
+    print("OK: ninguna tarea se reclamó dos veces ni volvió a pendientes")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
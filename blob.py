@@ -1,7 +1,6 @@
 import os
 import json
 import logging
-from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from azure.storage.blob import BlobServiceClient
 
@@ -29,8 +28,8 @@ except Exception as e:
 
 # Nombre del blob que contendrá la lista de tareas
 TASKS_BLOB_NAME = "list_of_tasks_in_progress.json"
-# Nombre del blob de bloqueo
-LOCK_BLOB_NAME = "function_lock.json"
+# Clave del bloqueo que protege la caché de estados finales; ver blob_locks
+FINAL_STATUS_LOCK_KEY = "final_status_cache"
 
 def load_all_tasks():
     """
@@ -108,82 +107,51 @@ def update_task(updated_task):
             break
     save_all_tasks(tasks)
 
-# Funciones para el bloqueo usando Blob Locking
-def acquire_lock():
+# Funciones para el bloqueo: delegan en el gestor de leases de blob_locks
+# (shards por clave, expiración y fencing token) en lugar de function_lock.json.
+def acquire_lock(key=FINAL_STATUS_LOCK_KEY):
     """
-    Intenta adquirir el bloqueo mediante la creación de un blob exclusivo.
+    Intenta adquirir el bloqueo de `key`.
     Retorna True si se adquiere el lock, False de lo contrario.
     """
-    blob_client = container_client.get_blob_client(LOCK_BLOB_NAME)
-    try:
-        # Se intenta crear el blob sin sobreescribir (overwrite=False)
-        blob_client.upload_blob(json.dumps({"locked": True, "timestamp": str(datetime.utcnow())}), overwrite=False)
-        return True
-    except Exception:
-        # Si ya existe, se asume que otro proceso tiene el lock.
-        return False
+    from blob_storage import acquire_lock as _acquire_lock
+    return _acquire_lock(key)
 
-def release_lock():
+def release_lock(key=FINAL_STATUS_LOCK_KEY):
     """
-    Libera el bloqueo eliminando el blob de lock.
+    Libera el bloqueo de `key`.
     """
-    blob_client = container_client.get_blob_client(LOCK_BLOB_NAME)
-    try:
-        blob_client.delete_blob()
-    except Exception as e:
-        logging.warning(f"Error liberando lock: {e}")
-        
-        
-
-# Nuevo blob para cache de estados finales
-FINAL_STATUS_BLOB_NAME = "final_status_cache.json"
+    from blob_storage import release_lock as _release_lock
+    _release_lock(key)
 
+# Caché de estados finales: delega en task_status_cache (shards por hash del
+# tid con escrituras condicionales y nivel en proceso con TTL), que es la que
+# consulta get_status. Se mantienen estas funciones por compatibilidad.
 def load_final_status_cache():
-    """Carga la caché de estados finales desde Blob Storage.
-        Si el archivo no existe o falla, retorna un diccionario vacío.
+    """Carga las entradas vigentes de la caché de estados finales (tid -> {status, hasta}).
     """
-    blob_client = container_client.get_blob_client(FINAL_STATUS_BLOB_NAME)
-    try:
-        cache_json = blob_client.download_blob().readall().decode("utf-8")
-        return json.loads(cache_json)
-    except Exception as e:
-        logging.warning(f"Cache vacía o error al cargar {FINAL_STATUS_BLOB_NAME}: {e}")
-        return {}
+    import task_status_cache
+    return task_status_cache.load_final_statuses()
 
 def save_final_status_cache(cache):
-    """Guarda la caché de estados finales en Blob Storage."""
-    blob_client = container_client.get_blob_client(FINAL_STATUS_BLOB_NAME)
-    blob_client.upload_blob(json.dumps(cache, ensure_ascii=False, indent=4), overwrite=True)
+    """Guarda en la caché de estados finales las entradas tid -> {"status": ...} recibidas."""
+    import task_status_cache
+    task_status_cache.record_final_statuses({tid: entry.get("status") for tid, entry in cache.items()})
 
 def actualizar_cache_final(tid, status, cliente):
     """Actualiza la caché de estados finales con el estado final de la tarea.
-        Se establece una expiración de 30 minutos.
-    """
-    from datetime import datetime, timedelta
-    if acquire_lock():
-        try:
-            cache = load_final_status_cache()
-            cache[tid] = {
-                "status": status,
-                "cliente": cliente,
-                "timestamp": datetime.utcnow().isoformat(),
-                "expiration": (datetime.utcnow() + timedelta(minutes=30)).isoformat()
-            }
-            save_final_status_cache(cache)
-        finally:
-            release_lock()
+        La expiración es FINAL_STATUS_TTL_SECONDS (30 minutos por defecto); `cliente` ya no se usa.
+    """
+    import task_status_cache
+    task_status_cache.record_final_statuses({tid: status})
 
 def limpiar_cache_expirada():
-    """Limpia las entradas expiradas de la caché de estados finales.
-        Esta función puede ser llamada periódicamente (por ejemplo, mediante un Timer Trigger).
-    """
-    from datetime import datetime
-    cache = load_final_status_cache()
-    now = datetime.utcnow()
-    cache_actualizada = {k: v for k, v in cache.items() if datetime.fromisoformat(v["expiration"]) > now}
-    if len(cache) != len(cache_actualizada):
-        save_final_status_cache(cache_actualizada)
-        
+    """Limpia las entradas expiradas de la caché de estados finales, reescribiendo sólo los shards que las tienen.
+        Se ejecuta junto con el Timer Trigger retencion_tareas.
+    """
+    import task_status_cache
+    task_status_cache.purge_expired()
+
 
 if __name__ == "__main__":
     release_lock()
\ No newline at end of file
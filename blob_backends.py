@@ -0,0 +1,523 @@
+"""
+Backends de almacenamiento intercambiables para blob_storage.
+
+Toda la lógica de tareas (registros, índice con registro de eventos, índice de
+pendientes, caché con ETag, bloqueos) se apoya en un subconjunto pequeño de la
+API de azure.storage.blob.ContainerClient, descrito por ContainerBackend y
+BlobBackend. Además del ContainerClient de Azure hay dos implementaciones:
+
+- MemoryContainerClient: blobs en memoria del proceso. Sirve para despliegues de
+  un solo nodo, pruebas de carga y benchmarks sin cuenta de Storage.
+- LocalContainerClient: un archivo por blob bajo un directorio. Las escrituras
+  completas usan un archivo temporal + rename atómico, de modo que un lector
+  nunca ve un blob a medio escribir y lo lee con mmap desde su descriptor.
+
+El backend se elige con TASK_BACKEND=azure|memoria|local (ver blob_storage).
+"""
+import os
+import mmap
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Iterable, Optional, Protocol
+
+from azure.core import MatchConditions
+from azure.core.exceptions import (
+    HttpResponseError, ResourceExistsError, ResourceModifiedError, ResourceNotFoundError, ResourceNotModifiedError
+)
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+CHUNK_SIZE = 4 * 1024 * 1024
+# Bloques que admite un append blob (límite de Azure); configurable para pruebas
+APPEND_BLOB_MAX_BLOCKS = int(os.getenv("APPEND_BLOB_MAX_BLOCKS", "50000"))
+# Archivos auxiliares del backend local que no son blobs
+LOCAL_LOCK_FILE = ".bloqueo"
+LOCAL_TMP_PREFIX = ".tmp-"
+
+
+class BlobBackend(Protocol):
+    """
+    Operaciones sobre un blob que usa blob_storage (subconjunto de BlobClient).
+    """
+
+    def exists(self) -> bool: ...
+
+    def get_blob_properties(self): ...
+
+    def download_blob(self, offset=None, length=None, etag=None, match_condition=None, **kwargs): ...
+
+    def upload_blob(self, data, overwrite=False, etag=None, match_condition=None, **kwargs) -> dict: ...
+
+    def create_append_blob(self, etag=None, match_condition=None, **kwargs) -> dict: ...
+
+    def append_block(self, data, **kwargs) -> dict: ...
+
+    def delete_blob(self, etag=None, match_condition=None, **kwargs) -> None: ...
+
+
+class ContainerBackend(Protocol):
+    """
+    Operaciones sobre el contenedor que usa blob_storage (subconjunto de ContainerClient).
+    """
+
+    def create_container(self): ...
+
+    def get_blob_client(self, blob: str) -> BlobBackend: ...
+
+    def list_blobs(self, name_starts_with: Optional[str] = None) -> Iterable: ...
+
+    def walk_blobs(self, name_starts_with: Optional[str] = None, delimiter: str = "/") -> Iterable: ...
+
+
+class _Downloader:
+    def __init__(self, data, properties):
+        self._data = data
+        self.size = len(data)
+        self.properties = properties
+
+    def readall(self):
+        return self._data
+
+    def chunks(self):
+        for i in range(0, len(self._data), CHUNK_SIZE):
+            yield self._data[i:i + CHUNK_SIZE]
+
+
+def _block_count_exceeded(blob_name):
+    """
+    El error que da Azure al agregar un bloque a un append blob lleno.
+    """
+    error = HttpResponseError(message=f"El append blob {blob_name} alcanzó {APPEND_BLOB_MAX_BLOCKS} bloques")
+    error.error_code = "BlockCountExceedsLimit"
+    return error
+
+
+def _check(current_etag, etag, match_condition):
+    """
+    Evalúa una condición de ETag contra el estado actual del blob (None si no existe).
+    """
+    if match_condition == MatchConditions.IfNotModified and (current_etag is None or current_etag != etag):
+        raise ResourceModifiedError("La condición If-Match no se cumple")
+    if match_condition == MatchConditions.IfModified and current_etag is not None and current_etag == etag:
+        raise ResourceNotModifiedError("Not Modified")
+    if match_condition == MatchConditions.IfMissing and current_etag is not None:
+        raise ResourceExistsError("El blob ya existe")
+    if match_condition == MatchConditions.IfPresent and current_etag is None:
+        raise ResourceNotFoundError("El blob no existe")
+
+
+class _ContainerBase:
+    """
+    Contadores de peticiones y bytes transferidos, y listado jerárquico sobre list_blobs.
+    """
+
+    def __init__(self):
+        self._counter_lock = threading.Lock()
+        self.requests = 0
+        self.bytes_downloaded = 0
+        self.bytes_uploaded = 0
+
+    def _count(self, downloaded=0, uploaded=0, requests=1):
+        with self._counter_lock:
+            self.requests += requests
+            self.bytes_downloaded += downloaded
+            self.bytes_uploaded += uploaded
+
+    def reset_counters(self):
+        with self._counter_lock:
+            self.requests = 0
+            self.bytes_downloaded = 0
+            self.bytes_uploaded = 0
+
+    def walk_blobs(self, name_starts_with=None, delimiter="/"):
+        """
+        Lista un nivel jerárquico: los blobs directos y los prefijos ("directorios")
+        bajo `name_starts_with`, como ContainerClient.walk_blobs.
+        """
+        prefix = name_starts_with or ""
+        items = {}
+        for blob in self.list_blobs(name_starts_with=prefix):
+            rest = blob.name[len(prefix):]
+            if delimiter in rest:
+                name = prefix + rest.split(delimiter, 1)[0] + delimiter
+                items.setdefault(name, SimpleNamespace(name=name, prefix=name))
+            else:
+                items[blob.name] = blob
+        return [items[name] for name in sorted(items)]
+
+
+# ----------------------------
+# Backend en memoria
+# ----------------------------
+class _MemoryBlob:
+    def __init__(self, data):
+        self.data = bytes(data)
+        self.blocks = 0
+        self.touch()
+
+    def touch(self):
+        self.etag = f'"{uuid.uuid4().hex}"'
+        self.last_modified = datetime.now(timezone.utc)
+
+    def properties(self, name):
+        return SimpleNamespace(name=name, size=len(self.data), etag=self.etag, last_modified=self.last_modified)
+
+
+class MemoryContainerClient(_ContainerBase):
+    """
+    Contenedor de blobs en memoria, seguro entre hilos.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._blobs = {}
+        self._lock = threading.Lock()
+
+    def create_container(self):
+        raise ResourceExistsError("El contenedor ya existe")
+
+    def get_blob_client(self, blob):
+        return MemoryBlobClient(self, blob)
+
+    def list_blobs(self, name_starts_with=None):
+        self._count()
+        with self._lock:
+            return [
+                self._blobs[name].properties(name)
+                for name in sorted(self._blobs)
+                if not name_starts_with or name.startswith(name_starts_with)
+            ]
+
+
+class MemoryBlobClient:
+    def __init__(self, container, blob_name):
+        self._container = container
+        self.blob_name = blob_name
+
+    def _blob(self, required=True):
+        blob = self._container._blobs.get(self.blob_name)
+        if blob is None and required:
+            raise ResourceNotFoundError(f"El blob {self.blob_name} no existe")
+        return blob
+
+    def exists(self):
+        self._container._count()
+        with self._container._lock:
+            return self._blob(required=False) is not None
+
+    def get_blob_properties(self):
+        self._container._count()
+        with self._container._lock:
+            return self._blob().properties(self.blob_name)
+
+    def download_blob(self, offset=None, length=None, etag=None, match_condition=None, **kwargs):
+        self._container._count()
+        with self._container._lock:
+            blob = self._blob()
+            _check(blob.etag, etag, match_condition)
+            start = offset or 0
+            end = len(blob.data) if length is None else start + length
+            data = blob.data[start:end]
+            properties = blob.properties(self.blob_name)
+        self._container._count(downloaded=len(data), requests=0)
+        return _Downloader(data, properties)
+
+    def upload_blob(self, data, overwrite=False, etag=None, match_condition=None, **kwargs):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._container._count()
+        with self._container._lock:
+            blob = self._blob(required=False)
+            if blob is not None and not overwrite and match_condition is None:
+                raise ResourceExistsError(f"El blob {self.blob_name} ya existe")
+            _check(blob and blob.etag, etag, match_condition)
+            blob = self._container._blobs[self.blob_name] = _MemoryBlob(data)
+        self._container._count(uploaded=len(data), requests=0)
+        return {"etag": blob.etag, "last_modified": blob.last_modified}
+
+    def create_append_blob(self, etag=None, match_condition=None, **kwargs):
+        self._container._count()
+        with self._container._lock:
+            blob = self._blob(required=False)
+            _check(blob and blob.etag, etag, match_condition)
+            blob = self._container._blobs[self.blob_name] = _MemoryBlob(b"")
+        return {"etag": blob.etag, "last_modified": blob.last_modified}
+
+    def append_block(self, data, **kwargs):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._container._count()
+        with self._container._lock:
+            blob = self._blob()
+            if blob.blocks >= APPEND_BLOB_MAX_BLOCKS:
+                raise _block_count_exceeded(self.blob_name)
+            offset = len(blob.data)
+            blob.data += data
+            blob.blocks += 1
+            blob.touch()
+        self._container._count(uploaded=len(data), requests=0)
+        return {"etag": blob.etag, "blob_append_offset": str(offset), "blob_committed_block_count": blob.blocks}
+
+    def delete_blob(self, etag=None, match_condition=None, **kwargs):
+        self._container._count()
+        with self._container._lock:
+            _check(self._blob().etag, etag, match_condition)
+            del self._container._blobs[self.blob_name]
+
+
+# ----------------------------
+# Backend de archivos locales
+# ----------------------------
+# Cada archivo empieza con una cabecera de tamaño fijo con la generación (uuid)
+# de su última escritura completa. El ETag es generación + tamaño: cambia con
+# cada reemplazo y con cada append, sin depender de la resolución de mtime ni de
+# la reutilización de inodos. Los bloques agregados a un append blob se cuentan
+# en un archivo oculto .{nombre}.bloques junto con la generación a la que
+# corresponden, así un reemplazo reinicia la cuenta sin tocarlo.
+LOCAL_HEADER_SIZE = 33
+LOCAL_BLOCKS_SUFFIX = ".bloques"
+
+
+class _LocalState:
+    def __init__(self, file):
+        stat = os.fstat(file.fileno())
+        file.seek(0)
+        self.generation = file.read(LOCAL_HEADER_SIZE)[:32].decode("ascii")
+        self.size = stat.st_size - LOCAL_HEADER_SIZE
+        self.etag = f'"{self.generation}-{self.size:x}"'
+        self.last_modified = datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+
+    def properties(self, name):
+        return SimpleNamespace(name=name, size=self.size, etag=self.etag, last_modified=self.last_modified)
+
+
+class LocalContainerClient(_ContainerBase):
+    """
+    Contenedor de blobs sobre un directorio local: el blob "a/b.json" es el
+    archivo {root}/a/b.json. Las escrituras se serializan con un lock del
+    proceso y, donde existe fcntl, con un flock sobre {root}/.bloqueo para que
+    varios procesos del mismo nodo compartan el directorio. Las lecturas no
+    toman el lock: el ETag y el contenido salen del mismo descriptor abierto.
+    """
+
+    def __init__(self, root):
+        super().__init__()
+        self.root = os.path.abspath(root)
+        self._lock = threading.Lock()
+
+    def create_container(self):
+        os.makedirs(self.root, exist_ok=True)
+
+    def get_blob_client(self, blob):
+        return LocalBlobClient(self, blob)
+
+    def _path(self, blob_name):
+        parts = blob_name.split("/")
+        if any(part in ("", ".", "..") or part.startswith(".") for part in parts):
+            raise ValueError(f"Nombre de blob inválido para el backend local: {blob_name!r}")
+        return os.path.join(self.root, *parts)
+
+    def _exclusive(self):
+        return _LocalLock(self)
+
+    def list_blobs(self, name_starts_with=None):
+        self._count()
+        prefix = name_starts_with or ""
+        # Sólo se recorre el directorio más profundo que contiene el prefijo
+        base = os.path.join(self.root, *prefix.split("/")[:-1])
+        blobs = []
+        for directory, subdirectories, files in os.walk(base):
+            subdirectories[:] = sorted(name for name in subdirectories if not name.startswith("."))
+            for file_name in files:
+                if file_name.startswith("."):
+                    continue
+                path = os.path.join(directory, file_name)
+                name = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if not name.startswith(prefix):
+                    continue
+                try:
+                    with open(path, "rb") as file:
+                        blobs.append(_LocalState(file).properties(name))
+                except FileNotFoundError:
+                    continue
+        return sorted(blobs, key=lambda blob: blob.name)
+
+
+class _LocalLock:
+    def __init__(self, container):
+        self._container = container
+        self._file = None
+
+    def __enter__(self):
+        self._container._lock.acquire()
+        if fcntl is not None:
+            os.makedirs(self._container.root, exist_ok=True)
+            self._file = open(os.path.join(self._container.root, LOCAL_LOCK_FILE), "a")
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+        self._container._lock.release()
+
+
+class LocalBlobClient:
+    def __init__(self, container, blob_name):
+        self._container = container
+        self.blob_name = blob_name
+        self._path = container._path(blob_name)
+        directory, file_name = os.path.split(self._path)
+        self._blocks_path = os.path.join(directory, f".{file_name}{LOCAL_BLOCKS_SUFFIX}")
+
+    def _state(self):
+        try:
+            with open(self._path, "rb") as file:
+                return _LocalState(file)
+        except FileNotFoundError:
+            return None
+
+    def _current_etag(self):
+        state = self._state()
+        return None if state is None else state.etag
+
+    def exists(self):
+        self._container._count()
+        return self._state() is not None
+
+    def get_blob_properties(self):
+        self._container._count()
+        state = self._state()
+        if state is None:
+            raise ResourceNotFoundError(f"El blob {self.blob_name} no existe")
+        return state.properties(self.blob_name)
+
+    def download_blob(self, offset=None, length=None, etag=None, match_condition=None, **kwargs):
+        self._container._count()
+        try:
+            file = open(self._path, "rb")
+        except FileNotFoundError:
+            raise ResourceNotFoundError(f"El blob {self.blob_name} no existe")
+        with file:
+            # Aunque otro proceso reemplace el archivo, el descriptor abierto sigue
+            # apuntando a la versión leída: ETag y contenido son consistentes.
+            state = _LocalState(file)
+            _check(state.etag, etag, match_condition)
+            start = offset or 0
+            end = state.size if length is None else min(state.size, start + length)
+            if end <= start:
+                data = b""
+            else:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    data = mapped[LOCAL_HEADER_SIZE + start:LOCAL_HEADER_SIZE + end]
+        self._container._count(downloaded=len(data), requests=0)
+        return _Downloader(data, state.properties(self.blob_name))
+
+    def _replace(self, data):
+        """
+        Escribe el blob completo (con una generación nueva) en un temporal del
+        mismo directorio y lo renombra sobre el destino, de forma atómica.
+        """
+        directory = os.path.dirname(self._path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=LOCAL_TMP_PREFIX)
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(f"{uuid.uuid4().hex}\n".encode("ascii"))
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, self._path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return self._state()
+
+    def upload_blob(self, data, overwrite=False, etag=None, match_condition=None, **kwargs):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._container._count()
+        with self._container._exclusive():
+            current = self._current_etag()
+            if current is not None and not overwrite and match_condition is None:
+                raise ResourceExistsError(f"El blob {self.blob_name} ya existe")
+            _check(current, etag, match_condition)
+            state = self._replace(data)
+        self._container._count(uploaded=len(data), requests=0)
+        return {"etag": state.etag, "last_modified": state.last_modified}
+
+    def create_append_blob(self, etag=None, match_condition=None, **kwargs):
+        self._container._count()
+        with self._container._exclusive():
+            _check(self._current_etag(), etag, match_condition)
+            state = self._replace(b"")
+        return {"etag": state.etag, "last_modified": state.last_modified}
+
+    def append_block(self, data, **kwargs):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._container._count()
+        with self._container._exclusive():
+            state = self._state()
+            if state is None:
+                raise ResourceNotFoundError(f"El blob {self.blob_name} no existe")
+            blocks = self._blocks(state.generation)
+            if blocks >= APPEND_BLOB_MAX_BLOCKS:
+                raise _block_count_exceeded(self.blob_name)
+            # Los appends extienden el archivo en su lugar: los bytes ya escritos no cambian
+            with open(self._path, "ab") as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+            with open(self._blocks_path, "w") as file:
+                file.write(f"{state.generation} {blocks + 1}")
+            etag = self._current_etag()
+        self._container._count(uploaded=len(data), requests=0)
+        return {"etag": etag, "blob_append_offset": str(state.size), "blob_committed_block_count": blocks + 1}
+
+    def _blocks(self, generation):
+        """
+        Bloques agregados a la generación actual del archivo (0 si no hay cuenta
+        o si es de una generación anterior).
+        """
+        try:
+            with open(self._blocks_path) as file:
+                counted_generation, _, blocks = file.read().partition(" ")
+        except FileNotFoundError:
+            return 0
+        return int(blocks) if counted_generation == generation and blocks.isdigit() else 0
+
+    def delete_blob(self, etag=None, match_condition=None, **kwargs):
+        self._container._count()
+        with self._container._exclusive():
+            current = self._current_etag()
+            if current is None:
+                raise ResourceNotFoundError(f"El blob {self.blob_name} no existe")
+            _check(current, etag, match_condition)
+            os.remove(self._path)
+            try:
+                os.remove(self._blocks_path)
+            except FileNotFoundError:
+                pass
+
+
+def create_container_client(backend, local_dir=None):
+    """
+    Crea el contenedor del backend indicado: "memoria" o "local" (en `local_dir`).
+    El backend "azure" lo crea blob_storage a partir de la cadena de conexión.
+    """
+    if backend == "memoria":
+        return MemoryContainerClient()
+    if backend == "local":
+        if not local_dir:
+            raise ValueError("El backend local requiere un directorio (TASK_LOCAL_DIR)")
+        return LocalContainerClient(local_dir)
+    raise ValueError(f"Backend de almacenamiento desconocido: {backend!r} (azure, memoria o local)")
@@ -0,0 +1,174 @@
+import os
+import json
+import logging
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError
+
+import blob_storage
+import task_metrics
+
+# Cada clave de bloqueo es un shard independiente: locks/{clave}.json
+LOCKS_PREFIX = "locks/"
+# Duración por defecto del lease y espera máxima para adquirirlo
+LOCK_LEASE_SECONDS = float(os.getenv("LOCK_LEASE_SECONDS", "30"))
+LOCK_WAIT_SECONDS = float(os.getenv("LOCK_WAIT_SECONDS", "10"))
+LOCK_POLL_SECONDS = float(os.getenv("LOCK_POLL_SECONDS", "0.1"))
+LOCK_POLL_MAX_SECONDS = float(os.getenv("LOCK_POLL_MAX_SECONDS", "1"))
+
+
+class LockTimeoutError(TimeoutError):
+    """No se pudo adquirir el bloqueo dentro del tiempo de espera."""
+
+
+class LockLostError(RuntimeError):
+    """El lease expiró o fue tomado por otro dueño."""
+
+
+class Lease:
+    """
+    Lease adquirido sobre una clave. `token` es un fencing token monótono por
+    clave: cada nueva adquisición lo incrementa. renew es condicional, así que un
+    dueño anterior cuyo lease expiró y fue tomado recibe LockLostError al renovar.
+    """
+
+    def __init__(self, key, owner, token, expires_at, etag):
+        self.key = key
+        self.owner = owner
+        self.token = token
+        self.expires_at = expires_at
+        self.etag = etag
+
+    @property
+    def expired(self):
+        return time.time() >= self.expires_at
+
+    def __repr__(self):
+        return f"Lease(key={self.key!r}, owner={self.owner!r}, token={self.token}, expires_at={self.expires_at})"
+
+
+def _lock_blob_name(key):
+    return f"{LOCKS_PREFIX}{key}.json"
+
+def _write_state(key, state, etag):
+    """
+    Escribe el estado del bloqueo condicionado al ETag leído (o a que no exista).
+    Retorna el nuevo ETag, o None si otro proceso escribió antes.
+    """
+    blob_client = blob_storage.get_container_client().get_blob_client(_lock_blob_name(key))
+    data = json.dumps(state)
+    try:
+        if etag is None:
+            result = blob_client.upload_blob(data, overwrite=False)
+        else:
+            result = blob_client.upload_blob(data, overwrite=True, etag=etag, match_condition=MatchConditions.IfNotModified)
+    except (ResourceModifiedError, ResourceExistsError):
+        return None
+    return result["etag"]
+
+def _is_free(state, now):
+    return state is None or state.get("released") or state.get("expires_at", 0) <= now
+
+def try_acquire(key, lease_seconds=None, owner=None):
+    """
+    Intenta adquirir el bloqueo una sola vez. Retorna un Lease o None si está tomado.
+    """
+    lease_seconds = LOCK_LEASE_SECONDS if lease_seconds is None else lease_seconds
+    owner = owner or uuid.uuid4().hex
+    state, etag = blob_storage._read_json_with_etag(_lock_blob_name(key))
+    now = time.time()
+    if not _is_free(state, now):
+        return None
+    token = (state or {}).get("token", 0) + 1
+    new_state = {
+        "owner": owner,
+        "token": token,
+        "expires_at": now + lease_seconds,
+        "acquired_at": datetime.now(timezone.utc).isoformat(),
+        "released": False
+    }
+    new_etag = _write_state(key, new_state, etag)
+    if new_etag is None:
+        return None
+    return Lease(key, owner, token, new_state["expires_at"], new_etag)
+
+def acquire(key, lease_seconds=None, wait_seconds=None, owner=None):
+    """
+    Adquiere el bloqueo de `key` esperando como máximo `wait_seconds` con
+    backoff exponencial y jitter. Si el dueño actual dejó expirar su lease, el
+    bloqueo se toma igualmente. Retorna un Lease o None si se agotó la espera.
+    """
+    wait_seconds = LOCK_WAIT_SECONDS if wait_seconds is None else wait_seconds
+    deadline = time.monotonic() + wait_seconds
+    attempt = 0
+    while True:
+        lease = try_acquire(key, lease_seconds=lease_seconds, owner=owner)
+        if lease is not None:
+            return lease
+        task_metrics.count("bloqueos.ocupado")
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        ceiling = min(LOCK_POLL_MAX_SECONDS, LOCK_POLL_SECONDS * (2 ** attempt))
+        time.sleep(min(remaining, random.uniform(0, ceiling)))
+        attempt += 1
+
+def renew(lease, lease_seconds=None):
+    """
+    Extiende el lease. Lanza LockLostError si ya no es el dueño.
+    """
+    lease_seconds = LOCK_LEASE_SECONDS if lease_seconds is None else lease_seconds
+    expires_at = time.time() + lease_seconds
+    state = {
+        "owner": lease.owner,
+        "token": lease.token,
+        "expires_at": expires_at,
+        "acquired_at": datetime.now(timezone.utc).isoformat(),
+        "released": False
+    }
+    etag = _write_state(lease.key, state, lease.etag)
+    if etag is None:
+        raise LockLostError(f"Se perdió el bloqueo {lease.key} (token {lease.token})")
+    lease.etag = etag
+    lease.expires_at = expires_at
+    return lease
+
+def release(lease):
+    """
+    Libera el bloqueo. Conserva el fencing token en el blob para que la
+    siguiente adquisición lo incremente. Si el lease ya se había perdido sólo
+    se registra una advertencia.
+    """
+    state = {"owner": lease.owner, "token": lease.token, "expires_at": 0, "released": True}
+    if _write_state(lease.key, state, lease.etag) is None:
+        logging.warning(f"El bloqueo {lease.key} (token {lease.token}) ya no pertenecía a {lease.owner}")
+
+def force_release(key):
+    """
+    Libera el bloqueo sin importar el dueño (uso administrativo).
+    """
+    state, etag = blob_storage._read_json_with_etag(_lock_blob_name(key))
+    if state is None:
+        return
+    released = {**state, "expires_at": 0, "released": True}
+    if _write_state(key, released, etag) is None:
+        logging.warning(f"No se pudo forzar la liberación del bloqueo {key}")
+
+@contextmanager
+def locked(key, lease_seconds=None, wait_seconds=None, owner=None):
+    """
+    Context manager que adquiere el bloqueo de `key` y lo libera al salir.
+    Lanza LockTimeoutError si no se adquiere dentro de `wait_seconds`.
+    """
+    lease = acquire(key, lease_seconds=lease_seconds, wait_seconds=wait_seconds, owner=owner)
+    if lease is None:
+        raise LockTimeoutError(f"No se pudo adquirir el bloqueo {key}")
+    try:
+        yield lease
+    finally:
+        release(lease)
@@ -1,42 +1,974 @@
 import os
+import base64
+import contextvars
+import copy
 import json
 import logging
-from datetime import datetime, timedelta
+import random
+import re
+import threading
+import time
+from urllib.parse import quote
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
-from azure.storage.blob import BlobServiceClient
+from azure.core import MatchConditions
+from azure.core.exceptions import (
+    HttpResponseError, ResourceExistsError, ResourceModifiedError, ResourceNotFoundError, ResourceNotModifiedError
+)
+
+import task_codec
+import task_metrics
 
 # Cargar variables de entorno
 load_dotenv()
 
 AZURE_STORAGE_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
 AZURE_CONTAINER_NAME = os.getenv("AZURE_CONTAINER_NAME", "tasks")
+# Backend de almacenamiento: azure (Blob Storage), memoria (un solo proceso) o
+# local (archivos bajo TASK_LOCAL_DIR); ver blob_backends
+TASK_BACKEND = os.getenv("TASK_BACKEND", "azure")
+TASK_LOCAL_DIR = os.getenv("TASK_LOCAL_DIR", ".tareas")
+
+# El cliente del contenedor se crea la primera vez que se usa (get_container_client),
+# no al importar: el arranque en frío no paga la conexión ni falla por configuración.
+container_client = None
+_client_lock = threading.Lock()
+
+# Clave del bloqueo global (antes function_lock.json); ver blob_locks
+LOCK_KEY = "global"
+
+# Layout indexado: cada archivo bloqueos_{vdom}.json se reemplaza por el prefijo
+# bloqueos_{vdom}/ con un blob por tarea (tareas/{tid}.json) y un índice pequeño
+# (indice.json) que mapea tid -> {status, created_at}.
+TASK_RECORDS_DIR = "tareas"
+TASK_INDEX_NAME = "indice.json"
+# Registro de eventos: en lugar de reescribir indice.json en cada mutación, cada
+# cambio se agrega como una línea NDJSON a un append blob por hora
+# (eventos/{AAAAMMDDHH}.log, con continuaciones {AAAAMMDDHH}~{n}.log si el
+# append blob se llena). indice.json pasa a ser un snapshot que la
+# compactación actualiza; el índice vigente es el snapshot más los eventos
+# posteriores. Los segmentos ya plegados y sellados se mueven a auditoria/.
+TASK_EVENTS_DIR = "eventos"
+TASK_AUDIT_DIR = "auditoria"
+TASK_INDEX_VERSION = 2
+# Al cruzar cada múltiplo de este tamaño dentro de un segmento se compacta
+TASK_LOG_COMPACT_BYTES = int(os.getenv("TASK_LOG_COMPACT_BYTES", str(1024 * 1024)))
+# Horas tras las cuales un segmento se considera sellado (nadie más escribe en él)
+TASK_LOG_SEAL_HOURS = int(os.getenv("TASK_LOG_SEAL_HOURS", "2"))
+# Un append blob admite a lo sumo 50.000 bloques (uno por append). Cuando el
+# segmento de la hora se llena los eventos siguen en {AAAAMMDDHH}~{n}.log ("~"
+# ordena después de ".log" y la hora siguiente difiere antes), así que el orden
+# de los nombres sigue siendo el orden de los eventos.
+APPEND_BLOCK_LIMIT_ERROR = "BlockCountExceedsLimit"
+# Índice secundario con las tareas pendientes del vdom (tid -> tarea completa),
+# para que pending_tasks no dependa del tamaño del historial.
+TASK_PENDING_NAME = "pendientes.json"
+PENDING_STATUS = "pending"
+# Tareas reclamadas por un ejecutor (claim_tasks): siguen en el índice de
+# pendientes con su dueño y vencimiento del lease, y vuelven a estar disponibles
+# cuando el lease vence sin que el ejecutor las finalice.
+CLAIMED_STATUS = "in_progress"
+OPEN_STATUSES = (PENDING_STATUS, CLAIMED_STATUS)
+# Campos del reclamo: en el índice de pendientes sólo los cambian claim_tasks,
+# complete_claim y release_expired_claims (el registro se actualiza después)
+CLAIM_FIELDS = ("status", "claimed_by", "lease_until", "attempts")
+TASK_CLAIM_LEASE_SECONDS = int(os.getenv("TASK_CLAIM_LEASE_SECONDS", "300"))
+# Índice de deduplicación del vdom: clave normalizada (vdom, service, obj,
+# action) -> tid de la tarea abierta y vencimiento de la ventana. Sólo guarda
+# las claves vigentes, así que se mantiene chico aunque lleguen tormentas de alertas.
+TASK_DEDUP_NAME = "duplicados.json"
+TASK_DEDUP_FIELDS = ("vdom", "service", "obj", "action")
+# Ventana (segundos) en la que un bloqueo idéntico se fusiona con la tarea existente; 0 la desactiva
+TASK_DEDUP_WINDOW_SECONDS = int(os.getenv("TASK_DEDUP_WINDOW_SECONDS", "300"))
+# Mientras la tarea dueña de una clave no llega al índice de pendientes se
+# considera en creación durante estos segundos desde que registró la clave: los
+# duplicados esperan (con backoff) en lugar de reasignarse la clave.
+TASK_DEDUP_INFLIGHT_SECONDS = float(os.getenv("TASK_DEDUP_INFLIGHT_SECONDS", "30"))
+# Índice global de tids: un blob puntero por tarea (tids/{tid}.json) con el
+# archivo de lista del vdom donde vive, para resolver un tid sin interpretar su
+# formato. Como el ULID empieza con su instante de creación, listar tids/ por
+# prefijo permite consultas por rango de fechas.
+TASK_TIDS_DIR = "tids"
+ULID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+ULID_TIME_CHARS = 10
+# Índice global de tickets: tickets/{ticket normalizado}/{tid}.json con el
+# archivo del vdom, para resolver un ticket listando un solo prefijo. Una tarea
+# deduplicada queda indexada bajo cada uno de sus tickets.
+TASK_TICKETS_DIR = "tickets"
+# Tramos de antigüedad de los resúmenes: (límite superior en horas, etiqueta)
+TASK_AGE_BUCKETS = ((1, "<1h"), (6, "1-6h"), (24, "6-24h"), (24 * 7, "1-7d"), (None, ">7d"))
+# Paralelismo para descargar/subir registros cuando se necesita la lista completa
+TASK_IO_WORKERS = int(os.getenv("TASK_IO_WORKERS", "16"))
+# Tareas por tanda al recorrer listas o registros en streaming
+TASK_STREAM_BATCH = int(os.getenv("TASK_STREAM_BATCH", "500"))
+# Reintentos ante conflictos de escritura condicional (ETag)
+CONFLICT_MAX_RETRIES = int(os.getenv("CONFLICT_MAX_RETRIES", "10"))
+CONFLICT_BACKOFF_SECONDS = float(os.getenv("CONFLICT_BACKOFF_SECONDS", "0.05"))
+CONFLICT_BACKOFF_MAX_SECONDS = float(os.getenv("CONFLICT_BACKOFF_MAX_SECONDS", "2"))
+# Caché en proceso de blobs JSON ya parseados (LRU), revalidada por ETag.
+# Con staleness 0 cada lectura hace un GET condicional (If-None-Match).
+TASK_CACHE_MAX_ENTRIES = int(os.getenv("TASK_CACHE_MAX_ENTRIES", "1024"))
+TASK_CACHE_MAX_STALENESS_SECONDS = float(os.getenv("TASK_CACHE_MAX_STALENESS_SECONDS", "0"))
+# Nombres de vdom aceptados: el vdom forma parte de los nombres de blob (bloqueos_{vdom}/...)
+VDOM_NAME_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+def _check_settings():
+    """
+    Valida la configuración de Storage. Lanza ValueError si falta alguna variable.
+    """
+    if TASK_BACKEND != "azure":
+        return
+    if not AZURE_STORAGE_CONNECTION_STRING:
+        raise ValueError("Error: La variable de entorno AZURE_STORAGE_CONNECTION_STRING no está definida.")
+    if not AZURE_CONTAINER_NAME:
+        raise ValueError("Error: La variable de entorno AZURE_CONTAINER_NAME no está definida.")
+
+def get_container_client():
+    """
+    Retorna el cliente del contenedor del backend configurado. La primera
+    llamada del proceso valida la configuración, crea el cliente e intenta
+    crear el contenedor si no existe.
+    """
+    global container_client
+    if container_client is None:
+        with _client_lock:
+            if container_client is None:
+                _check_settings()
+                if TASK_BACKEND == "azure":
+                    from azure.storage.blob import BlobServiceClient
+
+                    client = BlobServiceClient.from_connection_string(AZURE_STORAGE_CONNECTION_STRING)
+                    client = client.get_container_client(AZURE_CONTAINER_NAME)
+                else:
+                    from blob_backends import create_container_client
+
+                    client = create_container_client(TASK_BACKEND, TASK_LOCAL_DIR)
+                try:
+                    client.create_container()
+                except Exception as e:
+                    logging.info(f"El contenedor '{AZURE_CONTAINER_NAME}' ya existe o no se pudo crear: {e}")
+                container_client = client
+    return container_client
+
+# blob_name -> (valor parseado, etag, instante de la última validación)
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_counters = {"hits": 0, "revalidated": 0, "misses": 0, "evictions": 0}
+
+# Eventos ya leídos de cada segmento: blob_name -> (offset inicial, offset leído, eventos)
+_segment_cache = {}
+_segment_cache_lock = threading.Lock()
+
+# Continuación en uso del segmento de la hora, por vdom: prefijo de eventos -> (hora, n)
+_segment_parts = {}
+
+# Archivos de lista ya verificados/migrados en este proceso
+_migrated_task_lists = set()
+
+def valid_vdom(vdom):
+    """
+    Indica si `vdom` se puede usar en nombres de blob (VDOM_NAME_PATTERN).
+    """
+    return isinstance(vdom, str) and VDOM_NAME_PATTERN.fullmatch(vdom) is not None
+
+def _check_task_blob_name(task_blob_name):
+    """
+    Valida que el archivo de lista tenga la forma bloqueos_{vdom}.json con un
+    vdom válido. Lanza ValueError si no.
+    """
+    if not (task_blob_name.startswith("bloqueos_") and task_blob_name.endswith(".json")
+            and valid_vdom(task_blob_name[len("bloqueos_"):-len(".json")])):
+        raise ValueError(f"Archivo de tareas inválido: {task_blob_name!r}")
+
+def _task_prefix(task_blob_name):
+    """
+    Deriva el prefijo del layout indexado a partir del nombre del archivo de lista.
+    Ejemplo: bloqueos_vdom1.json -> bloqueos_vdom1/
+    """
+    base = task_blob_name[:-len(".json")] if task_blob_name.endswith(".json") else task_blob_name
+    return f"{base}/"
+
+def _record_blob_name(tid, task_blob_name):
+    return f"{_task_prefix(task_blob_name)}{TASK_RECORDS_DIR}/{tid}.json"
+
+def _index_blob_name(task_blob_name):
+    return f"{_task_prefix(task_blob_name)}{TASK_INDEX_NAME}"
+
+def _events_prefix(task_blob_name):
+    return f"{_task_prefix(task_blob_name)}{TASK_EVENTS_DIR}/"
+
+def _audit_prefix(task_blob_name):
+    return f"{_task_prefix(task_blob_name)}{TASK_AUDIT_DIR}/"
+
+def _pending_blob_name(task_blob_name):
+    return f"{_task_prefix(task_blob_name)}{TASK_PENDING_NAME}"
+
+def _dedup_blob_name(task_blob_name):
+    return f"{_task_prefix(task_blob_name)}{TASK_DEDUP_NAME}"
+
+def _tid_blob_name(tid):
+    return f"{TASK_TIDS_DIR}/{tid}.json"
+
+def _normalize_ticket(ticket):
+    return str(ticket).strip().lower()
+
+def _ticket_prefix(ticket):
+    return f"{TASK_TICKETS_DIR}/{quote(_normalize_ticket(ticket), safe='')}/"
+
+def task_tickets(task):
+    """
+    Tickets normalizados de una tarea: el de su creación más los de sus duplicados.
+    """
+    tickets = task.get("tickets") or [task.get("ticket")]
+    return [ticket for ticket in dict.fromkeys(_normalize_ticket(ticket) for ticket in tickets if ticket) if ticket]
+
+def _index_entry(task):
+    return {"status": task.get("status"), "created_at": task.get("created_at")}
+
+def _cache_count(counter):
+    with _cache_lock:
+        _cache_counters[counter] += 1
+    task_metrics.count(f"cache.{counter}")
+
+def _cache_get(blob_name):
+    with _cache_lock:
+        entry = _cache.get(blob_name)
+        if entry is not None:
+            _cache.move_to_end(blob_name)
+        return entry
+
+def _cache_put(blob_name, value, etag):
+    if TASK_CACHE_MAX_ENTRIES <= 0 or not etag:
+        return
+    with _cache_lock:
+        _cache[blob_name] = (value, etag, time.monotonic())
+        _cache.move_to_end(blob_name)
+        while len(_cache) > TASK_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+            _cache_counters["evictions"] += 1
+            task_metrics.count("cache.evictions")
+
+def _cache_invalidate(blob_name):
+    with _cache_lock:
+        _cache.pop(blob_name, None)
+
+def cache_stats():
+    """
+    Retorna los contadores de la caché en proceso:
+    hits (sin ir a Storage), revalidated (304 Not Modified), misses (descarga completa) y evictions.
+    """
+    with _cache_lock:
+        return {**_cache_counters, "entries": len(_cache)}
+
+def clear_cache():
+    """
+    Vacía la caché en proceso y reinicia sus contadores.
+    """
+    with _cache_lock:
+        _cache.clear()
+        for counter in _cache_counters:
+            _cache_counters[counter] = 0
+
+def _fetch_json(blob_name, max_staleness=0):
+    """
+    Lectura read-through de un blob JSON. Si la entrada en caché se validó hace
+    menos de `max_staleness` segundos se retorna sin ir a Storage; si no, se hace
+    un GET condicional con su ETag y sólo se descarga y parsea el cuerpo si cambió.
+    Retorna (valor, etag) compartidos con la caché (no modificar), o (None, None)
+    si el blob no existe.
+    """
+    entry = _cache_get(blob_name)
+    if entry is not None and max_staleness and time.monotonic() - entry[2] <= max_staleness:
+        _cache_count("hits")
+        return entry[0], entry[1]
+    blob_client = get_container_client().get_blob_client(blob_name)
+    with task_metrics.timer("storage.descarga"):
+        try:
+            if entry is None:
+                downloader = blob_client.download_blob()
+            else:
+                downloader = blob_client.download_blob(etag=entry[1], match_condition=MatchConditions.IfModified)
+        except ResourceNotModifiedError:
+            _cache_count("revalidated")
+            _cache_put(blob_name, entry[0], entry[1])
+            return entry[0], entry[1]
+        except ResourceNotFoundError:
+            _cache_invalidate(blob_name)
+            _cache_count("misses")
+            return None, None
+        data = downloader.readall()
+    task_metrics.count("bytes.descargados", len(data))
+    with task_metrics.timer("serializacion.decodificar"):
+        value = task_codec.decode(data)
+    etag = downloader.properties.etag
+    _cache_count("misses")
+    _cache_put(blob_name, value, etag)
+    return value, etag
+
+def _read_json(blob_name, default=None, max_staleness=None):
+    """
+    Descarga y parsea un blob JSON (a través de la caché en proceso).
+    El formato (JSON plano, columnar, comprimido) se detecta con task_codec.
+    Retorna `default` si el blob no existe.
+    """
+    if max_staleness is None:
+        max_staleness = TASK_CACHE_MAX_STALENESS_SECONDS
+    value, _ = _fetch_json(blob_name, max_staleness)
+    return default if value is None else copy.deepcopy(value)
+
+def _read_json_with_etag(blob_name, max_staleness=0):
+    """
+    Descarga y parsea un blob JSON junto con su ETag. Por defecto siempre
+    revalida contra Storage, ya que el ETag se usa para escrituras condicionales.
+    Retorna (None, None) si el blob no existe.
+    """
+    value, etag = _fetch_json(blob_name, max_staleness)
+    return copy.deepcopy(value), etag
+
+def _conflict_backoff(attempt):
+    """
+    Espera con backoff exponencial y jitter completo antes de reintentar.
+    """
+    ceiling = min(CONFLICT_BACKOFF_MAX_SECONDS, CONFLICT_BACKOFF_SECONDS * (2 ** attempt))
+    time.sleep(random.uniform(0, ceiling))
+
+def _update_json(blob_name, mutate, default=None):
+    """
+    Lectura-modificación-escritura optimista de un blob JSON.
+    `mutate` recibe el valor actual (o `default` si el blob no existe) y retorna
+    el nuevo valor, o None si no hay nada que escribir. La escritura se condiciona
+    al ETag leído (o a que el blob no exista); ante un conflicto se vuelve a leer,
+    se reaplica `mutate` y se reintenta con backoff. Retorna el valor final.
+    """
+    blob_client = get_container_client().get_blob_client(blob_name)
+    for attempt in range(CONFLICT_MAX_RETRIES + 1):
+        current, etag = _read_json_with_etag(blob_name)
+        updated = mutate(copy.deepcopy(default) if current is None else current)
+        if updated is None:
+            return current
+        with task_metrics.timer("serializacion.codificar"):
+            data = task_codec.encode(updated)
+        try:
+            with task_metrics.timer("storage.subida"):
+                if etag is None:
+                    result = blob_client.upload_blob(data, overwrite=False)
+                else:
+                    result = blob_client.upload_blob(data, overwrite=True, etag=etag, match_condition=MatchConditions.IfNotModified)
+            task_metrics.count("bytes.subidos", len(data))
+            _cache_put(blob_name, updated, result.get("etag"))
+            return updated
+        except (ResourceModifiedError, ResourceExistsError):
+            _cache_invalidate(blob_name)
+            task_metrics.count("conflictos")
+            logging.info(f"Conflicto de escritura en {blob_name} (intento {attempt + 1}), reintentando")
+            _conflict_backoff(attempt)
+    raise RuntimeError(f"No se pudo escribir {blob_name} tras {CONFLICT_MAX_RETRIES + 1} intentos por conflictos")
+
+def _write_json(blob_name, data, overwrite=True):
+    """
+    Serializa y sube un blob JSON.
+    """
+    blob_client = get_container_client().get_blob_client(blob_name)
+    with task_metrics.timer("serializacion.codificar"):
+        encoded = task_codec.encode(data)
+    with task_metrics.timer("storage.subida"):
+        result = blob_client.upload_blob(encoded, overwrite=overwrite)
+    task_metrics.count("bytes.subidos", len(encoded))
+    _cache_put(blob_name, copy.deepcopy(data), result.get("etag"))
+
+def _delete_blob(blob_name):
+    _cache_invalidate(blob_name)
+    try:
+        get_container_client().get_blob_client(blob_name).delete_blob()
+    except ResourceNotFoundError:
+        pass
+
+def _map_parallel(function, items):
+    """
+    Aplica `function` a cada elemento en TASK_IO_WORKERS hilos y retorna los
+    resultados en orden. Cada trabajo corre en una copia del contexto de quien
+    llama, así que las métricas de la invocación (task_metrics) incluyen lo que
+    hacen los hilos. Con un solo elemento se aplica directamente.
+    """
+    items = list(items)
+    if len(items) < 2:
+        return [function(item) for item in items]
+    with ThreadPoolExecutor(max_workers=TASK_IO_WORKERS) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, function, item) for item in items]
+        return [future.result() for future in futures]
+
+def _write_records(tasks, task_blob_name):
+    """
+    Sube en paralelo un blob por tarea.
+    """
+    _map_parallel(lambda task: _write_json(_record_blob_name(task["tid"], task_blob_name), task), tasks)
+
+def _write_tid_locations(tids, task_blob_name, **fields):
+    """
+    Registra en el índice de tids la ubicación de cada tarea (en paralelo).
+    """
+    location = {"archivo": task_blob_name, **fields}
+    _map_parallel(lambda tid: _write_json(_tid_blob_name(tid), location), tids)
+
+def _ticket_location_names(tasks):
+    return [f"{_ticket_prefix(ticket)}{task['tid']}.json" for task in tasks for ticket in task_tickets(task)]
+
+def _write_ticket_locations(tasks, task_blob_name):
+    """
+    Registra en el índice de tickets cada ticket de las tareas (en paralelo).
+    """
+    location = {"archivo": task_blob_name}
+    _map_parallel(lambda name: _write_json(name, location), _ticket_location_names(tasks))
+
+def _delete_ticket_locations(tasks):
+    _map_parallel(_delete_blob, _ticket_location_names(tasks))
+
+def _read_records(tids, task_blob_name, max_staleness=None):
+    """
+    Descarga en paralelo los blobs de las tareas indicadas, conservando el orden.
+    Los registros inexistentes se omiten.
+    """
+    max_staleness = TASK_CACHE_MAX_STALENESS_SECONDS if max_staleness is None else max_staleness
+
+    def read(tid):
+        record, _ = _fetch_json(_record_blob_name(tid, task_blob_name), max_staleness)
+        return None if record is None else dict(record)
+
+    return [record for record in _map_parallel(read, tids) if record is not None]
+
+def _segment_name(moment=None, part=0):
+    hour = (moment or datetime.now(timezone.utc)).strftime("%Y%m%d%H")
+    return f"{hour}~{part:04d}.log" if part else f"{hour}.log"
+
+def _event(kind, tid, **fields):
+    return {"tipo": kind, "tid": tid, "ts": datetime.now(timezone.utc).isoformat(), **fields}
+
+def _append_events(task_blob_name, events):
+    """
+    Agrega los eventos al segmento de la hora actual con una sola escritura
+    append (tamaño constante, sin leer ni reescribir el índice). Si el segmento
+    alcanzó el límite de bloques de un append blob se continúa en el siguiente
+    de la misma hora. Si el segmento cruza el umbral TASK_LOG_COMPACT_BYTES se
+    intenta compactar el registro.
+    """
+    if not events:
+        return
+    _ensure_migrated(task_blob_name)
+    data = "".join(json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n" for event in events).encode("utf-8")
+    prefix = _events_prefix(task_blob_name)
+    now = datetime.now(timezone.utc)
+    hour = _segment_name(now)
+    current_hour, part = _segment_parts.get(prefix, (hour, 0))
+    if current_hour != hour:
+        part = 0
+    with task_metrics.timer("storage.append"):
+        while True:
+            blob_client = get_container_client().get_blob_client(f"{prefix}{_segment_name(now, part)}")
+            try:
+                result = _append_block(blob_client, data)
+                break
+            except HttpResponseError as e:
+                if getattr(e, "error_code", None) != APPEND_BLOCK_LIMIT_ERROR:
+                    raise
+                # Sólo se avanza cuando el segmento está lleno para todos los
+                # escritores, así los eventos de un segmento preceden a los del siguiente
+                task_metrics.count("eventos.segmento_lleno")
+                part += 1
+    _segment_parts[prefix] = (hour, part)
+    task_metrics.count("bytes.subidos", len(data))
+    offset = int(result.get("blob_append_offset") or 0)
+    if offset // TASK_LOG_COMPACT_BYTES != (offset + len(data)) // TASK_LOG_COMPACT_BYTES:
+        try:
+            compact_task_log(task_blob_name, wait_seconds=0)
+        except Exception as e:
+            logging.warning(f"Error al compactar el registro de eventos de {task_blob_name}: {e}")
+
+def _append_block(blob_client, data):
+    """
+    Agrega un bloque al append blob, creándolo si todavía no existe.
+    """
+    try:
+        return blob_client.append_block(data)
+    except ResourceNotFoundError:
+        try:
+            blob_client.create_append_blob(match_condition=MatchConditions.IfMissing)
+        except (ResourceExistsError, ResourceModifiedError):
+            pass
+        return blob_client.append_block(data)
+
+def _read_segment(blob_name, start, size):
+    """
+    Lee los eventos de un segmento desde el offset `start`. Lo ya leído se
+    guarda en memoria, así que en lecturas sucesivas sólo se descarga la
+    porción agregada desde entonces. Retorna (eventos, offset leído).
+    """
+    with _segment_cache_lock:
+        cached = _segment_cache.get(blob_name)
+    if cached is not None and cached[0] == start and cached[1] <= size:
+        offset, events = cached[1], list(cached[2])
+    else:
+        offset, events = start, []
+    if size > offset:
+        new_events, offset = _download_events(blob_name, offset, size)
+        events.extend(new_events)
+    with _segment_cache_lock:
+        if len(_segment_cache) >= TASK_CACHE_MAX_ENTRIES:
+            _segment_cache.clear()
+        _segment_cache[blob_name] = (start, offset, events)
+    return events, offset
+
+def _download_events(blob_name, offset, size):
+    """
+    Descarga el rango [offset, size) de un segmento y parsea sus líneas
+    completas. Retorna (eventos, offset hasta donde se leyó).
+    """
+    with task_metrics.timer("storage.descarga"):
+        data = get_container_client().get_blob_client(blob_name).download_blob(offset=offset, length=size - offset).readall()
+    task_metrics.count("bytes.descargados", len(data))
+    complete = data.rfind(b"\n") + 1
+    events = [json.loads(line) for line in data[:complete].splitlines() if line.strip()]
+    return events, offset + complete
+
+def _apply_events(entries, events):
+    """
+    Aplica eventos sobre las entradas del índice. Nunca modifica las entradas
+    existentes en su lugar, ya que pueden estar compartidas con la caché.
+    """
+    for event in events:
+        tid = event.get("tid")
+        kind = event.get("tipo")
+        if kind == "creada":
+            entry = _index_entry(event.get("tarea", {}))
+            if tid in entries:
+                entry["status"] = entries[tid].get("status")
+            entries[tid] = entry
+        elif kind == "estado":
+            entries[tid] = {**entries.get(tid, {"created_at": None}), "status": event.get("status")}
+        elif kind in ("eliminada", "archivada"):
+            entries.pop(tid, None)
+
+def _snapshot_document(snapshot):
+    """
+    Normaliza el snapshot del índice. Los índices anteriores al registro de
+    eventos eran un diccionario plano tid -> entrada.
+    """
+    if snapshot is None:
+        return {"version": TASK_INDEX_VERSION, "entradas": {}, "posiciones": {}}
+    if snapshot.get("version") == TASK_INDEX_VERSION and "entradas" in snapshot:
+        return snapshot
+    return {"version": TASK_INDEX_VERSION, "entradas": snapshot, "posiciones": {}}
+
+def _load_index_state(task_blob_name):
+    """
+    Reconstruye el índice vigente: snapshot más los eventos posteriores.
+    Retorna (entradas, etag del snapshot, segmentos) donde segmentos es una
+    lista de (nombre, offset leído, tamaño).
+    """
+    _ensure_migrated(task_blob_name)
+    snapshot, etag = _fetch_json(_index_blob_name(task_blob_name), TASK_CACHE_MAX_STALENESS_SECONDS)
+    snapshot = _snapshot_document(snapshot)
+    entries = dict(snapshot["entradas"])
+    positions = snapshot["posiciones"]
+    prefix = _events_prefix(task_blob_name)
+    segments = []
+    for blob in get_container_client().list_blobs(name_starts_with=prefix):
+        segment = blob.name[len(prefix):]
+        events, offset = _read_segment(blob.name, positions.get(segment, 0), blob.size)
+        _apply_events(entries, events)
+        segments.append((segment, offset, blob.size))
+    return entries, etag, segments
+
+def _load_index(task_blob_name):
+    """
+    Retorna el índice vigente del vdom (tid -> {status, created_at}).
+    """
+    return _load_index_state(task_blob_name)[0]
+
+def _count_entry(counters, entry, delta):
+    """
+    Suma `delta` al contador de la hora de creación y el estado de `entry`,
+    descartando los contadores que quedan en cero.
+    """
+    hour = (entry.get("created_at") or "")[:13]
+    status = str(entry.get("status"))
+    by_status = counters.setdefault(hour, {})
+    by_status[status] = by_status.get(status, 0) + delta
+    if not by_status[status]:
+        del by_status[status]
+        if not by_status:
+            del counters[hour]
+
+def _count_entries(entries):
+    counters = {}
+    for entry in entries.values():
+        _count_entry(counters, entry, 1)
+    return counters
+
+def load_task_counters(task_blob_name):
+    """
+    Retorna los contadores vigentes del vdom: hora de creación (YYYY-MM-DDTHH)
+    -> estado -> cantidad de tareas. Parte de los contadores que la compactación
+    guarda en el snapshot y aplica sólo los eventos posteriores, así que el costo
+    depende de los eventos sin compactar y no de la cantidad de tareas.
+    """
+    _ensure_migrated(task_blob_name)
+    snapshot, _ = _fetch_json(_index_blob_name(task_blob_name), TASK_CACHE_MAX_STALENESS_SECONDS)
+    snapshot = _snapshot_document(snapshot)
+    base = snapshot["entradas"]
+    if "contadores" in snapshot:
+        counters = {hour: dict(by_status) for hour, by_status in snapshot["contadores"].items()}
+    else:
+        # Snapshot anterior a los contadores: se cuentan sus entradas una vez
+        counters = _count_entries(base)
+    positions = snapshot["posiciones"]
+    prefix = _events_prefix(task_blob_name)
+    # Entradas modificadas por los eventos (None si se quitaron); el snapshot
+    # está compartido con la caché, así que no se modifica
+    touched = {}
+    for blob in get_container_client().list_blobs(name_starts_with=prefix):
+        events, _ = _read_segment(blob.name, positions.get(blob.name[len(prefix):], 0), blob.size)
+        for event in events:
+            tid = event.get("tid")
+            before = touched[tid] if tid in touched else base.get(tid)
+            entries = {} if before is None else {tid: before}
+            _apply_events(entries, [event])
+            touched[tid] = entries.get(tid)
+            if before is not None:
+                _count_entry(counters, before, -1)
+            if touched[tid] is not None:
+                _count_entry(counters, touched[tid], 1)
+    return counters
+
+def _age_bucket(hour, now):
+    try:
+        created = datetime.strptime(hour, "%Y-%m-%dT%H").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return TASK_AGE_BUCKETS[-1][1]
+    age_hours = (now - created).total_seconds() / 3600
+    for limit, label in TASK_AGE_BUCKETS:
+        if limit is None or age_hours < limit:
+            return label
+
+def summarize_counters(counters, now=None):
+    """
+    Resume contadores por hora de creación en totales por estado y por tramo de
+    antigüedad (TASK_AGE_BUCKETS, con resolución de una hora). Las tareas sin
+    fecha de creación cuentan en el tramo más antiguo.
+    """
+    now = now or datetime.now(timezone.utc)
+    summary = {"total": 0, "por_estado": {}, "por_antiguedad": {label: {} for _, label in TASK_AGE_BUCKETS}}
+    for hour, by_status in counters.items():
+        bucket = summary["por_antiguedad"][_age_bucket(hour, now)]
+        for status, count in by_status.items():
+            summary["total"] += count
+            summary["por_estado"][status] = summary["por_estado"].get(status, 0) + count
+            bucket[status] = bucket.get(status, 0) + count
+    return summary
+
+def merge_summaries(summaries):
+    """
+    Suma resúmenes de summarize_counters (por ejemplo, de varios vdoms).
+    """
+    total = {"total": 0, "por_estado": {}, "por_antiguedad": {label: {} for _, label in TASK_AGE_BUCKETS}}
+    for summary in summaries:
+        total["total"] += summary["total"]
+        for status, count in summary["por_estado"].items():
+            total["por_estado"][status] = total["por_estado"].get(status, 0) + count
+        for label, by_status in summary["por_antiguedad"].items():
+            bucket = total["por_antiguedad"][label]
+            for status, count in by_status.items():
+                bucket[status] = bucket.get(status, 0) + count
+    return total
+
+def summarize_tasks(task_blob_name):
+    """
+    Retorna el resumen del vdom (ver summarize_counters) sin leer sus registros.
+    """
+    return summarize_counters(load_task_counters(task_blob_name))
+
+def compact_task_log(task_blob_name, wait_seconds=None):
+    """
+    Pliega los eventos del registro en el snapshot indice.json, bajo un
+    bloqueo por vdom para que haya un solo compactador. Los segmentos sellados
+    (más antiguos que TASK_LOG_SEAL_HOURS) ya plegados por completo se mueven a
+    auditoria/. El lease se renueva antes de escribir el snapshot y antes de
+    mover cada segmento: la renovación es condicional, así que si expiró y otro
+    compactador lo tomó se aborta (LockLostError) en lugar de pisar su trabajo.
+    Retorna la cantidad de tareas del snapshot, o None si otro proceso estaba
+    compactando.
+    """
+    import blob_locks
+    key = f"compactacion/{_task_prefix(task_blob_name).rstrip('/')}"
+    try:
+        with blob_locks.locked(key, wait_seconds=wait_seconds) as lease:
+            entries, etag, segments = _load_index_state(task_blob_name)
+            snapshot = {
+                "version": TASK_INDEX_VERSION,
+                "entradas": entries,
+                "posiciones": {segment: offset for segment, offset, _ in segments},
+                "contadores": _count_entries(entries),
+                "compactado_en": datetime.now(timezone.utc).isoformat()
+            }
+            blob_client = get_container_client().get_blob_client(_index_blob_name(task_blob_name))
+            blob_locks.renew(lease)
+            if etag is None:
+                result = blob_client.upload_blob(task_codec.encode(snapshot), overwrite=False)
+            else:
+                result = blob_client.upload_blob(task_codec.encode(snapshot), overwrite=True, etag=etag, match_condition=MatchConditions.IfNotModified)
+            _cache_put(_index_blob_name(task_blob_name), snapshot, result.get("etag"))
+
+            sealed_before = _segment_name(datetime.now(timezone.utc) - timedelta(hours=TASK_LOG_SEAL_HOURS))
+            for segment, offset, size in segments:
+                if segment < sealed_before and offset == size:
+                    blob_locks.renew(lease)
+                    _archive_segment(task_blob_name, segment)
+            logging.info(f"Registro de eventos de {task_blob_name} compactado: {len(entries)} tareas")
+            return len(entries)
+    except blob_locks.LockTimeoutError:
+        logging.info(f"Otro proceso está compactando {task_blob_name}")
+        return None
+    except blob_locks.LockLostError as e:
+        logging.warning(f"Compactación de {task_blob_name} interrumpida: {e}")
+        return None
+
+def _archive_segment(task_blob_name, segment):
+    """
+    Mueve un segmento sellado y ya plegado de eventos/ a auditoria/. Si el
+    segmento ya no está (lo movió otro compactador) no hace nada.
+    """
+    source = f"{_events_prefix(task_blob_name)}{segment}"
+    try:
+        data = get_container_client().get_blob_client(source).download_blob().readall()
+    except ResourceNotFoundError:
+        with _segment_cache_lock:
+            _segment_cache.pop(source, None)
+        return
+    get_container_client().get_blob_client(f"{_audit_prefix(task_blob_name)}{segment}").upload_blob(data, overwrite=True)
+    _delete_blob(source)
+    with _segment_cache_lock:
+        _segment_cache.pop(source, None)
+
+def compact_all_task_logs():
+    """
+    Compacta el registro de eventos de todos los vdoms. Pensada para un Timer Trigger.
+    Un error en un vdom se registra (su resultado queda en None) sin interrumpir los demás.
+    """
+    results = {}
+    for task_blob_name in list_task_blob_names():
+        try:
+            results[task_blob_name] = compact_task_log(task_blob_name, wait_seconds=0)
+        except Exception as e:
+            logging.error(f"Error al compactar el registro de eventos de {task_blob_name}: {e}")
+            results[task_blob_name] = None
+    return results
+
+def list_task_blob_names():
+    """
+    Lista los archivos de tareas (bloqueos_{vdom}.json) existentes, ya sea
+    migrados al layout indexado o todavía en formato de lista.
+    """
+    names = set()
+    for item in get_container_client().walk_blobs(name_starts_with="bloqueos_", delimiter="/"):
+        if item.name.endswith("/"):
+            names.add(f"{item.name.rstrip('/')}.json")
+        elif item.name.endswith(".json"):
+            names.add(item.name)
+    return sorted(names)
+
+def load_task_events(task_blob_name, tid=None):
+    """
+    Retorna el historial de eventos (auditoría) del vdom en orden, opcionalmente
+    filtrado por tid. Incluye los segmentos ya movidos a auditoria/.
+    """
+    events = []
+    for prefix in (_audit_prefix(task_blob_name), _events_prefix(task_blob_name)):
+        for blob in get_container_client().list_blobs(name_starts_with=prefix):
+            data = get_container_client().get_blob_client(blob.name).download_blob().readall()
+            events.extend(json.loads(line) for line in data.splitlines() if line.strip())
+    if tid is not None:
+        events = [event for event in events if event.get("tid") == tid]
+    return events
+
+def _update_pending(task_blob_name, mutate):
+    """
+    Modifica el índice de pendientes del vdom con escritura condicional (ver _update_json).
+    """
+    _ensure_migrated(task_blob_name)
+    return _update_json(_pending_blob_name(task_blob_name), mutate, default={})
 
-if not AZURE_STORAGE_CONNECTION_STRING:
-    raise ValueError("Error: La variable de entorno AZURE_STORAGE_CONNECTION_STRING no está definida.")
-if not AZURE_CONTAINER_NAME:
-    raise ValueError("Error: La variable de entorno AZURE_CONTAINER_NAME no está definida.")
+def _sync_pending(tids, task_blob_name):
+    """
+    Refleja en el índice de pendientes el estado actual de los registros de
+    `tids`: agrega las tareas pendientes, actualiza las abiertas y quita las
+    demás. Los registros se releen dentro de la escritura condicional, así que
+    con actualizaciones concurrentes el índice queda con el último registro
+    escrito. El índice es la autoridad sobre los reclamos (el registro se
+    actualiza después): una entrada existente conserva sus CLAIM_FIELDS y una
+    tarea in_progress que no está en el índice no se vuelve a agregar.
+    """
+    def sync(pending):
+        records = {task["tid"]: task for task in _read_records(tids, task_blob_name, max_staleness=0)}
+        changed = False
+        for tid in tids:
+            task, current = records.get(tid), pending.get(tid)
+            if task is None or task.get("status") not in OPEN_STATUSES:
+                entry = None
+            elif current is not None:
+                entry = {key: value for key, value in task.items() if key not in CLAIM_FIELDS}
+                entry.update((key, current[key]) for key in CLAIM_FIELDS if key in current)
+            else:
+                entry = task if task.get("status") == PENDING_STATUS else None
+            if entry is None:
+                changed = pending.pop(tid, None) is not None or changed
+            elif current != entry:
+                pending[tid] = entry
+                changed = True
+        return pending if changed else None
+
+    _update_pending(task_blob_name, sync)
 
-blob_service_client = BlobServiceClient.from_connection_string(AZURE_STORAGE_CONNECTION_STRING)
-container_client = blob_service_client.get_container_client(AZURE_CONTAINER_NAME)
+def rebuild_pending_index(task_blob_name):
+    """
+    Reconstruye el índice de pendientes a partir del índice principal y los
+    registros. Se usa al actualizar vdoms que aún no lo tenían o para reparar
+    inconsistencias: las entradas cuyo registro no está abierto se descartan.
+    Las que otro proceso haya agregado mientras tanto se conservan si su registro
+    sigue abierto, y las reclamadas conservan su lease.
+    """
+    index = _load_index(task_blob_name)
+    tids = [tid for tid, entry in index.items() if entry.get("status") in OPEN_STATUSES]
+    rebuilt = {task["tid"]: task for task in _read_records(tids, task_blob_name) if task.get("status") in OPEN_STATUSES}
 
-# Intentar crear el contenedor si no existe
-try:
-    container_client.create_container()
-except Exception as e:
-    logging.info(f"El contenedor '{AZURE_CONTAINER_NAME}' ya existe o no se pudo crear: {e}")
+    def rebuild(current):
+        added = [tid for tid in current if tid not in rebuilt]
+        still_open = {
+            task["tid"] for task in _read_records(added, task_blob_name, max_staleness=0)
+            if task.get("status") in OPEN_STATUSES
+        }
+        pending = dict(rebuilt)
+        for tid, task in current.items():
+            if tid in still_open or (tid in rebuilt and task.get("status") == CLAIMED_STATUS):
+                pending[tid] = task
+        return pending
 
-# Nombre del blob de bloqueo
-LOCK_BLOB_NAME = "function_lock.json"
+    _update_json(_pending_blob_name(task_blob_name), rebuild, default={})
+    return len(rebuilt)
+
+def migrate_task_list(task_blob_name, delete_legacy=False):
+    """
+    Migra un archivo de lista bloqueos_{vdom}.json al layout indexado.
+    El índice se crea sin sobreescribir, de modo que si otro proceso ya migró
+    (y quizá agregó tareas) no se pisa su trabajo. Retorna la cantidad de tareas migradas.
+    """
+    index, pending, batch = {}, {}, []
+
+    def flush():
+        _write_records(batch, task_blob_name)
+        _write_tid_locations([task["tid"] for task in batch], task_blob_name)
+        _write_ticket_locations(batch, task_blob_name)
+        batch.clear()
+
+    try:
+        # La lista se recorre en streaming: en memoria quedan sólo el índice,
+        # las pendientes y la tanda en curso, no el archivo completo
+        for task in iter_tasks(task_blob_name):
+            if not task.get("tid"):
+                continue
+            index[task["tid"]] = _index_entry(task)
+            if task.get("status") in OPEN_STATUSES:
+                pending[task["tid"]] = task
+            batch.append(task)
+            if len(batch) >= TASK_STREAM_BATCH:
+                flush()
+    except ResourceNotFoundError:
+        return 0
+    flush()
+    snapshot = {"version": TASK_INDEX_VERSION, "entradas": index, "posiciones": {}, "contadores": _count_entries(index)}
+    try:
+        _write_json(_index_blob_name(task_blob_name), snapshot, overwrite=False)
+        _write_json(_pending_blob_name(task_blob_name), pending, overwrite=False)
+    except ResourceExistsError:
+        logging.info(f"El índice de {task_blob_name} ya existía, se conserva el actual")
+    if delete_legacy:
+        _delete_blob(task_blob_name)
+    logging.info(f"Migradas {len(index)} tareas de {task_blob_name} al layout indexado")
+    return len(index)
+
+def migrate_all_task_lists(delete_legacy=False):
+    """
+    Migra todos los archivos bloqueos_*.json del contenedor al layout indexado.
+    """
+    migrated = {}
+    for blob in get_container_client().list_blobs(name_starts_with="bloqueos_"):
+        if "/" in blob.name or not blob.name.endswith(".json"):
+            continue
+        migrated[blob.name] = migrate_task_list(blob.name, delete_legacy=delete_legacy)
+        _migrated_task_lists.add(blob.name)
+    return migrated
+
+def _ensure_migrated(task_blob_name):
+    """
+    Migra perezosamente (una vez por proceso) el archivo de lista si todavía
+    no existe su índice, y construye el índice de pendientes si falta. Un vdom
+    sin archivo de lista ni blobs bajo su prefijo no existe: no se le crea nada
+    (las lecturas de vdoms inexistentes no dejan blobs) ni se recuerda.
+    Lanza ValueError si el nombre del archivo no es válido.
+    """
+    if task_blob_name in _migrated_task_lists:
+        return
+    _check_task_blob_name(task_blob_name)
+    container = get_container_client()
+    if not container.get_blob_client(_index_blob_name(task_blob_name)).exists():
+        if container.get_blob_client(task_blob_name).exists():
+            migrate_task_list(task_blob_name)
+        elif next(iter(container.list_blobs(name_starts_with=_task_prefix(task_blob_name))), None) is None:
+            return
+    _migrated_task_lists.add(task_blob_name)
+    if not container.get_blob_client(_pending_blob_name(task_blob_name)).exists():
+        rebuild_pending_index(task_blob_name)
+
+def iter_tasks(blob_name, status=None, tid=None):
+    """
+    Recorre en streaming un blob con una lista (o un diccionario) de tareas: lo
+    descarga por bloques y genera cada tarea apenas se parsea, filtrando por
+    `status` y/o `tid` sin armar la lista completa (task_codec.iter_items). No
+    pasa por la caché. Lanza ResourceNotFoundError si el blob no existe.
+    """
+    with task_metrics.timer("storage.descarga"):
+        downloader = get_container_client().get_blob_client(blob_name).download_blob()
+
+    def chunks():
+        for chunk in downloader.chunks():
+            task_metrics.count("bytes.descargados", len(chunk))
+            yield chunk
+
+    for task in task_codec.iter_items(chunks()):
+        if status is not None and task.get("status") != status:
+            continue
+        if tid is not None and task.get("tid") != tid:
+            continue
+        yield task
+
+def iter_all_tasks(task_blob_name, status=None):
+    """
+    Genera las tareas del vdom de a tandas de TASK_STREAM_BATCH registros
+    (descargados en paralelo), filtrando por `status` con el índice antes de
+    descargar, de modo que la memoria no crece con el tamaño del vdom.
+    """
+    tids = [tid for tid, entry in _load_index(task_blob_name).items() if status is None or entry.get("status") == status]
+    for start in range(0, len(tids), TASK_STREAM_BATCH):
+        yield from _read_records(tids[start:start + TASK_STREAM_BATCH], task_blob_name)
 
 def load_all_tasks(task_blob_name):
     """
-    Carga todas las tareas desde el archivo list_of_tasks_in_progress.json en Blob Storage.
-    Si el archivo no existe o ocurre un error, retorna una lista vacía.
+    Carga todas las tareas del vdom correspondiente a task_blob_name.
+    Reconstruye el índice (snapshot + eventos) y descarga los registros en paralelo.
+    Si ocurre un error, retorna una lista vacía.
     """
-    blob_client = container_client.get_blob_client(task_blob_name)
     try:
-        tasks_json = blob_client.download_blob().readall().decode("utf-8")
-        tasks = json.loads(tasks_json)
+        tasks = list(iter_all_tasks(task_blob_name))
     except Exception as e:
         logging.warning(f"Error al cargar tareas desde {task_blob_name}: {e}")
         tasks = []
@@ -44,74 +976,707 @@ def load_all_tasks(task_blob_name):
 
 def save_all_tasks(tasks, task_blob_name):
     """
-    Guarda la lista completa de tareas en el archivo JSON correspondiente en Blob Storage.
+    Guarda la lista completa de tareas: un registro por tarea y, en el registro
+    de eventos, las diferencias contra el índice vigente.
+    Los registros que ya no están en la lista se eliminan.
     """
-    blob_client = container_client.get_blob_client(task_blob_name)
-    blob_client.upload_blob(json.dumps(tasks, ensure_ascii=False, indent=4), overwrite=True)
+    current = _load_index(task_blob_name)
+    _write_records(tasks, task_blob_name)
+    _write_tid_locations([task["tid"] for task in tasks if task["tid"] not in current], task_blob_name)
+    _write_ticket_locations(tasks, task_blob_name)
+    index = {task["tid"]: _index_entry(task) for task in tasks}
+    removed = current.keys() - index.keys()
+    _delete_ticket_locations(_read_records(removed, task_blob_name))
+    events = [_event("eliminada", tid) for tid in removed]
+    for task in tasks:
+        if task["tid"] not in current:
+            events.append(_event("creada", task["tid"], tarea=task))
+        elif current[task["tid"]].get("status") != task.get("status"):
+            events.append(_event("estado", task["tid"], status=task.get("status")))
+    _append_events(task_blob_name, events)
+    pending = {task["tid"]: task for task in tasks if task.get("status") in OPEN_STATUSES}
+    _update_pending(task_blob_name, lambda current: pending)
+    _sync_final_statuses(
+        [(task["tid"], current[task["tid"]].get("status"), task.get("status")) for task in tasks if task["tid"] in current]
+        + [(tid, current[tid].get("status"), None) for tid in removed]
+    )
+    for tid in removed:
+        _delete_blob(_record_blob_name(tid, task_blob_name))
+        _delete_blob(_tid_blob_name(tid))
+
+def _sync_final_statuses(transitions):
+    """
+    Refleja en la caché de estados finales de get_status (task_status_cache) las
+    transiciones (tid, estado anterior, estado nuevo) que entran o salen de un
+    estado final. Un fallo se registra sin interrumpir la actualización.
+    """
+    import task_status_cache
+    changes = {
+        tid: status for tid, before, status in transitions
+        if before != status and (status in task_status_cache.FINAL_STATUSES or before in task_status_cache.FINAL_STATUSES)
+    }
+    if not changes:
+        return
+    try:
+        task_status_cache.record_final_statuses(changes)
+    except Exception as e:
+        logging.error(f"Error al actualizar la caché de estados finales: {e}")
 
 def add_task(task, task_blob_name):
     """
-    Agrega una nueva tarea a la lista de tareas.
+    Agrega una nueva tarea: sube su registro y sus entradas de los índices de
+    tids y de tickets, agrega el evento de creación al registro (y la agrega
+    al índice de pendientes si corresponde).
     """
-    tasks = load_all_tasks(task_blob_name)
-    tasks.append(task)
-    save_all_tasks(tasks, task_blob_name)
+    _write_json(_record_blob_name(task["tid"], task_blob_name), task)
+    _write_json(_tid_blob_name(task["tid"]), {"archivo": task_blob_name})
+    _write_ticket_locations([task], task_blob_name)
+    _append_events(task_blob_name, [_event("creada", task["tid"], tarea=task)])
+    if task.get("status") == PENDING_STATUS:
+        _sync_pending([task["tid"]], task_blob_name)
+
+def add_tasks(tasks, task_blob_name):
+    """
+    Agrega un lote de tareas del mismo vdom. Los registros se suben en paralelo,
+    los eventos de creación se agregan con un solo append y el índice de
+    pendientes se actualiza con una sola escritura condicional, sin importar el
+    tamaño del lote.
+    """
+    if not tasks:
+        return
+    _write_records(tasks, task_blob_name)
+    _write_tid_locations([task["tid"] for task in tasks], task_blob_name)
+    _write_ticket_locations(tasks, task_blob_name)
+    _append_events(task_blob_name, [_event("creada", task["tid"], tarea=task) for task in tasks])
+    pending = {task["tid"]: task for task in tasks if task.get("status") == PENDING_STATUS}
+    if pending:
+        _update_pending(task_blob_name, lambda current: {**current, **pending})
+
+def dedup_key(task):
+    """
+    Clave de deduplicación de un bloqueo: vdom, service, obj y action normalizados.
+    """
+    return "|".join(str(task.get(field) or "").strip().lower() for field in TASK_DEDUP_FIELDS)
+
+def _add_tickets(task, duplicates):
+    tickets = list(task.get("tickets") or [task.get("ticket")])
+    for duplicate in duplicates:
+        if duplicate.get("ticket") not in tickets:
+            tickets.append(duplicate.get("ticket"))
+    task["tickets"] = tickets
+    return task
+
+def _register_dedup_keys(tasks, task_blob_name, window_seconds, stale):
+    """
+    Registra en el índice de deduplicación la clave de cada tarea que no tenga
+    ya una tarea vigente (las de `stale` se consideran vencidas) y descarta las
+    entradas fuera de la ventana, con una sola escritura condicional.
+    Retorna clave -> entrada {tid, desde, hasta} de la tarea dueña de la clave.
+    """
+    owners = {}
+
+    def register(index):
+        owners.clear()
+        now = datetime.now(timezone.utc)
+        live = {key: entry for key, entry in index.items() if datetime.fromisoformat(entry["hasta"]) > now}
+        changed = len(live) != len(index)
+        since = now.isoformat()
+        until = (now + timedelta(seconds=window_seconds)).isoformat()
+        for task in tasks:
+            key = dedup_key(task)
+            if key in owners:
+                continue
+            entry = live.get(key)
+            if entry is not None and entry["tid"] not in stale:
+                owners[key] = entry
+            else:
+                live[key] = owners[key] = {"tid": task["tid"], "desde": since, "hasta": until}
+                changed = True
+        return live if changed else None
+
+    _update_json(_dedup_blob_name(task_blob_name), register, default={})
+    return owners
+
+def _in_flight(entry, pending):
+    """
+    Indica si la tarea dueña de una clave de deduplicación todavía se está
+    creando: aún no está en el índice de pendientes y registró la clave hace
+    menos de TASK_DEDUP_INFLIGHT_SECONDS. Las entradas sin `desde` (anteriores
+    a este campo) nunca se consideran en creación.
+    """
+    if entry["tid"] in pending or not entry.get("desde"):
+        return False
+    age = datetime.now(timezone.utc) - datetime.fromisoformat(entry["desde"])
+    return age.total_seconds() < TASK_DEDUP_INFLIGHT_SECONDS
+
+def _merge_tickets(duplicates, task_blob_name):
+    """
+    Agrega a cada tarea existente (tid -> bloqueos duplicados) los tickets de sus
+    duplicados. Retorna tid -> tarea actualizada, o None si la tarea ya no existe
+    o dejó de estar abierta.
+    """
+    def merge(tid):
+        open_task, added = [], []
+
+        def apply(current):
+            # Cada reintento parte de cero: la tarea pudo cerrarse entre intentos
+            open_task.clear()
+            if current is None or current.get("status") not in OPEN_STATUSES:
+                return None
+            open_task.append(tid)
+            tickets = current.get("tickets")
+            merged = _add_tickets(current, duplicates[tid])
+            added[:] = merged["tickets"][len(tickets or [None]):]
+            # Los reintentos del mismo ticket no reescriben el registro
+            return None if merged["tickets"] == tickets else merged
+
+        record = _update_json(_record_blob_name(tid, task_blob_name), apply)
+        if not open_task:
+            return None
+        if added:
+            _write_ticket_locations([{"tid": tid, "tickets": added}], task_blob_name)
+        return record
+
+    merged = dict(zip(duplicates, _map_parallel(merge, duplicates)))
+    updated = [tid for tid, record in merged.items() if record is not None]
+    if updated:
+        _sync_pending(updated, task_blob_name)
+    return merged
+
+def add_tasks_deduplicated(tasks, task_blob_name, window_seconds=None):
+    """
+    Agrega las tareas como add_tasks, salvo las que repiten (vdom, service, obj,
+    action) de una tarea abierta registrada dentro de la ventana: en lugar de
+    crear otra tarea, su ticket se agrega a `tickets` de la existente. Los
+    duplicados dentro del mismo lote se fusionan en memoria. Si la tarea
+    existente todavía se está creando (ver _in_flight) se espera con backoff a
+    que llegue al índice de pendientes antes de fusionar. Retorna, en el mismo
+    orden, (tarea guardada, True si se creó) por cada tarea recibida.
+    """
+    window_seconds = TASK_DEDUP_WINDOW_SECONDS if window_seconds is None else window_seconds
+    if window_seconds <= 0:
+        add_tasks(tasks, task_blob_name)
+        return [(task, True) for task in tasks]
+
+    results = [None] * len(tasks)
+    remaining = list(range(len(tasks)))
+    stale = set()
+    attempt = 0
+    while remaining:
+        owners = _register_dedup_keys([tasks[position] for position in remaining], task_blob_name, window_seconds, stale)
+        created, duplicates, entries = {}, {}, {}
+        for position in remaining:
+            task = tasks[position]
+            entry = owners[dedup_key(task)]
+            owner = entry["tid"]
+            if owner == task["tid"]:
+                created[owner] = task
+                results[position] = (task, True)
+            else:
+                duplicates.setdefault(owner, []).append(position)
+                entries[owner] = entry
+        for owner in [owner for owner in duplicates if owner in created]:
+            positions = duplicates.pop(owner)
+            _add_tickets(created[owner], [tasks[position] for position in positions])
+            for position in positions:
+                results[position] = (created[owner], False)
+        add_tasks(list(created.values()), task_blob_name)
+
+        # Una tarea dueña que otro proceso todavía está creando no se toca: su
+        # registro puede no existir aún y su creación escribe el índice de
+        # pendientes con la copia que tiene en memoria. Si su registro ya está
+        # cerrado no está en creación sino que terminó (se reclamó y finalizó).
+        waiting = {}
+        if duplicates:
+            pending, _ = _fetch_json(_pending_blob_name(task_blob_name))
+            candidates = [owner for owner in duplicates if _in_flight(entries[owner], pending or {})]
+            finished = {
+                task["tid"] for task in _read_records(candidates, task_blob_name, max_staleness=0)
+                if task.get("status") not in OPEN_STATUSES
+            }
+            waiting = {owner: duplicates.pop(owner) for owner in candidates if owner not in finished}
+        merged = _merge_tickets(
+            {owner: [tasks[position] for position in positions] for owner, positions in duplicates.items()}, task_blob_name
+        )
+        remaining = [position for positions in waiting.values() for position in positions]
+        for owner, positions in duplicates.items():
+            if merged[owner] is None:
+                # La tarea registrada terminó o no llegó a guardarse: la clave se reasigna
+                stale.add(owner)
+                remaining.extend(positions)
+            else:
+                for position in positions:
+                    results[position] = (merged[owner], False)
+        remaining.sort()
+        if waiting:
+            task_metrics.count("duplicados.espera")
+            _conflict_backoff(attempt)
+            attempt += 1
+    return results
+
+def add_task_deduplicated(task, task_blob_name, window_seconds=None):
+    """
+    Versión de add_task con deduplicación (ver add_tasks_deduplicated).
+    Retorna (tarea guardada, True si se creó).
+    """
+    return add_tasks_deduplicated([task], task_blob_name, window_seconds)[0]
 
 def delete_task(tid, task_blob_name):
     """
-    Elimina una tarea del archivo JSON correspondient basado en su tid.
+    Elimina una tarea basado en su tid: registra el evento de eliminación, la
+    quita del índice de pendientes (y de la caché de estados finales) y borra
+    su registro y sus entradas de los índices de tids y de tickets.
     """
-    tasks = load_all_tasks(task_blob_name)
-    tasks = [task for task in tasks if task.get("tid") != tid]
-    save_all_tasks(tasks, task_blob_name)
+    def unregister(index):
+        return index if index.pop(tid, None) is not None else None
+
+    record, _ = _fetch_json(_record_blob_name(tid, task_blob_name))
+    _append_events(task_blob_name, [_event("eliminada", tid)])
+    _update_pending(task_blob_name, unregister)
+    _sync_final_statuses([(tid, (record or {}).get("status"), None)])
+    if record is not None:
+        _delete_ticket_locations([record])
+    _delete_blob(_record_blob_name(tid, task_blob_name))
+    _delete_blob(_tid_blob_name(tid))
 
 def get_task(tid, task_blob_name):
     """
-    Obtiene una tarea del archivo JSON por su tid.
+    Obtiene una tarea por su tid leyendo directamente su registro.
     """
-    tasks = load_all_tasks(task_blob_name)
-    
-    # Buscar coincidencia exacta en tid o en historical_tids
-    for task in tasks:
-        if task.get("tid") == tid:
-            return task    
-    return None
+    _ensure_migrated(task_blob_name)
+    try:
+        return _read_json(_record_blob_name(tid, task_blob_name))
+    except Exception as e:
+        logging.warning(f"Error al cargar la tarea {tid} desde {task_blob_name}: {e}")
+        return None
 
 def update_task(updated_task, task_blob_name):
     """
-    Actualiza una tarea existente en el archivo JSON.
+    Actualiza una tarea existente. El registro se fusiona sobre su versión más
+    reciente, si cambió el estado se agrega un evento al registro y el índice
+    de pendientes se sincroniza; las escrituras son condicionales y se
+    reintentan ante conflictos.
     """
-    tasks = load_all_tasks(task_blob_name)
-    for i, task in enumerate(tasks):
-        if task.get("tid") == updated_task.get("tid"):
-            tasks[i] = updated_task
-            break
-    save_all_tasks(tasks, task_blob_name)
+    tid = updated_task.get("tid")
+    previous = {}
+
+    def merge(current):
+        previous["status"] = current.get("status")
+        return {**current, **updated_task}
 
-# Funciones para el bloqueo usando Blob Locking
-def acquire_lock():
+    record = _update_json(_record_blob_name(tid, task_blob_name), merge, default={})
+    if previous.get("status") != record.get("status"):
+        _append_events(task_blob_name, [_event("estado", tid, status=record.get("status"))])
+    _sync_pending([tid], task_blob_name)
+    _sync_final_statuses([(tid, previous.get("status"), record.get("status"))])
+
+def _merge_records(updates, task_blob_name):
     """
-    Intenta adquirir el bloqueo mediante la creación de un blob exclusivo.
-    Retorna True si se adquiere el lock, False de lo contrario.
+    Fusiona en paralelo actualizaciones parciales sobre los registros existentes
+    (escrituras condicionales). Retorna los registros resultantes en el mismo
+    orden (None si la tarea no existe) y un diccionario tid -> estado anterior.
+    """
+    previous = {}
+
+    def merge(update):
+        def apply(current):
+            if current is None:
+                return None
+            previous[update["tid"]] = current.get("status")
+            return {**current, **update}
+        return _update_json(_record_blob_name(update["tid"], task_blob_name), apply)
+
+    return _map_parallel(merge, updates), previous
+
+def update_tasks(updates, task_blob_name):
+    """
+    Aplica un lote de actualizaciones parciales (diccionarios con `tid`) sobre
+    tareas existentes del mismo vdom. Los registros se fusionan en paralelo, los
+    cambios de estado se agregan al registro con un solo append y el índice de
+    pendientes se actualiza con una sola escritura condicional. Retorna un
+    diccionario tid -> tarea actualizada, o None si la tarea no existe.
+    """
+    records, previous = _merge_records(updates, task_blob_name)
+    results = {update["tid"]: record for update, record in zip(updates, records)}
+    updated = [record for record in records if record is not None]
+    if not updated:
+        return results
+
+    _append_events(task_blob_name, [
+        _event("estado", record["tid"], status=record.get("status"))
+        for record in updated if previous.get(record["tid"]) != record.get("status")
+    ])
+    _sync_pending([record["tid"] for record in updated], task_blob_name)
+    _sync_final_statuses([(record["tid"], previous.get(record["tid"]), record.get("status")) for record in updated])
+    return results
+
+def task_blob_name_from_tid(tid):
+    """
+    Deduce el archivo de lista de un tid con formato {ulid}-{vdom}. El ULID no
+    contiene guiones, así que el vdom es todo lo que sigue al primero (aunque
+    tenga guiones). Retorna None si el tid no tiene ese formato o el vdom no es válido.
+    """
+    _, separator, vdom = tid.partition("-")
+    return f"bloqueos_{vdom}.json" if separator and valid_vdom(vdom) else None
+
+def locate_task(tid):
+    """
+    Retorna el archivo de lista (vdom) donde vive `tid` según el índice de tids.
+    Las entradas no cambian de archivo, así que se sirven desde la caché sin
+    revalidar. Para tareas anteriores al índice se deduce del formato del tid.
+    """
+    location, _ = _fetch_json(_tid_blob_name(tid), max_staleness=float("inf"))
+    if location is not None:
+        return location.get("archivo")
+    return task_blob_name_from_tid(tid)
+
+def _ulid_time_chars(milliseconds, length=ULID_TIME_CHARS):
+    """
+    Codifica milisegundos como los primeros `length` caracteres de un ULID.
+    """
+    chars = []
+    for _ in range(length):
+        chars.append(ULID_ALPHABET[milliseconds & 31])
+        milliseconds >>= 5
+    return "".join(reversed(chars))
+
+def _ulid_range_prefixes(low, high):
+    """
+    Descompone el rango de milisegundos [low, high) en la menor cantidad de
+    prefijos de ULID alineados que lo cubren exactamente, en orden.
+    """
+    prefixes = []
+    while low < high:
+        # El bloque más grande que empieza en `low` y no pasa de `high`
+        digits = 0
+        while (digits < ULID_TIME_CHARS and low % 32 ** (digits + 1) == 0
+               and low + 32 ** (digits + 1) <= high):
+            digits += 1
+        prefixes.append(_ulid_time_chars(low)[:ULID_TIME_CHARS - digits])
+        low += 32 ** digits
+    return prefixes
+
+def list_tids(created_from=None, created_to=None):
+    """
+    Lista en orden de creación los tids del índice creados en
+    [created_from, created_to) (datetimes con zona horaria; None = sin límite).
+    El rango se descompone en prefijos de ULID (ver _ulid_range_prefixes) y se
+    lista cada uno, así que no se recorren punteros fuera del rango.
+    """
+    low = int(created_from.timestamp() * 1000) if created_from else 0
+    high = int(created_to.timestamp() * 1000) if created_to else 32 ** ULID_TIME_CHARS
+    prefix = f"{TASK_TIDS_DIR}/"
+    tids = []
+    for time_prefix in _ulid_range_prefixes(low, high):
+        for blob in get_container_client().list_blobs(name_starts_with=f"{prefix}{time_prefix}"):
+            tids.append(blob.name[len(prefix):-len(".json")])
+    return tids
+
+def rebuild_tid_index(task_blob_name):
+    """
+    Registra en el índice de tids todas las tareas del vdom. Sirve para
+    completar el índice con tareas creadas antes de que existiera.
+    """
+    tids = list(_load_index(task_blob_name))
+    _write_tid_locations(tids, task_blob_name)
+    return len(tids)
+
+def list_ticket_tids(ticket):
+    """
+    Retorna los tids indexados bajo `ticket` (sin distinguir mayúsculas), en
+    orden de creación, listando un solo prefijo del índice de tickets. Puede
+    incluir tareas ya eliminadas o que perdieron el ticket: quien resuelve los
+    tids debe confirmarlo con task_tickets.
+    """
+    prefix = _ticket_prefix(ticket)
+    return [blob.name[len(prefix):-len(".json")] for blob in get_container_client().list_blobs(name_starts_with=prefix)]
+
+def rebuild_ticket_index(task_blob_name):
+    """
+    Registra en el índice de tickets todas las tareas vigentes del vdom. Sirve
+    para completar el índice con tareas creadas antes de que existiera.
+    """
+    count = 0
+    batch = []
+    for task in iter_all_tasks(task_blob_name):
+        batch.append(task)
+        if len(batch) >= TASK_STREAM_BATCH:
+            _write_ticket_locations(batch, task_blob_name)
+            count += len(batch)
+            batch.clear()
+    _write_ticket_locations(batch, task_blob_name)
+    return count + len(batch)
+
+def _encode_cursor(floor, offsets):
+    document = json.dumps({"desde": floor, "segmentos": offsets}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(document.encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor):
+    try:
+        document = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return document["desde"], {segment: int(offset) for segment, offset in document["segmentos"].items()}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+def _fold_pending_changes(events, task_blob_name):
+    """
+    Reduce eventos al último cambio por tarea: tareas que (ahora) están
+    pendientes y tids que dejaron de estarlo, en orden del registro.
+    """
+    latest = {}
+    for event in events:
+        if event.get("tipo") in ("creada", "estado", "eliminada", "archivada"):
+            latest.pop(event.get("tid"), None)
+            latest[event.get("tid")] = event
+    pending, retired, reload = [], [], []
+    for tid, event in latest.items():
+        kind = event["tipo"]
+        if kind == "creada" and event.get("tarea", {}).get("status") == PENDING_STATUS:
+            pending.append(event["tarea"])
+        elif kind == "estado" and event.get("status") == PENDING_STATUS:
+            # Volvió a pendiente: el evento no trae la tarea completa
+            reload.append(tid)
+        else:
+            retired.append(tid)
+    pending.extend(task for task in _read_records(reload, task_blob_name) if task.get("status") == PENDING_STATUS)
+    return pending, retired
+
+def load_pending_changes(task_blob_name, cursor=None):
+    """
+    Feed de cambios de las tareas pendientes del vdom. Sin cursor (o con uno
+    inválido o más viejo que la ventana de sellado) retorna todas las pendientes
+    y `completo` True; con cursor retorna sólo las tareas que pasaron a estar
+    pendientes y los tids que dejaron de estarlo desde entonces. El cursor es
+    opaco: el offset leído de cada segmento del registro de eventos, así que una
+    consulta sin cambios sólo lista los segmentos y una con cambios descarga
+    sólo los bytes agregados. Retorna {"cursor", "pendientes", "retiradas", "completo"}.
+    """
+    _ensure_migrated(task_blob_name)
+    now = datetime.now(timezone.utc)
+    sealed_before = _segment_name(now - timedelta(hours=TASK_LOG_SEAL_HOURS))
+    resync_before = _segment_name(now - timedelta(hours=2 * TASK_LOG_SEAL_HOURS))
+    prefix = _events_prefix(task_blob_name)
+    listed = {blob.name[len(prefix):]: blob.size for blob in get_container_client().list_blobs(name_starts_with=prefix)}
+    decoded = _decode_cursor(cursor) if cursor else None
+
+    if decoded is None or decoded[0] < resync_before:
+        # El cursor se toma antes de leer las pendientes: un cambio concurrente
+        # puede repetirse en la siguiente consulta, pero no perderse.
+        pending = _read_json(_pending_blob_name(task_blob_name), default={}, max_staleness=0)
+        return {
+            "cursor": _encode_cursor(sealed_before, listed),
+            "pendientes": available_tasks(pending),
+            "retiradas": [],
+            "completo": True
+        }
+
+    floor, offsets = decoded
+    events = []
+    for segment in sorted(set(listed) | set(offsets)):
+        if segment < floor and segment not in offsets:
+            continue
+        start = offsets.get(segment, 0)
+        if segment in listed:
+            blob_name, size = f"{prefix}{segment}", listed[segment]
+        else:
+            # Se compactó y movió a auditoria/ desde la consulta anterior
+            blob_name = f"{_audit_prefix(task_blob_name)}{segment}"
+            try:
+                size = get_container_client().get_blob_client(blob_name).get_blob_properties().size
+            except ResourceNotFoundError:
+                continue
+        if size > start:
+            segment_events, start = _download_events(blob_name, start, size)
+            events.extend(segment_events)
+        if segment in listed:
+            listed[segment] = start
+    pending, retired = _fold_pending_changes(events, task_blob_name)
+    return {
+        "cursor": _encode_cursor(sealed_before, listed),
+        "pendientes": pending,
+        "retiradas": retired,
+        "completo": False
+    }
+
+def _lease_expired(task, now):
+    lease_until = task.get("lease_until")
+    return not lease_until or datetime.fromisoformat(lease_until) <= now
+
+def _is_available(task, now):
+    status = task.get("status")
+    return status == PENDING_STATUS or (status == CLAIMED_STATUS and _lease_expired(task, now))
+
+def available_tasks(pending):
+    """
+    Tareas del índice de pendientes que un ejecutor puede tomar: las pendientes y
+    las reclamadas con el lease vencido, que se presentan otra vez como pendientes.
+    """
+    now = datetime.now(timezone.utc)
+    available = []
+    for task in pending.values():
+        if task.get("status") == PENDING_STATUS:
+            available.append(dict(task))
+        elif _is_available(task, now):
+            available.append({**task, "status": PENDING_STATUS, "claimed_by": None, "lease_until": None})
+    return available
+
+def claim_tasks(task_blob_name, owner, limit=1, lease_seconds=None):
+    """
+    Reclama para `owner` hasta `limit` tareas disponibles del vdom (pendientes o
+    con el lease vencido), en orden de llegada: pasan a in_progress con
+    `claimed_by`, `lease_until` y `attempts`. La selección es una sola escritura
+    condicional del índice de pendientes, así que dos ejecutores nunca obtienen
+    la misma tarea. Retorna las tareas reclamadas.
+    """
+    lease_seconds = TASK_CLAIM_LEASE_SECONDS if lease_seconds is None else lease_seconds
+    claimed = []
+
+    def claim(pending):
+        claimed.clear()
+        now = datetime.now(timezone.utc)
+        lease_until = (now + timedelta(seconds=lease_seconds)).isoformat()
+        for tid, task in pending.items():
+            if len(claimed) >= limit:
+                break
+            if _is_available(task, now):
+                task.update(status=CLAIMED_STATUS, claimed_by=owner, lease_until=lease_until,
+                            attempts=task.get("attempts", 0) + 1)
+                claimed.append(dict(task))
+        return pending if claimed else None
+
+    _update_pending(task_blob_name, claim)
+    if claimed:
+        _merge_records([
+            {key: task[key] for key in ("tid", "status", "claimed_by", "lease_until", "attempts")} for task in claimed
+        ], task_blob_name)
+        _append_events(task_blob_name, [
+            _event("estado", task["tid"], status=CLAIMED_STATUS, claimed_by=owner) for task in claimed
+        ])
+    return claimed
+
+def complete_claim(tid, owner, status, task_blob_name, **fields):
+    """
+    Finaliza una tarea reclamada por `owner` con `status`: un estado final la
+    quita del índice de pendientes y pending la libera para otro ejecutor.
+    Sólo se aplica si el reclamo sigue siendo de `owner` (aunque su lease haya
+    vencido, mientras nadie más la haya reclamado). Retorna la tarea
+    actualizada, o None si el reclamo ya no es de `owner`.
+    """
+    update = {"tid": tid, "status": status, "lease_until": None, **fields}
+    if status == PENDING_STATUS:
+        update["claimed_by"] = None
+    held = []
+
+    def finish(pending):
+        task = pending.get(tid)
+        if task is None or task.get("status") != CLAIMED_STATUS or task.get("claimed_by") != owner:
+            return None
+        held.append(tid)
+        if status in OPEN_STATUSES:
+            pending[tid] = {**task, **update}
+        else:
+            del pending[tid]
+        return pending
+
+    _update_pending(task_blob_name, finish)
+    if not held:
+        return None
+    (record,), previous = _merge_records([update], task_blob_name)
+    _append_events(task_blob_name, [_event("estado", tid, status=status)])
+    _sync_final_statuses([(tid, previous.get(tid), status)])
+    return record
+
+def release_expired_claims(task_blob_name):
+    """
+    Devuelve a pending las tareas reclamadas cuyo lease venció. Retorna la cantidad liberada.
+    """
+    released = []
+
+    def release(pending):
+        released.clear()
+        now = datetime.now(timezone.utc)
+        for tid, task in pending.items():
+            if task.get("status") == CLAIMED_STATUS and _lease_expired(task, now):
+                task.update(status=PENDING_STATUS, claimed_by=None, lease_until=None)
+                released.append(tid)
+        return pending if released else None
+
+    _update_pending(task_blob_name, release)
+    if released:
+        _merge_records([
+            {"tid": tid, "status": PENDING_STATUS, "claimed_by": None, "lease_until": None} for tid in released
+        ], task_blob_name)
+        _append_events(task_blob_name, [_event("estado", tid, status=PENDING_STATUS) for tid in released])
+        logging.info(f"Liberadas {len(released)} tareas con lease vencido en {task_blob_name}")
+    return len(released)
+
+def release_all_expired_claims():
+    """
+    Libera los leases vencidos de todos los vdoms. Retorna archivo -> cantidad
+    liberada; un error en un vdom se registra (su resultado queda en None) sin
+    interrumpir los demás.
+    """
+    results = {}
+    for task_blob_name in list_task_blob_names():
+        try:
+            results[task_blob_name] = release_expired_claims(task_blob_name)
+        except Exception as e:
+            logging.error(f"Error al liberar los leases vencidos de {task_blob_name}: {e}")
+            results[task_blob_name] = None
+    return results
+
+def load_pending_tasks(task_blob_name):
+    """
+    Carga sólo las tareas pendientes del vdom desde su índice de pendientes,
+    sin recorrer el historial completo. Si ocurre un error, retorna una lista vacía.
     """
-    blob_client = container_client.get_blob_client(LOCK_BLOB_NAME)
     try:
-        # Se intenta crear el blob sin sobreescribir (overwrite=False)
-        blob_client.upload_blob(json.dumps({"locked": True, "timestamp": str(datetime.utcnow())}), overwrite=False)
-        return True
-    except Exception:
-        # Si ya existe, se asume que otro proceso tiene el lock.
+        _ensure_migrated(task_blob_name)
+        pending, _ = _fetch_json(_pending_blob_name(task_blob_name), TASK_CACHE_MAX_STALENESS_SECONDS)
+        return available_tasks(pending or {})
+    except Exception as e:
+        logging.warning(f"Error al cargar tareas pendientes desde {task_blob_name}: {e}")
+        return []
+
+# Funciones para el bloqueo usando Blob Locking.
+# Se mantienen por compatibilidad sobre el gestor de leases de blob_locks:
+# cada clave es un shard independiente con expiración y fencing token.
+# Leases adquiridos por este proceso mediante acquire_lock, por clave
+_held_leases = {}
+
+def acquire_lock(key=LOCK_KEY, lease_seconds=None, wait_seconds=0):
+    """
+    Intenta adquirir el bloqueo de `key` (por defecto el bloqueo global).
+    Retorna True si se adquiere el lock, False de lo contrario.
+    """
+    import blob_locks
+    lease = blob_locks.acquire(key, lease_seconds=lease_seconds, wait_seconds=wait_seconds)
+    if lease is None:
         return False
+    _held_leases[key] = lease
+    return True
 
-def release_lock():
+def release_lock(key=LOCK_KEY):
     """
-    Libera el bloqueo eliminando el blob de lock.
+    Libera el bloqueo de `key`. Si este proceso no lo tiene, fuerza su liberación.
     """
-    blob_client = container_client.get_blob_client(LOCK_BLOB_NAME)
+    import blob_locks
+    lease = _held_leases.pop(key, None)
     try:
-        blob_client.delete_blob()
+        if lease is None:
+            blob_locks.force_release(key)
+        else:
+            blob_locks.release(lease)
     except Exception as e:
         logging.warning(f"Error liberando lock: {e}")
-        
+
 if __name__ == "__main__":
-    release_lock()
\ No newline at end of file
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "migrar":
+        print(json.dumps(migrate_all_task_lists(delete_legacy="--borrar" in sys.argv), indent=4))
+    elif len(sys.argv) > 1 and sys.argv[1] == "indexar-tids":
+        print(json.dumps({name: rebuild_tid_index(name) for name in list_task_blob_names()}, indent=4))
+    elif len(sys.argv) > 1 and sys.argv[1] == "indexar-tickets":
+        print(json.dumps({name: rebuild_ticket_index(name) for name in list_task_blob_names()}, indent=4))
+    else:
+        release_lock()
\ No newline at end of file
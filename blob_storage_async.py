@@ -0,0 +1,260 @@
+import os
+import asyncio
+import logging
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotFoundError, ResourceNotModifiedError
+
+import blob_storage
+import task_codec
+import task_metrics
+import task_retention
+import task_status_cache
+
+# Versión asyncio de la API de almacenamiento. Las lecturas del camino caliente
+# (registro de una tarea, índice de pendientes, archivo) usan el cliente async de
+# Blob Storage con un pool de conexiones compartido por todo el proceso y la
+# misma caché en proceso (con revalidación por ETag) que blob_storage. Las
+# mutaciones reutilizan la lógica de escrituras condicionales con reintentos de
+# blob_storage en un hilo, para no duplicarla.
+ASYNC_POOL_SIZE = int(os.getenv("ASYNC_POOL_SIZE", "100"))
+# Vdoms (o tareas de un ticket) consultados a la vez por las consultas agregadas
+AGGREGATE_CONCURRENCY = int(os.getenv("AGGREGATE_CONCURRENCY", "16"))
+
+_service_client = None
+_container_client = None
+
+
+async def _get_container_client():
+    """
+    Crea (una sola vez por proceso) el cliente async de Blob Storage con un
+    pool de conexiones aiohttp compartido. No hay awaits durante la creación,
+    así que no hace falta un lock dentro del event loop.
+    """
+    global _service_client, _container_client
+    if _container_client is None:
+        blob_storage._check_settings()
+        import aiohttp
+        from azure.core.pipeline.transport import AioHttpTransport
+        from azure.storage.blob.aio import BlobServiceClient
+
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=ASYNC_POOL_SIZE))
+        transport = AioHttpTransport(session=session, session_owner=True)
+        _service_client = BlobServiceClient.from_connection_string(
+            blob_storage.AZURE_STORAGE_CONNECTION_STRING, transport=transport
+        )
+        _container_client = _service_client.get_container_client(blob_storage.AZURE_CONTAINER_NAME)
+    return _container_client
+
+async def close():
+    """
+    Cierra el cliente async y su pool de conexiones.
+    """
+    global _service_client, _container_client
+    if _service_client is not None:
+        await _service_client.close()
+    _service_client = None
+    _container_client = None
+
+async def _ensure_migrated(task_blob_name):
+    if task_blob_name not in blob_storage._migrated_task_lists:
+        await asyncio.to_thread(blob_storage._ensure_migrated, task_blob_name)
+
+async def _fetch_json(blob_name, max_staleness=0):
+    """
+    Equivalente async de blob_storage._fetch_json: lectura read-through con GET
+    condicional sobre la caché compartida. Retorna (valor, etag) compartidos con
+    la caché (no modificar), o (None, None) si el blob no existe. Con los
+    backends memoria y local se usa la lectura síncrona (inmediata o en un hilo).
+    """
+    entry = blob_storage._cache_get(blob_name)
+    if entry is not None and max_staleness and blob_storage.time.monotonic() - entry[2] <= max_staleness:
+        blob_storage._cache_count("hits")
+        return entry[0], entry[1]
+    if blob_storage.TASK_BACKEND == "memoria":
+        return blob_storage._fetch_json(blob_name, max_staleness)
+    if blob_storage.TASK_BACKEND != "azure":
+        return await asyncio.to_thread(blob_storage._fetch_json, blob_name, max_staleness)
+    container_client = await _get_container_client()
+    blob_client = container_client.get_blob_client(blob_name)
+    with task_metrics.timer("storage.descarga"):
+        try:
+            if entry is None:
+                downloader = await blob_client.download_blob()
+            else:
+                downloader = await blob_client.download_blob(etag=entry[1], match_condition=MatchConditions.IfModified)
+            data = await downloader.readall()
+        except ResourceNotModifiedError:
+            blob_storage._cache_count("revalidated")
+            blob_storage._cache_put(blob_name, entry[0], entry[1])
+            return entry[0], entry[1]
+        except ResourceNotFoundError:
+            blob_storage._cache_invalidate(blob_name)
+            blob_storage._cache_count("misses")
+            return None, None
+    task_metrics.count("bytes.descargados", len(data))
+    with task_metrics.timer("serializacion.decodificar"):
+        value = task_codec.decode(data)
+    etag = downloader.properties.etag
+    blob_storage._cache_count("misses")
+    blob_storage._cache_put(blob_name, value, etag)
+    return value, etag
+
+async def locate_task(tid):
+    """
+    Retorna el archivo de lista (vdom) donde vive `tid` según el índice de tids,
+    o el deducido del formato del tid si no está indexado.
+    """
+    try:
+        location, _ = await _fetch_json(blob_storage._tid_blob_name(tid), max_staleness=float("inf"))
+    except Exception as e:
+        logging.warning(f"Error al buscar {tid} en el índice de tids: {e}")
+        location = None
+    if location is not None:
+        return location.get("archivo")
+    return blob_storage.task_blob_name_from_tid(tid)
+
+async def get_task(tid, task_blob_name):
+    """
+    Obtiene una tarea por su tid leyendo directamente su registro.
+    """
+    try:
+        await _ensure_migrated(task_blob_name)
+        task, _ = await _fetch_json(
+            blob_storage._record_blob_name(tid, task_blob_name), blob_storage.TASK_CACHE_MAX_STALENESS_SECONDS
+        )
+        return None if task is None else dict(task)
+    except Exception as e:
+        logging.warning(f"Error al cargar la tarea {tid} desde {task_blob_name}: {e}")
+        return None
+
+async def get_final_status(tid):
+    """
+    Retorna el estado final cacheado de `tid` (ver task_status_cache), o None.
+    """
+    status = task_status_cache._local_get(tid)
+    if status is not None:
+        task_metrics.count("estados_finales.local")
+        return status
+    if task_status_cache._shard_missing(task_status_cache._shard_name(tid)):
+        return None
+    try:
+        shard, _ = await _fetch_json(task_status_cache._shard_name(tid), task_status_cache.FINAL_STATUS_LOCAL_TTL_SECONDS)
+    except Exception as e:
+        logging.warning(f"Error al consultar la caché de estados finales para {tid}: {e}")
+        return None
+    return task_status_cache._from_shard(shard, tid)
+
+async def get_archived_task(tid, task_blob_name):
+    """
+    Obtiene una tarea archivada por su tid a través del índice de archivo.
+    """
+    try:
+        locations, _ = await _fetch_json(task_retention._archive_index_name(tid, task_blob_name))
+        segment = (locations or {}).get(tid)
+        if segment is None:
+            return None
+        archived, _ = await _fetch_json(task_retention._archive_segment_name(segment, task_blob_name))
+        task = (archived or {}).get(tid)
+        return None if task is None else dict(task)
+    except Exception as e:
+        logging.warning(f"Error al buscar la tarea archivada {tid} en {task_blob_name}: {e}")
+        return None
+
+async def load_pending_tasks(task_blob_name):
+    """
+    Carga sólo las tareas pendientes del vdom desde su índice de pendientes.
+    Si ocurre un error, retorna una lista vacía.
+    """
+    try:
+        await _ensure_migrated(task_blob_name)
+        pending, _ = await _fetch_json(
+            blob_storage._pending_blob_name(task_blob_name), blob_storage.TASK_CACHE_MAX_STALENESS_SECONDS
+        )
+        return blob_storage.available_tasks(pending or {})
+    except Exception as e:
+        logging.warning(f"Error al cargar tareas pendientes desde {task_blob_name}: {e}")
+        return []
+
+async def _gather_limited(function, items):
+    """
+    Aplica la corrutina `function` a cada elemento, con a lo sumo
+    AGGREGATE_CONCURRENCY en curso. Retorna los resultados en el mismo orden.
+    """
+    semaphore = asyncio.Semaphore(AGGREGATE_CONCURRENCY)
+
+    async def run(item):
+        async with semaphore:
+            return await function(item)
+
+    return await asyncio.gather(*(run(item) for item in items))
+
+async def summarize_tasks(task_blob_names=None):
+    """
+    Resume las tareas de los vdoms indicados (por defecto, todos) consultando
+    sus contadores en paralelo. Retorna (resumen total, nombre -> resumen);
+    el resumen de un vdom que falla es None y no suma al total.
+    """
+    if task_blob_names is None:
+        task_blob_names = await asyncio.to_thread(blob_storage.list_task_blob_names)
+
+    async def summarize(task_blob_name):
+        try:
+            return await asyncio.to_thread(blob_storage.summarize_tasks, task_blob_name)
+        except Exception as e:
+            logging.warning(f"Error al resumir las tareas de {task_blob_name}: {e}")
+            return None
+
+    summaries = dict(zip(task_blob_names, await _gather_limited(summarize, task_blob_names)))
+    total = blob_storage.merge_summaries(summary for summary in summaries.values() if summary is not None)
+    return total, summaries
+
+async def find_tasks_by_ticket(ticket):
+    """
+    Retorna las tareas (vigentes o archivadas) asociadas a `ticket` a través
+    del índice de tickets, resolviendo sus registros en paralelo.
+    """
+    tids = await asyncio.to_thread(blob_storage.list_ticket_tids, ticket)
+    normalized = blob_storage._normalize_ticket(ticket)
+
+    async def resolve(tid):
+        task_blob_name = await locate_task(tid)
+        if not task_blob_name:
+            return None
+        task = await get_task(tid, task_blob_name) or await get_archived_task(tid, task_blob_name)
+        return task if task and normalized in blob_storage.task_tickets(task) else None
+
+    return [task for task in await _gather_limited(resolve, tids) if task is not None]
+
+async def load_pending_changes(task_blob_name, cursor=None):
+    return await asyncio.to_thread(blob_storage.load_pending_changes, task_blob_name, cursor)
+
+async def claim_tasks(task_blob_name, owner, limit=1, lease_seconds=None):
+    return await asyncio.to_thread(blob_storage.claim_tasks, task_blob_name, owner, limit, lease_seconds)
+
+async def complete_claim(tid, owner, status, task_blob_name, **fields):
+    return await asyncio.to_thread(blob_storage.complete_claim, tid, owner, status, task_blob_name, **fields)
+
+async def load_all_tasks(task_blob_name):
+    return await asyncio.to_thread(blob_storage.load_all_tasks, task_blob_name)
+
+async def add_task(task, task_blob_name):
+    await asyncio.to_thread(blob_storage.add_task, task, task_blob_name)
+
+async def add_tasks(tasks, task_blob_name):
+    await asyncio.to_thread(blob_storage.add_tasks, tasks, task_blob_name)
+
+async def add_task_deduplicated(task, task_blob_name, window_seconds=None):
+    return await asyncio.to_thread(blob_storage.add_task_deduplicated, task, task_blob_name, window_seconds)
+
+async def add_tasks_deduplicated(tasks, task_blob_name, window_seconds=None):
+    return await asyncio.to_thread(blob_storage.add_tasks_deduplicated, tasks, task_blob_name, window_seconds)
+
+async def update_task(updated_task, task_blob_name):
+    await asyncio.to_thread(blob_storage.update_task, updated_task, task_blob_name)
+
+async def update_tasks(updates, task_blob_name):
+    return await asyncio.to_thread(blob_storage.update_tasks, updates, task_blob_name)
+
+async def delete_task(tid, task_blob_name):
+    await asyncio.to_thread(blob_storage.delete_task, tid, task_blob_name)
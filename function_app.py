@@ -1,28 +1,54 @@
 import azure.functions as func
 import logging
-import requests
 import json
 import os
 from dotenv import load_dotenv
 from ulid import ULID
-import jwt 
-import threading
-import time
+import asyncio
 from datetime import datetime, timezone
-import random
 
 from typing import List, Dict, Any, Optional
 
 # Importar funciones de Blob Storage
-from blob_storage import (
-    add_task, get_task, delete_task, update_task,
-    load_all_tasks, save_all_tasks, acquire_lock, release_lock
+from blob_storage import cache_stats, compact_all_task_logs, release_all_expired_claims, valid_vdom
+# Versiones async de la API de almacenamiento: no bloquean el event loop del worker
+from blob_storage_async import (
+    add_tasks_deduplicated, get_task, update_task, update_tasks, load_pending_tasks, load_pending_changes,
+    get_archived_task, get_final_status, locate_task, claim_tasks, complete_claim, summarize_tasks, find_tasks_by_ticket
 )
+from task_retention import archive_all_finished_tasks
+import task_admission
+import task_metrics
+import task_status_cache
+from task_metrics import instrumented
 
 load_dotenv()
 
 app = func.FunctionApp(http_auth_level=func.AuthLevel.ANONYMOUS)
 
+# Campos obligatorios de un bloqueo recibido por el orquestador
+REQUIRED_TASK_FIELDS = ["service", "vdom", "obj", "gdr", "ticket", "action"]
+# Estados validos de una tarea
+VALID_STATUSES = ["pending", "executed", "failed"]
+# Frecuencia (NCRONTAB) de la compactación del registro de eventos
+TASK_LOG_COMPACT_SCHEDULE = os.getenv("TASK_LOG_COMPACT_SCHEDULE", "0 */15 * * * *")
+# Frecuencia (NCRONTAB) de la retención de tareas terminadas
+TASK_RETENTION_SCHEDULE = os.getenv("TASK_RETENTION_SCHEDULE", "0 30 3 * * *")
+# Cantidad máxima de bloqueos (o actualizaciones) aceptados por lote
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1000"))
+# Espera máxima (segundos) de una consulta long-poll a pending_changes
+FEED_MAX_WAIT_SECONDS = float(os.getenv("FEED_MAX_WAIT_SECONDS", "25"))
+# Intervalo (segundos) entre lecturas del registro mientras se espera un cambio
+FEED_POLL_SECONDS = float(os.getenv("FEED_POLL_SECONDS", "1"))
+# Lease máximo (segundos) que un ejecutor puede pedir al reclamar tareas
+CLAIM_MAX_LEASE_SECONDS = int(os.getenv("CLAIM_MAX_LEASE_SECONDS", "3600"))
+# Frecuencia (NCRONTAB) con la que se liberan los leases vencidos
+TASK_CLAIM_RELEASE_SCHEDULE = os.getenv("TASK_CLAIM_RELEASE_SCHEDULE", "0 */1 * * * *")
+# Encabezado con la identidad autenticada del llamador para los límites de ingesta,
+# puesto por la plataforma (p. ej. x-ms-client-principal-id con App Service
+# Authentication, que descarta el que envía el cliente). Vacío: se usa su IP.
+INGEST_CALLER_HEADER = os.getenv("INGEST_CALLER_HEADER", "")
+
 def generate_jwt_token():
     """
     Genera un token JWT usando la clave secreta definida en la variable de entorno JWT_SECRET.
@@ -32,6 +58,8 @@ def generate_jwt_token():
         logging.error("JWT_SECRET no definida en las variables de entorno.")
         
         return None
+    import jwt  # sólo se carga si se necesita un token
+
     payload = {"sub": "orquestador"}
     token = jwt.encode(payload, jwt_secret, algorithm="HS256")
     return token
@@ -48,6 +76,70 @@ def task_generator(vdom):
     }
     return task_d
 
+def build_task(req_body: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Valida un bloqueo recibido y genera la tarea correspondiente.
+    Lanza ValueError si el bloqueo no es un objeto, le faltan campos obligatorios
+    o su vdom no es válido.
+    """
+    if not isinstance(req_body, dict):
+        raise ValueError("El bloqueo debe ser un objeto JSON")
+    if not all(req_body.get(field) for field in REQUIRED_TASK_FIELDS):
+        raise ValueError("Faltan campos obligatorios")
+    if not valid_vdom(req_body["vdom"]):
+        raise ValueError("El vdom sólo puede tener letras, números, '-' y '_'")
+    task_data = task_generator(req_body["vdom"])
+    task_data.update({field: req_body[field] for field in REQUIRED_TASK_FIELDS})
+    return task_data
+
+def caller_id(req: func.HttpRequest) -> str:
+    """
+    Identifica al llamador para los límites de ingesta: la identidad autenticada
+    de INGEST_CALLER_HEADER (si está configurado) o la última IP de
+    X-Forwarded-For, la que agrega el proxy de la plataforma; las anteriores las
+    puede enviar el cliente. El puerto se descarta, ya que cambia por conexión.
+    """
+    caller = req.headers.get(INGEST_CALLER_HEADER) if INGEST_CALLER_HEADER else None
+    if not caller:
+        caller = (req.headers.get("x-forwarded-for") or "").split(",")[-1].strip()
+        if caller.startswith("["):
+            caller = caller[1:].partition("]")[0]
+        elif caller.count(":") == 1:
+            caller = caller.partition(":")[0]
+    return caller.strip() or "anonimo"
+
+def too_many_requests(retry_after: int, message: str) -> func.HttpResponse:
+    return func.HttpResponse(
+        json.dumps({"error": message, "retry_after": retry_after}),
+        status_code=429,
+        headers={"Retry-After": str(retry_after)},
+        mimetype="application/json"
+    )
+
+def parse_batch_body(body: bytes) -> List[Any]:
+    """
+    Interpreta el cuerpo de un lote como un arreglo JSON o como JSON delimitado
+    por saltos de línea (NDJSON). En NDJSON las líneas inválidas se retornan
+    como instancias de ValueError para reportarlas por ítem.
+    """
+    text = body.decode("utf-8").strip()
+    if not text:
+        raise ValueError("El lote está vacío")
+    if text.startswith("["):
+        items = json.loads(text)
+        if not isinstance(items, list):
+            raise ValueError("El lote debe ser un arreglo JSON o NDJSON")
+        return items
+    items = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            items.append(json.loads(line))
+        except json.JSONDecodeError as e:
+            items.append(ValueError(f"JSON inválido: {e}"))
+    return items
+
 def find_item_by_id(json_data: List[Dict[str, Any]], tid: str) -> Optional[Dict[str, Any]]:
     for item in json_data:
         if item.get("tid") == tid:
@@ -88,41 +180,42 @@ def display_item_by_id(json_str: list, tid: str) -> Dict[str, Any]:
 # Endpoint Orquestador
 # ----------------------------
 @app.route(route="orquestador")
-def orquestador(req: func.HttpRequest) -> func.HttpResponse:
+@instrumented("orquestador")
+async def orquestador(req: func.HttpRequest) -> func.HttpResponse:
+    ulid = str(ULID())  # Genera un ULID único
     try:
         logging.info(f"app-{ulid}-[Exito]-[orquestador de tareas]")
         req_body = req.get_json()
-        
-        service  = req_body.get("service")
-        vdom     = req_body.get("vdom")
-        obj      = req_body.get("obj")
-        gdr      = req_body.get("gdr")
-        ticket   = req_body.get("ticket")
-        action   = req_body.get("action")
-      
-        if not all([service, vdom, obj, gdr, ticket, action]):
-            logging.error(f"app-{ulid}-[Fallo]-[Faltan campos obligatorios]")
+
+        try:
+            task_data = build_task(req_body)
+        except ValueError as e:
+            logging.error(f"app-{ulid}-[Fallo]-[{e}]")
             return func.HttpResponse(
-                json.dumps({"error": "Faltan campos obligatorios"}),
+                json.dumps({"error": str(e)}),
                 status_code=400,
                 mimetype="application/json"
             )
-        
-        task_data = task_generator(vdom)
-        task_data.update(
-            {
-                "vdom": vdom,
-                "service": service,
-                "obj": obj,
-                "gdr": gdr,
-                "ticket": ticket,
-                "action": action
-            }
-        )
-        add_task(task_data, f"bloqueos_{vdom}.json")
-        logging.info(f"app-{ulid}-[Exito]-[Tarea agregada: {task_data}]")
+
+        caller = caller_id(req)
+        retry_after = task_admission.admit(task_data["vdom"], caller)
+        if retry_after is not None:
+            logging.warning(f"app-{ulid}-[Fallo]-[Limite de ingesta excedido para {task_data['vdom']}/{caller}]")
+            return too_many_requests(retry_after, "Límite de ingesta excedido")
+        try:
+            # Los bloqueos concurrentes del mismo vdom se guardan en una sola tanda
+            stored, created = await task_admission.add_task(task_data, f"bloqueos_{task_data['vdom']}.json")
+        except task_admission.QueueFullError as e:
+            # El bloqueo no se encoló: no consume la cuota del vdom ni del llamador
+            task_admission.refund(task_data["vdom"], caller)
+            logging.warning(f"app-{ulid}-[Fallo]-[{e}]")
+            return too_many_requests(e.retry_after, "Cola de escritura llena")
+        if created:
+            logging.info(f"app-{ulid}-[Exito]-[Tarea agregada: {task_data}]")
+        else:
+            logging.info(f"app-{ulid}-[Exito]-[Bloqueo duplicado fusionado en {stored['tid']}: ticket {task_data['ticket']}]")
         return func.HttpResponse(
-            json.dumps(task_data),
+            json.dumps({**stored, "duplicate": not created}),
             status_code=200,
             mimetype="application/json"
         )
@@ -136,11 +229,102 @@ def orquestador(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json"
         )
 
+# ----------------------------
+# Endpoint Orquestador por lotes
+# ----------------------------
+@app.route(route="orquestador_lote", methods=["POST"])
+@instrumented("orquestador_lote")
+async def orquestador_lote(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Recibe muchos bloqueos en un arreglo JSON o en NDJSON. Valida cada uno,
+    los agrupa por vdom y persiste cada grupo con add_tasks_deduplicated (una
+    escritura de índice por vdom; los duplicados se fusionan). Responde el tid o el error de cada ítem, en el mismo orden.
+    Los grupos que exceden el límite de ingesta llevan `retry_after`; si no se
+    admite ninguno se responde 429.
+    """
+    ulid = str(ULID())  # Genera un ULID único
+    logging.info(f"app-{ulid}-[Exito]-[Inicio de orquestador_lote]")
+    try:
+        try:
+            items = parse_batch_body(req.get_body())
+        except ValueError as e:
+            logging.error(f"app-{ulid}-[Fallo]-[Lote inválido: {e}]")
+            return func.HttpResponse(
+                json.dumps({"error": f"Lote inválido: {e}"}),
+                status_code=400,
+                mimetype="application/json"
+            )
+        if len(items) > MAX_BATCH_SIZE:
+            logging.error(f"app-{ulid}-[Fallo]-[Lote de {len(items)} items excede el maximo de {MAX_BATCH_SIZE}]")
+            return func.HttpResponse(
+                json.dumps({"error": f"El lote excede el máximo de {MAX_BATCH_SIZE} bloqueos"}),
+                status_code=413,
+                mimetype="application/json"
+            )
+
+        results = [None] * len(items)
+        groups = {}
+        for position, item in enumerate(items):
+            try:
+                if isinstance(item, ValueError):
+                    raise item
+                task_data = build_task(item)
+            except ValueError as e:
+                results[position] = {"index": position, "error": str(e)}
+                continue
+            groups.setdefault(task_data["vdom"], []).append((position, task_data))
+
+        caller = caller_id(req)
+
+        async def persist(vdom):
+            group = groups[vdom]
+            retry_after = task_admission.admit(vdom, caller, len(group))
+            if retry_after is not None:
+                logging.warning(f"app-{ulid}-[Fallo]-[Limite de ingesta excedido para {vdom}/{caller}]")
+                for position, _ in group:
+                    results[position] = {"index": position, "error": "Límite de ingesta excedido", "retry_after": retry_after}
+                return
+            try:
+                stored = await add_tasks_deduplicated([task_data for _, task_data in group], f"bloqueos_{vdom}.json")
+                for (position, _), (task_data, created) in zip(group, stored):
+                    results[position] = {"index": position, "tid": task_data["tid"], "vdom": vdom, "duplicate": not created}
+            except Exception as e:
+                logging.error(f"app-{ulid}-[Fallo]-[Error guardando lote del vdom {vdom}: {e}]")
+                for position, _ in group:
+                    results[position] = {"index": position, "error": f"Error al guardar: {e}"}
+
+        await asyncio.gather(*(persist(vdom) for vdom in groups))
+
+        accepted = sum(1 for result in results if "tid" in result)
+        logging.info(f"app-{ulid}-[Exito]-[Lote procesado: {accepted}/{len(items)} tareas en {len(groups)} vdoms]")
+        limited = [result["retry_after"] for result in results if "retry_after" in result]
+        if limited and not accepted:
+            # Nada se guardó por los límites: 429 con los resultados por ítem
+            return func.HttpResponse(
+                json.dumps({"accepted": 0, "rejected": len(items), "results": results}),
+                status_code=429,
+                headers={"Retry-After": str(max(limited))},
+                mimetype="application/json"
+            )
+        return func.HttpResponse(
+            json.dumps({"accepted": accepted, "rejected": len(items) - accepted, "results": results}),
+            status_code=200,
+            mimetype="application/json"
+        )
+    except Exception as e:
+        logging.error(f"app-{ulid}-[Fallo]-[Error en orquestador_lote: {e}]")
+        return func.HttpResponse(
+            json.dumps({"error": str(e)}),
+            status_code=500,
+            mimetype="application/json"
+        )
+
 # ----------------------------
 # Endpoint Get Status
 # ----------------------------
 @app.route(route="get_status/{tid}", auth_level=func.AuthLevel.ANONYMOUS)
-def get_status(req: func.HttpRequest) -> func.HttpResponse:
+@instrumented("get_status")
+async def get_status(req: func.HttpRequest) -> func.HttpResponse:
     ulid = str(ULID())  # Genera un ULID único
     logging.info(f"app-{ulid}-[Exito]-[Inicio de get_status]")
     try:
@@ -154,12 +338,20 @@ def get_status(req: func.HttpRequest) -> func.HttpResponse:
                 mimetype="application/json"
             )
         id_to_find = tid
-        tid_separado= id_to_find.split('-')
-        vdom=tid_separado[1]
-        name_file=f"bloqueos_{vdom}.json"
-        sample_json = load_all_tasks(name_file)
-        logging.info(f"app-{ulid}-[Exito]-[Obtencion de Lista de Tareas]")
-        result = display_item_by_id(sample_json, id_to_find)
+        # Las tareas terminadas se responden desde la caché de estados finales
+        status = await get_final_status(id_to_find)
+        if status is not None:
+            task = {"tid": id_to_find, "status": status}
+        else:
+            name_file = await locate_task(id_to_find)
+            task = None
+            if name_file:
+                task = await get_task(id_to_find, name_file) or await get_archived_task(id_to_find, name_file)
+            if task:
+                task_status_cache.remember_final_status(id_to_find, task.get("status"))
+        logging.info(f"app-{ulid}-[Exito]-[Obtencion de Tarea]-[Cache: {cache_stats()}]")
+        with task_metrics.timer("busqueda"):
+            result = display_item_by_id([task] if task else [], id_to_find)
         logging.info(f"app-{ulid}-[Exito]-[Busqueda de tarea especifica de tarea en  Lista de Tareas]")
         logging.info(f"app-{ulid}-[Exito]-[Funcion Finalizada correctamente]")
         return func.HttpResponse(
@@ -180,12 +372,14 @@ def get_status(req: func.HttpRequest) -> func.HttpResponse:
 # Endpoint Update Status
 # ----------------------------
 @app.route(route="update_status", auth_level=func.AuthLevel.ANONYMOUS)
-def update_status(req: func.HttpRequest) -> func.HttpResponse:
+@instrumented("update_status")
+async def update_status(req: func.HttpRequest) -> func.HttpResponse:
     ulid = str(ULID())  # Genera un ULID único
     logging.info(f"app-{ulid}-[Exito]-[Inicio de update_status]")
     try:
         tid = req.params.get("tid")
         new_status = req.params.get("status")
+        owner = req.params.get("owner")
         
         if not tid or not new_status:
             logging.error(f"app-{ulid}-[Fallo]-[error: Parametros 'tid' y 'status' son requeridos]")
@@ -194,7 +388,7 @@ def update_status(req: func.HttpRequest) -> func.HttpResponse:
                 status_code=400,
                 mimetype="application/json"
             )
-        if new_status not in ["pending", "executed", "failed"]:
+        if new_status not in VALID_STATUSES:
             logging.error(f"app-{ulid}-[Fallo]-[El estado debe ser 'pending', 'executed' o 'failed']")
             return func.HttpResponse(
                 json.dumps({"error": "El estado debe ser 'pending', 'executed' o 'failed'"}),
@@ -203,11 +397,9 @@ def update_status(req: func.HttpRequest) -> func.HttpResponse:
             )
         
         id_to_find = tid
-        tid_separado= id_to_find.split('-')
-        vdom=tid_separado[1]
-        name_file=f"bloqueos_{vdom}.json"
+        name_file = await locate_task(id_to_find)
 
-        old_s_task = get_task(id_to_find, name_file)
+        old_s_task = await get_task(id_to_find, name_file) if name_file else None
         # Validacion de que existe
         if not old_s_task:
             logging.error(f"app-{ulid}-[Fallo]-[Tarea no encontrada]")
@@ -217,9 +409,20 @@ def update_status(req: func.HttpRequest) -> func.HttpResponse:
                 mimetype="application/json"
             )
         
-        old_s_task["status"] = new_status
-        old_s_task["updated_at"] = datetime.now(timezone.utc).isoformat()
-        update_task(old_s_task, name_file)
+        updated_at = datetime.now(timezone.utc).isoformat()
+        if owner:
+            # Finaliza el reclamo del ejecutor: falla si su lease venció y otro la reclamó
+            if not await complete_claim(tid, owner, new_status, name_file, updated_at=updated_at):
+                logging.error(f"app-{ulid}-[Fallo]-[La tarea no esta reclamada por {owner}]")
+                return func.HttpResponse(
+                    json.dumps({"error": "La tarea no esta reclamada por este ejecutor"}),
+                    status_code=409,
+                    mimetype="application/json"
+                )
+        else:
+            old_s_task["status"] = new_status
+            old_s_task["updated_at"] = updated_at
+            await update_task(old_s_task, name_file)
         logging.info(f"app-{ulid}-[Exito]-[Funcion Finalizada correctamente]")
         return func.HttpResponse(
             json.dumps({
@@ -238,11 +441,99 @@ def update_status(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json"
         )
 
+# ----------------------------
+# Endpoint Update Status por lotes
+# ----------------------------
+@app.route(route="update_status_lote", methods=["POST"], auth_level=func.AuthLevel.ANONYMOUS)
+@instrumented("update_status_lote")
+async def update_status_lote(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Recibe un arreglo JSON de pares {tid, status}, posiblemente de distintos
+    vdoms. Valida cada par, agrupa por vdom y aplica cada grupo con
+    update_tasks (una escritura condicional de índice por vdom).
+    Responde el resultado de cada tid en el orden recibido.
+    """
+    ulid = str(ULID())  # Genera un ULID único
+    logging.info(f"app-{ulid}-[Exito]-[Inicio de update_status_lote]")
+    try:
+        try:
+            updates = req.get_json()
+        except ValueError:
+            updates = None
+        if not isinstance(updates, list) or not updates:
+            logging.error(f"app-{ulid}-[Fallo]-[El cuerpo debe ser un arreglo JSON de pares tid/status]")
+            return func.HttpResponse(
+                json.dumps({"error": "El cuerpo debe ser un arreglo JSON de pares 'tid'/'status'"}),
+                status_code=400,
+                mimetype="application/json"
+            )
+        if len(updates) > MAX_BATCH_SIZE:
+            logging.error(f"app-{ulid}-[Fallo]-[Lote de {len(updates)} items excede el maximo de {MAX_BATCH_SIZE}]")
+            return func.HttpResponse(
+                json.dumps({"error": f"El lote excede el máximo de {MAX_BATCH_SIZE} actualizaciones"}),
+                status_code=413,
+                mimetype="application/json"
+            )
+
+        results = [None] * len(updates)
+        valid = []
+        updated_at = datetime.now(timezone.utc).isoformat()
+        for position, update in enumerate(updates):
+            tid = update.get("tid") if isinstance(update, dict) else None
+            new_status = update.get("status") if isinstance(update, dict) else None
+            if not tid or not new_status:
+                results[position] = {"tid": tid, "error": "Parametros 'tid' y 'status' son requeridos"}
+            elif new_status not in VALID_STATUSES:
+                results[position] = {"tid": tid, "error": "El estado debe ser 'pending', 'executed' o 'failed'"}
+            else:
+                valid.append((position, {"tid": tid, "status": new_status, "updated_at": updated_at}))
+
+        groups = {}
+        locations = await asyncio.gather(*(locate_task(change["tid"]) for _, change in valid))
+        for (position, change), name_file in zip(valid, locations):
+            if name_file is None:
+                results[position] = {"tid": change["tid"], "error": "Tarea no encontrada"}
+            else:
+                groups.setdefault(name_file, []).append((position, change))
+
+        async def apply(name_file):
+            group = groups[name_file]
+            try:
+                records = await update_tasks([change for _, change in group], name_file)
+            except Exception as e:
+                logging.error(f"app-{ulid}-[Fallo]-[Error actualizando lote de {name_file}: {e}]")
+                for position, change in group:
+                    results[position] = {"tid": change["tid"], "error": f"Error al actualizar: {e}"}
+                return
+            for position, change in group:
+                if records.get(change["tid"]) is None:
+                    results[position] = {"tid": change["tid"], "error": "Tarea no encontrada"}
+                else:
+                    results[position] = {"tid": change["tid"], "status": change["status"]}
+
+        await asyncio.gather(*(apply(name_file) for name_file in groups))
+
+        applied = sum(1 for result in results if "error" not in result)
+        logging.info(f"app-{ulid}-[Exito]-[Lote procesado: {applied}/{len(updates)} actualizaciones en {len(groups)} vdoms]")
+        return func.HttpResponse(
+            json.dumps({"updated": applied, "rejected": len(updates) - applied, "results": results}),
+            status_code=200,
+            mimetype="application/json"
+        )
+    except Exception as e:
+        logging.error(f"app-{ulid}-[Fallo]-[Error en update_status_lote: {e}]")
+        return func.HttpResponse(
+            json.dumps({"error": str(e)}),
+            status_code=500,
+            mimetype="application/json"
+        )
+
 # ----------------------------
 # Endpoint Get Pending Tasks
 # ----------------------------
 @app.route(route="pending_tasks", auth_level=func.AuthLevel.ANONYMOUS)
-def pending_tasks(req: func.HttpRequest) -> func.HttpResponse:
+@instrumented("pending_tasks")
+async def pending_tasks(req: func.HttpRequest) -> func.HttpResponse:
     
     try:
         ulid = str(ULID())  # Genera un ULID único
@@ -258,11 +549,16 @@ def pending_tasks(req: func.HttpRequest) -> func.HttpResponse:
                     status_code=404,
                     mimetype="application/json"
                 )
+        if not valid_vdom(vdom):
+                logging.error(f"app-{ulid}-[Fallo]-[Parametro vdom invalido]")
+                return func.HttpResponse(
+                    json.dumps({"error": "Parametro 'vdom' invalido"}),
+                    status_code=400,
+                    mimetype="application/json"
+                )
         name_file=f"bloqueos_{vdom}.json"
-        tasks = load_all_tasks(name_file)
-        logging.info(f"app-{ulid}-[Exito]-[Obtencion de Lista de Tareas]")
-        pending_tasks = [task for task in tasks if task.get("status") == "pending"]
-        logging.info(f"app-{ulid}-[Exito]-[Obtencion de Lista Filtrada de Tareas]")
+        pending_tasks = await load_pending_tasks(name_file)
+        logging.info(f"app-{ulid}-[Exito]-[Obtencion de Lista de Tareas Pendientes]-[Cache: {cache_stats()}]")
         response= {
             "host": IP_DEL_FIREWALL,
             "token": TOKEN_DE_AUTENTICACION,
@@ -270,8 +566,10 @@ def pending_tasks(req: func.HttpRequest) -> func.HttpResponse:
             "data": pending_tasks
         }
         logging.info(f"app-{ulid}-[Exito]-[Funcion Finalizada correctamente]")
+        with task_metrics.timer("serializacion.respuesta"):
+            body = json.dumps(response)
         return func.HttpResponse(
-            json.dumps(response),
+            body,
             status_code=200,
             mimetype="application/json"
         )
@@ -282,7 +580,300 @@ def pending_tasks(req: func.HttpRequest) -> func.HttpResponse:
             status_code=500,
             mimetype="application/json"
         )
+
+# ----------------------------
+# Endpoint Get Pending Changes (feed / long-poll)
+# ----------------------------
+@app.route(route="pending_changes", auth_level=func.AuthLevel.ANONYMOUS)
+@instrumented("pending_changes")
+async def pending_changes(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Retorna las tareas que pasaron a estar pendientes (data) y los tids que
+    dejaron de estarlo (retiradas) desde `cursor`, junto con el cursor para la
+    siguiente consulta. Sin cursor retorna todas las pendientes. Con `wait`
+    (segundos) espera hasta que haya cambios o se cumpla el plazo.
+    """
+    try:
+        ulid = str(ULID())  # Genera un ULID único
+        logging.info(f"app-{ulid}-[Exito]-[Inicio de pending_changes.]")
+        IP_DEL_FIREWALL = os.getenv("IP_DEL_FIREWALL")
+        TOKEN_DE_AUTENTICACION = os.getenv("TOKEN_DE_AUTENTICACION")
+
+        vdom = req.params.get('vdom')
+        if not vdom:
+            logging.error(f"app-{ulid}-[Fallo]-[Fallo en el ingreso de Parametros(vdom)]")
+            return func.HttpResponse(
+                json.dumps({"error": "Parametro 'vdom' es requerido"}),
+                status_code=404,
+                mimetype="application/json"
+            )
+        if not valid_vdom(vdom):
+            logging.error(f"app-{ulid}-[Fallo]-[Parametro vdom invalido]")
+            return func.HttpResponse(
+                json.dumps({"error": "Parametro 'vdom' invalido"}),
+                status_code=400,
+                mimetype="application/json"
+            )
+        try:
+            wait = min(max(float(req.params.get('wait') or 0), 0.0), FEED_MAX_WAIT_SECONDS)
+        except ValueError:
+            logging.error(f"app-{ulid}-[Fallo]-[Parametro wait invalido]")
+            return func.HttpResponse(
+                json.dumps({"error": "Parametro 'wait' debe ser un numero de segundos"}),
+                status_code=400,
+                mimetype="application/json"
+            )
+        name_file=f"bloqueos_{vdom}.json"
+        cursor = req.params.get('cursor')
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        while True:
+            changes = await load_pending_changes(name_file, cursor)
+            remaining = deadline - loop.time()
+            if changes["completo"] or changes["pendientes"] or changes["retiradas"] or remaining <= 0:
+                break
+            cursor = changes["cursor"]
+            await asyncio.sleep(min(FEED_POLL_SECONDS, remaining))
+        logging.info(
+            f"app-{ulid}-[Exito]-[Cambios de Tareas Pendientes: {len(changes['pendientes'])} pendientes, "
+            f"{len(changes['retiradas'])} retiradas, completo={changes['completo']}]"
+        )
+        response = {
+            "host": IP_DEL_FIREWALL,
+            "token": TOKEN_DE_AUTENTICACION,
+            "vdom": vdom,
+            "cursor": changes["cursor"],
+            "completo": changes["completo"],
+            "retiradas": changes["retiradas"],
+            "data": changes["pendientes"]
+        }
+        with task_metrics.timer("serializacion.respuesta"):
+            body = json.dumps(response)
+        return func.HttpResponse(
+            body,
+            status_code=200,
+            mimetype="application/json"
+        )
+    except Exception as e:
+        logging.error(f"app-{ulid}-[Fallo]-[Error en pending_changes: {e}]")
+        return func.HttpResponse(
+            json.dumps({"error": str(e)}),
+            status_code=500,
+            mimetype="application/json"
+        )
+
+# ----------------------------
+# Endpoint Claim (reclamo de tareas pendientes)
+# ----------------------------
+@app.route(route="claim", methods=["POST"], auth_level=func.AuthLevel.ANONYMOUS)
+@instrumented("claim")
+async def claim(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Reclama para el ejecutor `owner` hasta `limit` tareas pendientes del vdom,
+    con un lease de `lease` segundos. Cada tarea se entrega a un solo ejecutor;
+    se finaliza con update_status pasando `owner`, y si el lease vence sin
+    finalizarla vuelve a estar pendiente.
+    """
+    ulid = str(ULID())  # Genera un ULID único
+    logging.info(f"app-{ulid}-[Exito]-[Inicio de claim]")
+    try:
+        IP_DEL_FIREWALL = os.getenv("IP_DEL_FIREWALL")
+        TOKEN_DE_AUTENTICACION = os.getenv("TOKEN_DE_AUTENTICACION")
+        vdom = req.params.get('vdom')
+        owner = req.params.get('owner')
+        if not vdom or not owner:
+            logging.error(f"app-{ulid}-[Fallo]-[Fallo en el ingreso de Parametros(vdom, owner)]")
+            return func.HttpResponse(
+                json.dumps({"error": "Parametros 'vdom' y 'owner' son requeridos"}),
+                status_code=400,
+                mimetype="application/json"
+            )
+        if not valid_vdom(vdom):
+            logging.error(f"app-{ulid}-[Fallo]-[Parametro vdom invalido]")
+            return func.HttpResponse(
+                json.dumps({"error": "Parametro 'vdom' invalido"}),
+                status_code=400,
+                mimetype="application/json"
+            )
+        try:
+            limit = min(max(int(req.params.get('limit') or 1), 1), MAX_BATCH_SIZE)
+            lease = req.params.get('lease')
+            lease = min(max(int(lease), 1), CLAIM_MAX_LEASE_SECONDS) if lease else None
+        except ValueError:
+            logging.error(f"app-{ulid}-[Fallo]-[Parametros limit/lease invalidos]")
+            return func.HttpResponse(
+                json.dumps({"error": "Parametros 'limit' y 'lease' deben ser enteros"}),
+                status_code=400,
+                mimetype="application/json"
+            )
+        name_file=f"bloqueos_{vdom}.json"
+        claimed = await claim_tasks(name_file, owner, limit, lease)
+        logging.info(f"app-{ulid}-[Exito]-[{len(claimed)} tareas reclamadas por {owner}]")
+        with task_metrics.timer("serializacion.respuesta"):
+            body = json.dumps({
+                "host": IP_DEL_FIREWALL,
+                "token": TOKEN_DE_AUTENTICACION,
+                "vdom": vdom,
+                "data": claimed
+            })
+        return func.HttpResponse(
+            body,
+            status_code=200,
+            mimetype="application/json"
+        )
+    except Exception as e:
+        logging.error(f"app-{ulid}-[Fallo]-[Error en claim: {e}]")
+        return func.HttpResponse(
+            json.dumps({"error": str(e)}),
+            status_code=500,
+            mimetype="application/json"
+        )
+
+# ----------------------------
+# Endpoint Summary (resumen agregado de vdoms)
+# ----------------------------
+@app.route(route="summary", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+@instrumented("summary")
+async def summary(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Retorna la cantidad de tareas por estado y por tramo de antigüedad de los
+    vdoms indicados en `vdoms` (separados por coma; por defecto, todos), en
+    total y por vdom. Se calcula con los contadores de cada vdom, sin leer registros.
+    """
+    ulid = str(ULID())  # Genera un ULID único
+    logging.info(f"app-{ulid}-[Exito]-[Inicio de summary]")
+    try:
+        vdoms = [vdom.strip() for vdom in (req.params.get('vdoms') or "").split(",") if vdom.strip()]
+        invalid = [vdom for vdom in vdoms if not valid_vdom(vdom)]
+        if invalid:
+            logging.error(f"app-{ulid}-[Fallo]-[Vdoms invalidos: {invalid}]")
+            return func.HttpResponse(
+                json.dumps({"error": f"Vdoms invalidos: {invalid}"}),
+                status_code=400,
+                mimetype="application/json"
+            )
+        names = [f"bloqueos_{vdom}.json" for vdom in vdoms] or None
+        total, summaries = await summarize_tasks(names)
+        failed = [name for name, result in summaries.items() if result is None]
+        if failed:
+            logging.warning(f"app-{ulid}-[Fallo]-[Resumen incompleto, vdoms con error: {failed}]")
+        logging.info(f"app-{ulid}-[Exito]-[Resumen de {len(summaries)} vdoms: {total['total']} tareas]")
+        with task_metrics.timer("serializacion.respuesta"):
+            body = json.dumps({
+                **total,
+                "vdoms": [
+                    {"vdom": name[len("bloqueos_"):-len(".json")], **(result or {"error": "No se pudo resumir el vdom"})}
+                    for name, result in summaries.items()
+                ]
+            })
+        return func.HttpResponse(
+            body,
+            status_code=200,
+            mimetype="application/json"
+        )
+    except Exception as e:
+        logging.error(f"app-{ulid}-[Fallo]-[Error en summary: {e}]")
+        return func.HttpResponse(
+            json.dumps({"error": str(e)}),
+            status_code=500,
+            mimetype="application/json"
+        )
+
+# ----------------------------
+# Endpoint Tickets (tareas de un ticket)
+# ----------------------------
+@app.route(route="tickets/{ticket}", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+@instrumented("tickets")
+async def tickets(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Retorna las tareas de todos los vdoms asociadas a `ticket`, incluidas las
+    deduplicadas en otra tarea y las ya archivadas.
+    """
+    ulid = str(ULID())  # Genera un ULID único
+    logging.info(f"app-{ulid}-[Exito]-[Inicio de tickets]")
+    try:
+        ticket = req.route_params.get("ticket")
+        if not ticket:
+            logging.error(f"app-{ulid}-[Fallo]-[Fallo en el ingreso de Parametros(ticket)]")
+            return func.HttpResponse(
+                json.dumps({"error": "Parámetro 'ticket' es requerido"}),
+                status_code=404,
+                mimetype="application/json"
+            )
+        tasks = await find_tasks_by_ticket(ticket)
+        logging.info(f"app-{ulid}-[Exito]-[{len(tasks)} tareas del ticket {ticket}]")
+        with task_metrics.timer("serializacion.respuesta"):
+            body = json.dumps({"ticket": ticket, "data": tasks})
+        return func.HttpResponse(
+            body,
+            status_code=200,
+            mimetype="application/json"
+        )
+    except Exception as e:
+        logging.error(f"app-{ulid}-[Fallo]-[Error en tickets: {e}]")
+        return func.HttpResponse(
+            json.dumps({"error": str(e)}),
+            status_code=500,
+            mimetype="application/json"
+        )
+
+# ----------------------------
+# Endpoint Metricas (opcional)
+# ----------------------------
+if task_metrics.TASK_METRICS and task_metrics.TASK_METRICS_ROUTE:
+    @app.route(route="metrics", methods=["GET"], auth_level=func.AuthLevel.FUNCTION)
+    async def metrics(req: func.HttpRequest) -> func.HttpResponse:
+        """
+        Retorna los tiempos y contadores acumulados por este proceso y los de la caché.
+        """
+        return func.HttpResponse(
+            json.dumps({**task_metrics.snapshot(), "cache": cache_stats()}),
+            status_code=200,
+            mimetype="application/json"
+        )
+
+# ----------------------------
+# Timer Liberacion de leases vencidos
+# ----------------------------
+@app.timer_trigger(schedule=TASK_CLAIM_RELEASE_SCHEDULE, arg_name="timer", run_on_startup=False, use_monitor=False)
+def liberar_reclamos(timer: func.TimerRequest) -> None:
+    ulid = str(ULID())  # Genera un ULID único
+    try:
+        results = release_all_expired_claims()
+        released = {name: count for name, count in results.items() if count}
+        if released:
+            logging.info(f"app-{ulid}-[Exito]-[Leases vencidos liberados: {released}]")
+    except Exception as e:
+        logging.error(f"app-{ulid}-[Fallo]-[Error en liberar_reclamos: {e}]")
+
+# ----------------------------
+# Timer Compactacion del registro de eventos
+# ----------------------------
+@app.timer_trigger(schedule=TASK_LOG_COMPACT_SCHEDULE, arg_name="timer", run_on_startup=False, use_monitor=False)
+def compactar_eventos(timer: func.TimerRequest) -> None:
+    ulid = str(ULID())  # Genera un ULID único
+    logging.info(f"app-{ulid}-[Exito]-[Inicio de compactar_eventos]")
+    try:
+        results = compact_all_task_logs()
+        logging.info(f"app-{ulid}-[Exito]-[Registros compactados: {results}]")
+    except Exception as e:
+        logging.error(f"app-{ulid}-[Fallo]-[Error en compactar_eventos: {e}]")
+
+# ----------------------------
+# Timer Retencion de tareas terminadas
+# ----------------------------
+@app.timer_trigger(schedule=TASK_RETENTION_SCHEDULE, arg_name="timer", run_on_startup=False, use_monitor=False)
+def retencion_tareas(timer: func.TimerRequest) -> None:
+    ulid = str(ULID())  # Genera un ULID único
+    logging.info(f"app-{ulid}-[Exito]-[Inicio de retencion_tareas]")
+    try:
+        results = archive_all_finished_tasks()
+        logging.info(f"app-{ulid}-[Exito]-[Tareas archivadas: {results}]")
+        purged = task_status_cache.purge_expired()
+        logging.info(f"app-{ulid}-[Exito]-[Estados finales vencidos descartados: {purged}]")
+    except Exception as e:
+        logging.error(f"app-{ulid}-[Fallo]-[Error en retencion_tareas: {e}]")
         
     
 # estados validos 
-# pending, failed, executed
\ No newline at end of file
+# pending, failed, executed (in_progress sólo mediante claim)
\ No newline at end of file
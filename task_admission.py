@@ -0,0 +1,196 @@
+import os
+import math
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+
+import blob_storage_async
+import task_metrics
+
+# Control de admisión de la ingesta (orquestador y orquestador_lote), por proceso:
+# - límites token bucket por vdom y por llamador: cada bloqueo consume un token y
+#   los tokens se reponen a razón constante hasta la ráfaga permitida. Un lote
+#   más grande que la ráfaga se admite si el bucket está lleno y lo deja en
+#   deuda, así que nunca queda rechazado para siempre. Tasa 0 = sin límite.
+# - cola de escritura acotada: los add_task concurrentes de un mismo vdom se
+#   agrupan y se guardan con una sola llamada a add_tasks_deduplicated (un
+#   append de eventos y una escritura condicional de pendientes y duplicados por
+#   tanda) en lugar de una lectura-modificación-escritura por solicitud. Mientras
+#   una tanda se guarda, las que llegan esperan a la siguiente. Con la cola llena
+#   se rechaza en lugar de encolar sin límite.
+# Los rechazos se responden con 429 y Retry-After.
+INGEST_VDOM_RATE = float(os.getenv("INGEST_VDOM_RATE", "0"))
+INGEST_VDOM_BURST = float(os.getenv("INGEST_VDOM_BURST", "100"))
+INGEST_CALLER_RATE = float(os.getenv("INGEST_CALLER_RATE", "0"))
+INGEST_CALLER_BURST = float(os.getenv("INGEST_CALLER_BURST", "50"))
+# Buckets recordados (los menos usados se descartan: al volver empiezan llenos)
+INGEST_MAX_BUCKETS = int(os.getenv("INGEST_MAX_BUCKETS", "10000"))
+# Bloqueos esperando a ser guardados en todo el proceso; 0 desactiva la cola
+INGEST_QUEUE_MAX = int(os.getenv("INGEST_QUEUE_MAX", "1000"))
+# Máximo de bloqueos por tanda
+INGEST_FLUSH_MAX = int(os.getenv("INGEST_FLUSH_MAX", "200"))
+
+
+class QueueFullError(Exception):
+    """
+    La cola de escritura está llena. `retry_after` estima en segundos cuándo volver a intentar.
+    """
+    def __init__(self, retry_after):
+        super().__init__(f"Cola de escritura llena, reintentar en {retry_after} s")
+        self.retry_after = retry_after
+
+
+class _TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst, now):
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, rate, burst, now):
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+    def wait(self, cost, rate, burst):
+        """
+        Segundos hasta poder admitir `cost` tokens (0 si ya se puede).
+        """
+        return max(0.0, (min(cost, burst) - self.tokens) / rate)
+
+
+_lock = threading.Lock()
+# (tipo, clave) -> bucket, en orden de uso
+_buckets = OrderedDict()
+
+
+def _retry_after(seconds):
+    return max(1, math.ceil(seconds))
+
+def _bucket(kind, key, burst, now):
+    bucket = _buckets.get((kind, key))
+    if bucket is None:
+        bucket = _buckets[(kind, key)] = _TokenBucket(burst, now)
+        while len(_buckets) > INGEST_MAX_BUCKETS:
+            _buckets.popitem(last=False)
+    _buckets.move_to_end((kind, key))
+    return bucket
+
+def admit(vdom, caller, cost=1):
+    """
+    Consume `cost` tokens del bucket del vdom y del llamador, sólo si ambos
+    alcanzan. Retorna None si se admite o los segundos (enteros) a esperar
+    para el Retry-After.
+    """
+    limits = [
+        (kind, key, rate, burst)
+        for kind, key, rate, burst in (("vdom", vdom, INGEST_VDOM_RATE, INGEST_VDOM_BURST),
+                                       ("llamador", caller, INGEST_CALLER_RATE, INGEST_CALLER_BURST))
+        if rate > 0
+    ]
+    if not limits:
+        return None
+    with _lock:
+        now = time.monotonic()
+        buckets = []
+        for kind, key, rate, burst in limits:
+            bucket = _bucket(kind, key, burst, now)
+            bucket.refill(rate, burst, now)
+            buckets.append((bucket, rate, burst))
+        wait = max(bucket.wait(cost, rate, burst) for bucket, rate, burst in buckets)
+        if wait > 0:
+            task_metrics.count("admision.limitadas")
+            return _retry_after(wait)
+        for bucket, _, _ in buckets:
+            bucket.tokens -= cost
+    return None
+
+def refund(vdom, caller, cost=1):
+    """
+    Devuelve `cost` tokens a los buckets del vdom y del llamador, por ejemplo
+    cuando un bloqueo ya admitido se rechaza porque la cola está llena.
+    """
+    with _lock:
+        now = time.monotonic()
+        for kind, key, rate, burst in (("vdom", vdom, INGEST_VDOM_RATE, INGEST_VDOM_BURST),
+                                       ("llamador", caller, INGEST_CALLER_RATE, INGEST_CALLER_BURST)):
+            bucket = _buckets.get((kind, key))
+            if rate > 0 and bucket is not None:
+                bucket.refill(rate, burst, now)
+                bucket.tokens = min(burst, bucket.tokens + cost)
+
+def reset():
+    """
+    Descarta los buckets (para pruebas).
+    """
+    with _lock:
+        _buckets.clear()
+
+
+# vdom (archivo de lista) -> [(tarea, future)] esperando la próxima tanda
+_queues = {}
+# vdom -> corrutina que está guardando sus tandas
+_flushers = {}
+# Bloqueos en la cola (en espera o en una tanda en curso)
+_queued = 0
+# Promedio móvil de la duración de una tanda, para estimar el Retry-After
+_flush_seconds = 0.1
+
+
+async def _flush(task_blob_name):
+    """
+    Guarda las tandas del vdom hasta vaciar su cola. Hay una sola corrutina
+    por vdom, así que sus tandas nunca compiten entre sí.
+    """
+    global _queued, _flush_seconds
+    batch = []
+    try:
+        while _queues.get(task_blob_name):
+            waiting = _queues[task_blob_name]
+            batch, _queues[task_blob_name] = waiting[:INGEST_FLUSH_MAX], waiting[INGEST_FLUSH_MAX:]
+            start = time.monotonic()
+            try:
+                stored = await blob_storage_async.add_tasks_deduplicated([task for task, _ in batch], task_blob_name)
+            except Exception as e:
+                logging.error(f"Error al guardar una tanda de {len(batch)} bloqueos en {task_blob_name}: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, stored):
+                    if not future.done():
+                        future.set_result(result)
+            _queued -= len(batch)
+            batch = []
+            _flush_seconds = 0.8 * _flush_seconds + 0.2 * (time.monotonic() - start)
+            task_metrics.count("admision.tandas")
+    finally:
+        # Si la corrutina se cancela, los que esperaban reciben el error en lugar de quedar colgados
+        for _, future in batch + _queues.pop(task_blob_name, []):
+            _queued -= 1
+            if not future.done():
+                future.set_exception(RuntimeError(f"Se interrumpió la cola de escritura de {task_blob_name}"))
+        _flushers.pop(task_blob_name, None)
+
+async def add_task(task, task_blob_name):
+    """
+    Encola `task` para la próxima tanda de su vdom y espera a que se guarde.
+    Retorna (tarea guardada, True si se creó) como add_task_deduplicated.
+    Lanza QueueFullError si la cola está llena. Con INGEST_QUEUE_MAX en 0 la
+    tarea se guarda directamente.
+    """
+    global _queued
+    if INGEST_QUEUE_MAX <= 0:
+        return await blob_storage_async.add_task_deduplicated(task, task_blob_name)
+    if _queued >= INGEST_QUEUE_MAX:
+        task_metrics.count("admision.cola_llena")
+        # Tandas por delante, guardándose en paralelo entre los vdoms activos
+        batches = math.ceil(_queued / INGEST_FLUSH_MAX / max(len(_flushers), 1))
+        raise QueueFullError(_retry_after(batches * _flush_seconds))
+    future = asyncio.get_running_loop().create_future()
+    _queues.setdefault(task_blob_name, []).append((task, future))
+    _queued += 1
+    if task_blob_name not in _flushers:
+        _flushers[task_blob_name] = asyncio.create_task(_flush(task_blob_name))
+    return await future
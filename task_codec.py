@@ -0,0 +1,267 @@
+import os
+import re
+import gzip
+import json
+import zlib
+import codecs
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Formato columnar: las claves de las tareas se guardan una sola vez y cada
+# columna con pocos valores distintos (app, status, vdom, action...) se
+# codifica con diccionario. Los lectores detectan el formato automáticamente,
+# por lo que los blobs antiguos en JSON (incluso con indent=4) siguen cargando.
+COLUMNAR_FORMAT = "tareas-columnar"
+COLUMNAR_VERSION = 1
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# json | columnar
+TASK_ENCODING = os.getenv("TASK_ENCODING", "columnar")
+# none | gzip | zstd
+TASK_COMPRESSION = os.getenv("TASK_COMPRESSION", "none")
+# Colecciones más chicas que esto se guardan como JSON compacto
+COLUMNAR_MIN_ROWS = int(os.getenv("COLUMNAR_MIN_ROWS", "8"))
+# Cuerpos más chicos que esto no se comprimen
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_NUMBER_TAIL = re.compile(r"[0-9.eE+\-]*")
+
+
+def _is_table(value):
+    if isinstance(value, list):
+        return all(isinstance(row, dict) for row in value)
+    if isinstance(value, dict):
+        return all(isinstance(row, dict) for row in value.values())
+    return False
+
+def _encode_column(values):
+    """
+    Codifica una columna con diccionario si tiene pocos valores distintos.
+    Los valores se distinguen también por tipo: True, 1 y 1.0 son iguales
+    para Python pero no para el JSON original.
+    """
+    try:
+        positions = {}
+        for value in values:
+            positions.setdefault((type(value), value), len(positions))
+    except TypeError:
+        return values
+    if len(positions) * 2 > len(values):
+        return values
+    return {"d": [value for _, value in positions], "i": [positions[(type(value), value)] for value in values]}
+
+def _decode_column(column):
+    if isinstance(column, dict):
+        distinct = column["d"]
+        return [distinct[i] for i in column["i"]]
+    return column
+
+def encode_columnar(value):
+    """
+    Convierte una lista de tareas (o un diccionario clave -> tarea) al formato
+    columnar. Las claves ausentes en alguna tarea se registran aparte para
+    reconstruir cada diccionario tal cual.
+    """
+    is_map = isinstance(value, dict)
+    rows = list(value.values()) if is_map else value
+    keys = list(dict.fromkeys(key for row in rows for key in row))
+    missing = {}
+    columns = []
+    for key in keys:
+        column = []
+        for position, row in enumerate(rows):
+            if key in row:
+                column.append(row[key])
+            else:
+                column.append(None)
+                missing.setdefault(key, []).append(position)
+        columns.append(_encode_column(column))
+    document = {"formato": COLUMNAR_FORMAT, "version": COLUMNAR_VERSION, "n": len(rows), "claves": keys, "columnas": columns}
+    if missing:
+        document["ausentes"] = missing
+    if is_map:
+        document["mapa"] = list(value)
+    return document
+
+def decode_columnar(document):
+    """
+    Reconstruye la lista (o el diccionario) original desde el formato columnar.
+    """
+    keys = document["claves"]
+    columns = [_decode_column(column) for column in document["columnas"]]
+    rows = [dict(zip(keys, values)) for values in zip(*columns)] if keys else [{} for _ in range(document["n"])]
+    for key, positions in document.get("ausentes", {}).items():
+        for position in positions:
+            del rows[position][key]
+    if "mapa" in document:
+        return dict(zip(document["mapa"], rows))
+    return rows
+
+def _compress(data, compression):
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("TASK_COMPRESSION=zstd requiere el paquete 'zstandard'")
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return data
+
+def _decompress(data):
+    if data[:2] == GZIP_MAGIC:
+        return gzip.decompress(data)
+    if data[:4] == ZSTD_MAGIC:
+        if zstandard is None:
+            raise ValueError("El blob está comprimido con zstd y falta el paquete 'zstandard'")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+def encode(value, encoding=None, compression=None):
+    """
+    Serializa un valor para guardarlo en Storage. Las colecciones de tareas
+    (también las que están un nivel dentro de un documento) se guardan en
+    formato columnar y, si corresponde, se comprimen.
+    """
+    encoding = encoding or TASK_ENCODING
+    compression = compression or TASK_COMPRESSION
+    if encoding == "columnar":
+        if _is_table(value):
+            if len(value) >= COLUMNAR_MIN_ROWS:
+                value = encode_columnar(value)
+        elif isinstance(value, dict):
+            # Documentos con metadatos (p. ej. snapshots): se codifican sus colecciones de tareas
+            value = {
+                key: encode_columnar(item) if _is_table(item) and len(item) >= COLUMNAR_MIN_ROWS else item
+                for key, item in value.items()
+            }
+    data = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if compression != "none" and len(data) >= COMPRESSION_MIN_BYTES:
+        data = _compress(data, compression)
+    return data
+
+def decode(data):
+    """
+    Deserializa un blob detectando compresión (gzip/zstd) y formato (JSON plano o columnar).
+    """
+    value = json.loads(_decompress(data).decode("utf-8"))
+    if isinstance(value, dict):
+        if value.get("formato") == COLUMNAR_FORMAT:
+            return decode_columnar(value)
+        for key, item in value.items():
+            if isinstance(item, dict) and item.get("formato") == COLUMNAR_FORMAT:
+                value[key] = decode_columnar(item)
+    return value
+
+def _decompressed_chunks(chunks):
+    """
+    Descomprime incrementalmente (gzip/zstd) una secuencia de bloques de bytes.
+    """
+    chunks = iter(chunks)
+    first = b""
+    # Bytes suficientes para reconocer la compresión
+    while len(first) < len(ZSTD_MAGIC):
+        chunk = next(chunks, None)
+        if chunk is None:
+            break
+        first += chunk
+    if first[:2] == GZIP_MAGIC:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif first[:4] == ZSTD_MAGIC:
+        if zstandard is None:
+            raise ValueError("El blob está comprimido con zstd y falta el paquete 'zstandard'")
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+    else:
+        yield first
+        yield from chunks
+        return
+    yield decompressor.decompress(first)
+    for chunk in chunks:
+        yield decompressor.decompress(chunk)
+    if hasattr(decompressor, "flush"):
+        yield decompressor.flush()
+
+def iter_items(chunks):
+    """
+    Parsea incrementalmente un documento JSON (arreglo u objeto, posiblemente
+    comprimido) a partir de bloques de bytes y genera sus elementos (los valores
+    en el caso de un objeto) a medida que se completan, sin armar el documento
+    ni su texto completos: la memoria depende del tamaño de un elemento, no del
+    blob. Los documentos columnares no se pueden recorrer por filas y se
+    decodifican completos.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    source = iter(_decompressed_chunks(chunks))
+    buffer, position = "", 0
+
+    def fill():
+        nonlocal buffer, position
+        for chunk in source:
+            piece = text.decode(chunk)
+            if piece:
+                buffer, position = buffer[position:] + piece, 0
+                return True
+        return False
+
+    def skip():
+        nonlocal position
+        while True:
+            position = _WHITESPACE.match(buffer, position).end()
+            if position < len(buffer) or not fill():
+                return position < len(buffer)
+
+    def value():
+        nonlocal position
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if fill():
+                    continue
+                raise
+            # Un número al final del bloque puede seguir en el siguiente
+            if isinstance(item, (int, float)) and _NUMBER_TAIL.match(buffer, end).end() == len(buffer) and fill():
+                continue
+            position = end
+            return item
+
+    if not skip():
+        raise ValueError("El documento JSON está vacío")
+    opening = buffer[position]
+    if opening not in "[{":
+        yield value()
+        return
+    closing = "]" if opening == "[" else "}"
+    position += 1
+    first = True
+    while True:
+        if not skip():
+            raise ValueError("Documento JSON incompleto")
+        if buffer[position] == closing:
+            return
+        if not first:
+            if buffer[position] != ",":
+                raise ValueError(f"Se esperaba ',' en la posición {position}")
+            position += 1
+            skip()
+        if opening == "{":
+            key = value()
+            skip()
+            if buffer[position] != ":":
+                raise ValueError(f"Se esperaba ':' en la posición {position}")
+            position += 1
+            skip()
+            if first and key == "formato":
+                # Documento columnar: se necesitan todas las columnas para armar las filas
+                rest = buffer[position:] + "".join(text.decode(chunk) for chunk in source) + text.decode(b"", final=True)
+                document = json.loads('{"formato":' + rest)
+                rows = decode_columnar(document) if document.get("formato") == COLUMNAR_FORMAT else document
+                yield from rows.values() if isinstance(rows, dict) else rows
+                return
+        skip()
+        yield value()
+        first = False
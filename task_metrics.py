@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import logging
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager, nullcontext
+
+# Instrumentación del camino caliente: temporizadores (descarga/subida a
+# Storage, serialización, búsquedas), contadores de bytes y de eventos (caché,
+# conflictos). Los valores se acumulan por proceso y, dentro de un endpoint
+# decorado con `instrumented`, también por invocación, para registrarlos como
+# campos estructurados del log. Desactivada (por defecto), `timer` retorna un
+# context manager vacío compartido, `count` retorna de inmediato e
+# `instrumented` deja el handler sin envolver.
+TASK_METRICS = os.getenv("TASK_METRICS", "false").lower() in ("1", "true", "si", "on")
+# Expone además los acumulados del proceso en GET /api/metrics
+TASK_METRICS_ROUTE = os.getenv("TASK_METRICS_ROUTE", "false").lower() in ("1", "true", "si", "on")
+
+_NULL_TIMER = nullcontext()
+_lock = threading.Lock()
+# nombre -> valor acumulado
+_counters = {}
+# nombre -> [cantidad, segundos totales, máximo]
+_timers = {}
+# Campos de la invocación en curso (None fuera de un endpoint instrumentado)
+_request_fields = contextvars.ContextVar("task_metrics_fields", default=None)
+
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def timer(name):
+    """
+    Context manager que mide la duración del bloque bajo `name`.
+    """
+    if not TASK_METRICS:
+        return _NULL_TIMER
+    return _Timer(name)
+
+def record_time(name, seconds):
+    if not TASK_METRICS:
+        return
+    with _lock:
+        entry = _timers.get(name)
+        if entry is None:
+            entry = _timers[name] = [0, 0.0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] = max(entry[2], seconds)
+        # Los hilos de una misma invocación comparten este diccionario
+        fields = _request_fields.get()
+        if fields is not None:
+            key = f"{name}_ms"
+            fields[key] = fields.get(key, 0.0) + seconds * 1000
+
+def count(name, value=1):
+    """
+    Suma `value` al contador `name` (bytes, aciertos de caché, conflictos...).
+    """
+    if not TASK_METRICS:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+        fields = _request_fields.get()
+        if fields is not None:
+            fields[name] = fields.get(name, 0) + value
+
+def snapshot():
+    """
+    Retorna los acumulados del proceso: contadores y, por temporizador, cantidad,
+    tiempo total, promedio y máximo en milisegundos.
+    """
+    with _lock:
+        return {
+            "contadores": dict(_counters),
+            "tiempos": {
+                name: {
+                    "n": n,
+                    "total_ms": round(total * 1000, 3),
+                    "promedio_ms": round(total * 1000 / n, 3) if n else 0.0,
+                    "max_ms": round(maximum * 1000, 3),
+                }
+                for name, (n, total, maximum) in _timers.items()
+            },
+        }
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _timers.clear()
+
+@contextmanager
+def request_scope():
+    """
+    Acumula en un diccionario los tiempos y contadores de la invocación en curso.
+    Las tareas y los hilos lanzados con asyncio.to_thread heredan el contexto; los
+    de un ThreadPoolExecutor no, así que se lanzan con contextvars.copy_context().run
+    (ver blob_storage._map_parallel).
+    """
+    fields = {}
+    token = _request_fields.set(fields)
+    try:
+        yield fields
+    finally:
+        _request_fields.reset(token)
+
+def instrumented(name):
+    """
+    Decorador para handlers async: mide la invocación completa y registra un log
+    con los campos de la invocación. Con TASK_METRICS desactivado no envuelve.
+    """
+    def decorator(handler):
+        if not TASK_METRICS:
+            return handler
+
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            with request_scope() as fields:
+                start = time.perf_counter()
+                try:
+                    return await handler(*args, **kwargs)
+                finally:
+                    record_time(f"endpoint.{name}", time.perf_counter() - start)
+                    logging.info(
+                        f"metricas-{name} {json.dumps({k: round(v, 3) for k, v in fields.items()}, sort_keys=True)}",
+                        extra={"metricas": fields, "endpoint": name}
+                    )
+        return wrapper
+    return decorator
@@ -0,0 +1,118 @@
+import os
+import logging
+import zlib
+from datetime import datetime, timedelta, timezone
+
+import blob_storage
+
+# Retención: las tareas terminadas más antiguas que TASK_RETENTION_DAYS salen del
+# vdom "caliente" y se guardan en segmentos de archivo por día
+# (bloqueos_{vdom}/archivo/{AAAA-MM-DD}.json). Un índice de archivo particionado
+# por hash del tid (archivo/indice/{shard}.json) permite resolverlas en get_status.
+TASK_ARCHIVE_DIR = "archivo"
+FINISHED_STATUSES = ("executed", "failed")
+TASK_RETENTION_DAYS = float(os.getenv("TASK_RETENTION_DAYS", "30"))
+ARCHIVE_INDEX_SHARDS = int(os.getenv("ARCHIVE_INDEX_SHARDS", "64"))
+
+
+def _archive_prefix(task_blob_name):
+    return f"{blob_storage._task_prefix(task_blob_name)}{TASK_ARCHIVE_DIR}/"
+
+def _archive_segment_name(segment, task_blob_name):
+    return f"{_archive_prefix(task_blob_name)}{segment}.json"
+
+def _archive_index_name(tid, task_blob_name):
+    shard = zlib.crc32(tid.encode("utf-8")) % ARCHIVE_INDEX_SHARDS
+    return f"{_archive_prefix(task_blob_name)}indice/{shard:02x}.json"
+
+def _parse_datetime(value):
+    try:
+        moment = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+def _finished_at(task):
+    return _parse_datetime(task.get("updated_at")) or _parse_datetime(task.get("created_at"))
+
+def archive_finished_tasks(task_blob_name, retention_days=None):
+    """
+    Mueve al archivo las tareas terminadas (executed/failed) cuya última
+    actualización es más antigua que `retention_days`. Las tareas se agrupan en
+    segmentos por día de finalización, se registran en el índice de archivo
+    (y su segmento en el índice de tids), se quitan del índice del vdom con un
+    evento "archivada" y se borran sus registros. Es idempotente: si se
+    interrumpe, la siguiente ejecución completa el trabajo. Retorna la cantidad
+    de tareas archivadas.
+    """
+    retention_days = TASK_RETENTION_DAYS if retention_days is None else retention_days
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    index = blob_storage._load_index(task_blob_name)
+    candidates = [
+        tid for tid, entry in index.items()
+        if entry.get("status") in FINISHED_STATUSES
+        and (_parse_datetime(entry.get("created_at")) or cutoff) < cutoff
+    ]
+    tasks = [
+        task for task in blob_storage._read_records(candidates, task_blob_name)
+        if task.get("status") in FINISHED_STATUSES and (_finished_at(task) or cutoff) < cutoff
+    ]
+    if not tasks:
+        return 0
+
+    segments = {}
+    for task in tasks:
+        segments.setdefault(_finished_at(task).strftime("%Y-%m-%d"), {})[task["tid"]] = task
+    for segment, archived in segments.items():
+        blob_storage._update_json(
+            _archive_segment_name(segment, task_blob_name), lambda current: {**current, **archived}, default={}
+        )
+
+    shards = {}
+    for segment, archived in segments.items():
+        for tid in archived:
+            shards.setdefault(_archive_index_name(tid, task_blob_name), {})[tid] = segment
+    for shard, locations in shards.items():
+        blob_storage._update_json(shard, lambda current: {**current, **locations}, default={})
+    for segment, archived in segments.items():
+        blob_storage._write_tid_locations(list(archived), task_blob_name, segmento=segment)
+
+    blob_storage._append_events(task_blob_name, [
+        blob_storage._event("archivada", tid, segmento=segment)
+        for segment, archived in segments.items() for tid in archived
+    ])
+    blob_storage._map_parallel(
+        lambda task: blob_storage._delete_blob(blob_storage._record_blob_name(task["tid"], task_blob_name)), tasks
+    )
+    logging.info(f"Archivadas {len(tasks)} tareas de {task_blob_name} en {len(segments)} segmentos")
+    return len(tasks)
+
+def archive_all_finished_tasks(retention_days=None):
+    """
+    Aplica la retención a todos los vdoms. Pensada para un Timer Trigger.
+    """
+    results = {}
+    for task_blob_name in blob_storage.list_task_blob_names():
+        try:
+            results[task_blob_name] = archive_finished_tasks(task_blob_name, retention_days=retention_days)
+        except Exception as e:
+            logging.error(f"Error aplicando la retención a {task_blob_name}: {e}")
+            results[task_blob_name] = None
+    return results
+
+def get_archived_task(tid, task_blob_name):
+    """
+    Obtiene una tarea archivada por su tid a través del índice de archivo.
+    Retorna None si la tarea no está archivada.
+    """
+    try:
+        locations, _ = blob_storage._fetch_json(_archive_index_name(tid, task_blob_name))
+        segment = (locations or {}).get(tid)
+        if segment is None:
+            return None
+        archived, _ = blob_storage._fetch_json(_archive_segment_name(segment, task_blob_name))
+        task = (archived or {}).get(tid)
+        return None if task is None else dict(task)
+    except Exception as e:
+        logging.warning(f"Error al buscar la tarea archivada {tid} en {task_blob_name}: {e}")
+        return None
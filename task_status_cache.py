@@ -0,0 +1,178 @@
+import os
+import time
+import zlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import blob_storage
+import task_metrics
+
+# Caché de estados finales para get_status (generaliza la de blob.py, que era un
+# solo blob reescrito completo bajo el bloqueo global). Dos niveles:
+# - compartido: estados_finales/{shard}.json particionado por hash del tid,
+#   {tid: {"status", "hasta"}}. Cada finalización reescribe sólo su shard con
+#   escritura condicional y descarta ahí mismo las entradas vencidas, así que
+#   expirar nunca reescribe la caché completa.
+# - en proceso: tid -> estado con TTL corto, de modo que los polls repetidos de
+#   una tarea terminada no hacen ninguna petición a Storage. Los shards también
+#   se leen con ese margen: una tarea que no está en la caché se resuelve con
+#   su registro, así que la consulta de una tarea pendiente no suma peticiones.
+# Un estado final que vuelve a pending se quita de su shard y del nivel en
+# proceso del worker que lo cambia; los demás workers pueden seguir viéndolo
+# hasta FINAL_STATUS_LOCAL_TTL_SECONDS.
+FINAL_STATUS_DIR = "estados_finales"
+FINAL_STATUSES = ("executed", "failed")
+FINAL_STATUS_SHARDS = int(os.getenv("FINAL_STATUS_SHARDS", "64"))
+FINAL_STATUS_TTL_SECONDS = int(os.getenv("FINAL_STATUS_TTL_SECONDS", "1800"))
+FINAL_STATUS_LOCAL_TTL_SECONDS = float(os.getenv("FINAL_STATUS_LOCAL_TTL_SECONDS", "60"))
+FINAL_STATUS_LOCAL_MAX_ENTRIES = int(os.getenv("FINAL_STATUS_LOCAL_MAX_ENTRIES", "10000"))
+
+_local_lock = threading.Lock()
+# tid -> (instante monotónico de expiración, estado), en orden de uso
+_local = OrderedDict()
+# shard -> instante monotónico hasta el que se lo da por inexistente
+_missing_shards = {}
+
+
+def _shard_name(tid):
+    shard = zlib.crc32(tid.encode("utf-8")) % FINAL_STATUS_SHARDS
+    return f"{FINAL_STATUS_DIR}/{shard:02x}.json"
+
+def _live(entries, now):
+    return {tid: entry for tid, entry in entries.items() if datetime.fromisoformat(entry["hasta"]) > now}
+
+def _local_get(tid):
+    with _local_lock:
+        entry = _local.get(tid)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del _local[tid]
+            return None
+        _local.move_to_end(tid)
+        return entry[1]
+
+def _local_put(tid, status):
+    with _local_lock:
+        _local[tid] = (time.monotonic() + FINAL_STATUS_LOCAL_TTL_SECONDS, status)
+        _local.move_to_end(tid)
+        while len(_local) > FINAL_STATUS_LOCAL_MAX_ENTRIES:
+            _local.popitem(last=False)
+
+def _local_discard(tid):
+    with _local_lock:
+        _local.pop(tid, None)
+
+def clear_local():
+    with _local_lock:
+        _local.clear()
+        _missing_shards.clear()
+
+def _shard_missing(shard_name):
+    """
+    True si el shard no existía en una lectura reciente (las lecturas de blobs
+    inexistentes no quedan en la caché de blob_storage).
+    """
+    with _local_lock:
+        return _missing_shards.get(shard_name, 0) > time.monotonic()
+
+def _from_shard(shard, tid):
+    """
+    Busca `tid` en el contenido de un shard y, si sigue vigente, lo guarda en el nivel en proceso.
+    """
+    if shard is None:
+        with _local_lock:
+            _missing_shards[_shard_name(tid)] = time.monotonic() + FINAL_STATUS_LOCAL_TTL_SECONDS
+    entry = (shard or {}).get(tid)
+    if entry is None or datetime.fromisoformat(entry["hasta"]) <= datetime.now(timezone.utc):
+        task_metrics.count("estados_finales.fallos")
+        return None
+    task_metrics.count("estados_finales.compartido")
+    _local_put(tid, entry["status"])
+    return entry["status"]
+
+def get_final_status(tid):
+    """
+    Retorna el estado final cacheado de `tid`, o None si no está en la caché.
+    """
+    status = _local_get(tid)
+    if status is not None:
+        task_metrics.count("estados_finales.local")
+        return status
+    if _shard_missing(_shard_name(tid)):
+        return None
+    shard, _ = blob_storage._fetch_json(_shard_name(tid), FINAL_STATUS_LOCAL_TTL_SECONDS)
+    return _from_shard(shard, tid)
+
+def remember_final_status(tid, status):
+    """
+    Guarda en el nivel en proceso el estado de una tarea leída de su registro, si es final.
+    """
+    if status in FINAL_STATUSES:
+        _local_put(tid, status)
+
+def record_final_statuses(statuses):
+    """
+    Refleja en la caché compartida (y en la de este proceso) los cambios de
+    estado tid -> estado: los finales se agregan con vencimiento
+    FINAL_STATUS_TTL_SECONDS y los demás (o None) se quitan. Escribe sólo los
+    shards afectados, descartando sus entradas vencidas.
+    """
+    shards = {}
+    for tid, status in statuses.items():
+        shards.setdefault(_shard_name(tid), {})[tid] = status
+        with _local_lock:
+            _missing_shards.pop(_shard_name(tid), None)
+        if status in FINAL_STATUSES:
+            _local_put(tid, status)
+        else:
+            _local_discard(tid)
+
+    def write(shard_name, changes):
+        def apply(current):
+            now = datetime.now(timezone.utc)
+            live = _live(current, now)
+            until = (now + timedelta(seconds=FINAL_STATUS_TTL_SECONDS)).isoformat()
+            for tid, status in changes.items():
+                if status in FINAL_STATUSES:
+                    live[tid] = {"status": status, "hasta": until}
+                else:
+                    live.pop(tid, None)
+            return None if live == current else live
+        blob_storage._update_json(shard_name, apply, default={})
+
+    for shard_name, changes in shards.items():
+        write(shard_name, changes)
+
+def load_final_statuses():
+    """
+    Retorna todas las entradas vigentes de la caché compartida: tid -> {"status", "hasta"}.
+    """
+    now = datetime.now(timezone.utc)
+    entries = {}
+    for blob in blob_storage.get_container_client().list_blobs(name_starts_with=f"{FINAL_STATUS_DIR}/"):
+        shard, _ = blob_storage._fetch_json(blob.name)
+        entries.update(_live(shard or {}, now))
+    return entries
+
+def purge_expired():
+    """
+    Descarta las entradas vencidas de los shards que las tengan (los demás no
+    se reescriben). Retorna la cantidad de entradas descartadas.
+    """
+    removed = 0
+    for blob in blob_storage.get_container_client().list_blobs(name_starts_with=f"{FINAL_STATUS_DIR}/"):
+        dropped = []
+
+        def prune(current):
+            live = _live(current, datetime.now(timezone.utc))
+            dropped[:] = [len(current) - len(live)]
+            return live if dropped[0] else None
+
+        blob_storage._update_json(blob.name, prune, default={})
+        removed += dropped[0] if dropped else 0
+    if removed:
+        logging.info(f"Descartadas {removed} entradas vencidas de la caché de estados finales")
+    return removed